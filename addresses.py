@@ -3,7 +3,7 @@
 
 import json
 import os
-from utils import ADDRESSES_FILE, select_option, detect_address_type, EXCHANGES, get_exchange_base
+from utils import ADDRESSES_FILE, select_option, detect_address_type, get_exchanges, get_exchange_base, get_account
 
 
 class AddressError(Exception):
@@ -99,7 +99,8 @@ def manage_addresses(exchange: str = None, user_id: str = None):
         # 过滤当前交易所的地址
         if exchange_base:
             filtered = [a for a in addresses if a.get('exchange') == exchange_base]
-            exchange_name = dict(EXCHANGES).get(exchange, exchange.upper())
+            record = get_account(exchange)
+            exchange_name = record.display if record else exchange.upper()
             if user_name:
                 title = f"📋 {user_name} - {exchange_name} 地址簿"
             else:
@@ -148,7 +149,7 @@ def _add_address(addresses: list, default_exchange: str = None, user_id: str = N
     """添加新地址"""
     # 选择交易所
     print("\n选择地址绑定的交易所:")
-    exchange_bases = list(set(get_exchange_base(k) for k, _ in EXCHANGES))
+    exchange_bases = list(set(get_exchange_base(k) for k, _ in get_exchanges()))
     exchange_names = {"binance": "Binance", "bybit": "Bybit", "gate": "Gate.io", "bitget": "Bitget"}
     exchange_options = [exchange_names.get(e, e) for e in exchange_bases]
 
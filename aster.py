@@ -2,6 +2,7 @@
 """Aster 交易所专用功能"""
 
 from utils import run_on_ec2, select_option, get_exchange_display_name, input_amount, SSHError
+from ec2_schema import MACHINE_ENV, render
 
 
 def show_aster_margin_ratio(exchange: str = "aster"):
@@ -36,8 +37,8 @@ def do_aster_transfer(exchange: str):
     # 显示账户余额
     print(f"\n正在查询账户余额...")
     try:
-        output = run_on_ec2(f"balance {exchange}")
-        print(output)
+        output = run_on_ec2(f"balance {exchange}", env=MACHINE_ENV)
+        print(render(output))
     except SSHError as e:
         print(f"❌ 查询余额失败: {e}")
 
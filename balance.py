@@ -3,50 +3,23 @@
 
 import json
 import subprocess
-import requests
-from utils import (run_on_ec2, select_option, select_exchange, get_exchange_base,
+from utils import (run_on_ec2, run_on_ec2_many, select_option, select_exchange, get_exchange_base,
                    get_exchange_display_name, get_user_accounts, get_ec2_exchange_key,
-                   load_config, SSHError, get_ssh_config, run_bybit_api_script)
+                   load_config, SSHError, get_ssh_config, run_bybit_api_script, run_parallel)
+from prices import get_price, get_prices
+import snapshot_cache
+from ec2_schema import (MACHINE_ENV, SchemaError, balance_of, balances as ec2_balances, decode_amount,
+                        decode_output, fetch_records, fetch_wallet_snapshot, is_envelope, render,
+                        positions as ec2_positions, snapshot_cmd)
 
-# 稳定币列表，价格视为 1 USD
-STABLECOINS = ['USDT', 'USDC', 'USD1', 'BUSD', 'TUSD', 'FDUSD']
 
 # 最小显示价值 (USD)
 MIN_DISPLAY_VALUE = 10
 
 
 def get_coin_price(coin: str) -> float:
-    """获取币种对 USDT 的价格，稳定币返回 1"""
-    coin = coin.upper()
-    if coin in STABLECOINS:
-        return 1.0
-
-    try:
-        # 尝试 COIN/USDT 交易对
-        resp = requests.get(
-            f"https://api.binance.com/api/v3/ticker/price?symbol={coin}USDT",
-            timeout=5
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            return float(data.get('price', 0))
-
-        # 尝试 COIN/BUSD
-        resp = requests.get(
-            f"https://api.binance.com/api/v3/ticker/price?symbol={coin}BUSD",
-            timeout=5
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            return float(data.get('price', 0))
-    except requests.exceptions.Timeout:
-        print(f"⚠️  获取 {coin} 价格超时")
-    except requests.exceptions.ConnectionError:
-        print(f"⚠️  获取 {coin} 价格失败: 网络连接错误")
-    except (KeyError, ValueError) as e:
-        print(f"⚠️  解析 {coin} 价格失败: {e}")
-
-    return 0.0
+    """获取币种对 USDT 的价格，稳定币返回 1 (走批量价格表缓存，不逐币请求)"""
+    return get_price(coin)
 
 
 def filter_by_value(balances: dict, min_value: float = MIN_DISPLAY_VALUE) -> dict:
@@ -54,10 +27,11 @@ def filter_by_value(balances: dict, min_value: float = MIN_DISPLAY_VALUE) -> dic
     if not isinstance(balances, dict):
         return {}
     result = {}
+    prices = get_prices(balances.keys())
     for coin, amount in balances.items():
         try:
             amount_float = float(amount)
-            price = get_coin_price(coin)
+            price = prices[coin.upper()]
             value = amount_float * price
             if value >= min_value:
                 result[coin] = amount_float
@@ -66,8 +40,27 @@ def filter_by_value(balances: dict, min_value: float = MIN_DISPLAY_VALUE) -> dic
     return result
 
 
+def _fetch_balance_view(exchange: str) -> dict:
+    """查询余额页面的数据: {"output": balance 输出, "unified": Bybit 统一账户快照, "unified_error"}"""
+    # Bybit 额外取统一账户快照，与 balance 一起一次往返
+    cmds = [f"balance {exchange}"]
+    if get_exchange_base(exchange) == "bybit":
+        cmds.append(snapshot_cmd(exchange))
+    results = run_on_ec2_many(cmds, env=MACHINE_ENV)
+    if results[0]["error"]:
+        raise SSHError(results[0]["error"])
+
+    view = {"output": results[0]["output"], "unified": None, "unified_error": None}
+    if len(results) > 1:
+        try:
+            view["unified"] = fetch_wallet_snapshot(exchange, result=results[1])
+        except (SSHError, SchemaError) as e:
+            view["unified_error"] = str(e)
+    return view
+
+
 def show_balance(exchange: str = None):
-    """查询余额"""
+    """查询余额 (几秒内查过时先显示缓存，后台刷新)"""
     if not exchange:
         exchange = select_exchange()
         if not exchange:
@@ -78,39 +71,43 @@ def show_balance(exchange: str = None):
 
     print(f"\n正在查询 {display_name} 余额...")
 
-    # EC2 上的 balance 命令已经格式化好输出，直接显示
-    output = run_on_ec2(f"balance {exchange}")
-
-    # 移除 EC2 返回的 "正在查询..." 行，避免重复显示
-    lines = output.strip().split('\n')
-    for line in lines:
-        if '正在查询' not in line:
-            print(line)
-
-    # Bybit 额外查询统一账户
+    try:
+        cached = snapshot_cache.get(exchange, "balance", lambda: _fetch_balance_view(exchange))
+    except SSHError as e:
+        print(f"❌ 查询余额失败: {e}")
+        return
+    view = cached.value
+    age = snapshot_cache.format_age(cached)
+    if age:
+        print(age)
+
+    output = view["output"]
+    if is_envelope(output):
+        # 机器模式: 本地格式化显示
+        print(render(output))
+    else:
+        # 远端未支持机器模式: 显示 EC2 格式化好的文本，移除 "正在查询..." 行避免重复显示
+        lines = output.strip().split('\n')
+        for line in lines:
+            if '正在查询' not in line:
+                print(line)
+
+    # Bybit 额外显示统一账户
     if exchange_base == "bybit":
         print("\n" + "=" * 50)
         print("📦 统一账户余额 (UNIFIED):")
         print("=" * 50)
-        # 查询常用币种的统一账户余额
-        unified_coins = ["USDT", "USDC", "BTC", "ETH"]
-        has_balance = False
-        for coin in unified_coins:
-            try:
-                bal_output = run_on_ec2(f"account_balance {exchange} UNIFIED {coin}")
-                bal_output = bal_output.strip()
-                if bal_output:
-                    bal = float(bal_output)
-                    if bal > 0:
-                        has_balance = True
-                        print(f"  {coin}: {bal:.4f}")
-            except SSHError as e:
-                print(f"  ⚠️ 查询 {coin} 失败: {e}")
-            except ValueError:
-                print(f"  ⚠️ {coin} 返回异常值: '{bal_output}'")
-        if not has_balance:
+        snapshot = view["unified"]
+        if snapshot is None:
+            print(f"  ⚠️ 查询统一账户失败: {view['unified_error']}")
+            return
+        for error in snapshot.errors:
+            print(f"  ⚠️ 查询失败: {error}")
+        unified = snapshot.wallet("UNIFIED")
+        for coin, bal in sorted(unified.items()):
+            print(f"  {coin}: {bal:.4f}")
+        if not unified:
             print("  统一账户暂无余额")
-    
 
 
 def show_pm_ratio(exchange: str = None):
@@ -258,32 +255,6 @@ def show_gate_subaccounts():
             print(line)
 
 
-def _parse_balance_from_output(output: str, coin: str) -> str:
-    """从 balance 命令输出中解析指定币种余额"""
-    coin_upper = coin.upper()
-    for line in output.split('\n'):
-        line_upper = line.upper()
-        if line_upper.startswith(coin_upper + '\t') or line_upper.startswith(coin_upper + ' '):
-            parts = line.split()
-            if len(parts) >= 2:
-                raw = parts[1].strip()
-                try:
-                    return str(_parse_number(raw))
-                except ValueError:
-                    pass
-            break
-    return "0"
-
-
-def _parse_number(s: str) -> float:
-    """解析数字字符串，支持 K/M/B 后缀和逗号"""
-    s = s.strip().replace(",", "")
-    suffixes = {"K": 1e3, "M": 1e6, "B": 1e9}
-    if s and s[-1].upper() in suffixes:
-        return float(s[:-1]) * suffixes[s[-1].upper()]
-    return float(s)
-
-
 def show_position_analysis(exchange: str = None):
     """持仓分析 - 显示永续合约持仓金额、浮盈亏、距离平仓线"""
     if not exchange:
@@ -294,20 +265,17 @@ def show_position_analysis(exchange: str = None):
     display_name = get_exchange_display_name(exchange)
     print(f"\n正在分析 {display_name} 永续合约持仓...")
 
-    # 获取永续合约持仓
+    # 获取永续合约持仓 (与平仓菜单共用缓存)
+    from trade import fetch_um_positions
     try:
-        output = run_on_ec2(f"portfolio_um_positions {exchange}")
-        positions = json.loads(output.strip())
-
-        if isinstance(positions, dict) and "msg" in positions:
-            print(f"API 错误: {positions.get('msg')}")
-            return
-    except json.JSONDecodeError:
-        print("解析持仓数据失败")
-        return
+        cached = snapshot_cache.get(exchange, "um_positions", lambda: fetch_um_positions(exchange))
     except SSHError as e:
         print(f"获取持仓失败: {e}")
         return
+    positions = cached.value
+    age = snapshot_cache.format_age(cached)
+    if age:
+        print(age)
 
     # 过滤有持仓的
     active_positions = []
@@ -473,12 +441,10 @@ def get_coin_balance(exchange: str, coin: str, account_type: str = "SPOT") -> st
                 return "0"
             else:
                 # 资金账户
-                output = run_on_ec2(f"balance {exchange}")
-                return _parse_balance_from_output(output, coin)
+                return str(balance_of(fetch_records(f"balance {exchange}"), coin, wallet="funding"))
 
         elif exchange_base in ("gate", "bitget"):
-            output = run_on_ec2(f"balance {exchange}")
-            return _parse_balance_from_output(output, coin)
+            return str(balance_of(fetch_records(f"balance {exchange}"), coin))
 
         elif exchange_base == "okx":
             # OKX: TRADING (交易账户) / FUNDING (资金账户)
@@ -500,13 +466,73 @@ def get_coin_balance(exchange: str, coin: str, account_type: str = "SPOT") -> st
                     pass
             return "0"
 
-    except SSHError as e:
+    except (SSHError, SchemaError) as e:
         print(f"❌ 查询余额失败: {e}")
         return "0"
 
 
+def _query_stable_balance(user_id: str, account_id: str) -> float:
+    """查询单个交易所账号的 USDT 余额 (失败抛出异常)"""
+    ec2_exchange = get_ec2_exchange_key(user_id, account_id)
+    exchange_base = get_exchange_base(ec2_exchange)
+
+    # Hyperliquid 使用本地查询
+    if exchange_base == "hyperliquid":
+        from hyperliquid_ops import get_hyperliquid_config
+        from hyperliquid_client import fetch_account_state
+        wallet_address, _ = get_hyperliquid_config(ec2_exchange)
+        user_state = fetch_account_state(wallet_address, spot=False, mids=False)["user_state"]
+        return float(user_state.get("withdrawable", 0))
+
+    # Lighter 使用本地查询
+    if exchange_base == "lighter":
+        from lighter_ops import get_lighter_config
+        from lighter_session import get_lighter_session
+        wallet_address, _, _ = get_lighter_config(ec2_exchange)
+        account_info = get_lighter_session().get_account_info(wallet_address)
+        usdt = 0.0
+        if account_info and account_info.accounts:
+            for acc in account_info.accounts:
+                if acc.account_type == 0:
+                    usdt = float(acc.available_balance) if acc.available_balance else 0
+                    break
+        return usdt
+
+    # 通过 EC2 查询
+    if exchange_base == "bybit":
+        # Bybit 统一账户和资金账户 USDT，一次往返
+        unified_result, fund_result = run_on_ec2_many([
+            f"account_balance {ec2_exchange} UNIFIED USDT",
+            f"balance {ec2_exchange}",
+        ], env=MACHINE_ENV)
+        try:
+            usdt = decode_amount(unified_result["output"], "USDT")
+        except (ValueError, SSHError):
+            usdt = 0.0
+        usdt += balance_of(decode_output(fund_result["output"]), "USDT", wallet="funding")
+    elif exchange_base in ("gate", "bitget"):
+        usdt = balance_of(fetch_records(f"balance {ec2_exchange}"), "USDT")
+    elif exchange_base == "aster":
+        # Aster - 合约账户和现货的 USDT 合计
+        records = fetch_records(f"balance {ec2_exchange}")
+        usdt = sum(b.free for b in ec2_balances(records) if b.asset == "USDT" and b.wallet in ("futures", "spot"))
+    else:
+        # Binance 等 - 只统计现货 (SPOT)，不含理财和统一账户
+        output = run_on_ec2(f"account_balance {ec2_exchange} SPOT USDT").strip()
+        try:
+            usdt = float(output)
+        except ValueError:
+            usdt = 0.0
+
+    return usdt
+
+
 def show_multi_exchange_balance(user_id: str):
-    """查询用户所有交易所的稳定币余额汇总 (USDT/USD1/USDC)"""
+    """查询用户所有交易所的稳定币余额汇总 (USDT/USD1/USDC)
+
+    所有账号的余额和合约持仓同时并发查询，余额按返回顺序实时显示，
+    总耗时取决于最慢的交易所。
+    """
     config = load_config()
     user_name = config.get("users", {}).get(user_id, {}).get("name", user_id)
     accounts = get_user_accounts(user_id)
@@ -520,223 +546,110 @@ def show_multi_exchange_balance(user_id: str):
     print(f"  {user_name} - 多交易所稳定币余额")
     print(f"{'=' * 55}")
 
-    total_usdt = 0.0
-    results = []
-
-    for account_id, exchange_name in accounts:
-        ec2_exchange = get_ec2_exchange_key(user_id, account_id)
-        exchange_base = get_exchange_base(ec2_exchange)
+    names = dict(accounts)
+    totals = {"usdt": 0.0}
+    position_results = {}
 
-        # Hyperliquid 使用本地查询
-        if exchange_base == "hyperliquid":
-            try:
-                from hyperliquid_ops import get_hyperliquid_config
-                from hyperliquid.info import Info
-                from hyperliquid.utils import constants
-                wallet_address, _ = get_hyperliquid_config()
-                info = Info(constants.MAINNET_API_URL, skip_ws=True)
-                user_state = info.user_state(wallet_address)
-                usdt = float(user_state.get("withdrawable", 0))
-                results.append((exchange_name, usdt, None))
-                total_usdt += usdt
-            except Exception as e:
-                results.append((exchange_name, None, str(e)))
-            continue
-
-        # Lighter 使用本地查询
-        if exchange_base == "lighter":
-            try:
-                import asyncio
-                from lighter_ops import get_lighter_config, _get_account_info
-                wallet_address, _, _ = get_lighter_config(ec2_exchange)
-                account_info = asyncio.run(_get_account_info(wallet_address))
-                usdt = 0.0
-                if account_info and account_info.accounts:
-                    for acc in account_info.accounts:
-                        if acc.account_type == 0:
-                            usdt = float(acc.available_balance) if acc.available_balance else 0
-                            break
-                results.append((exchange_name, usdt, None))
-                total_usdt += usdt
-            except Exception as e:
-                results.append((exchange_name, None, str(e)))
-            continue
-
-        # 通过 EC2 查询
-        try:
-            if exchange_base == "bybit":
-                # Bybit 统一账户查 USDT
-                output = run_on_ec2(f"account_balance {ec2_exchange} UNIFIED USDT").strip()
-                try:
-                    usdt = float(output)
-                except ValueError:
-                    usdt = 0.0
-                # 再查资金账户
-                fund_output = run_on_ec2(f"balance {ec2_exchange}")
-                fund_usdt = float(_parse_balance_from_output(fund_output, "USDT"))
-                usdt += fund_usdt
-            elif exchange_base in ("gate", "bitget"):
-                output = run_on_ec2(f"balance {ec2_exchange}")
-                usdt = float(_parse_balance_from_output(output, "USDT"))
-            elif exchange_base == "aster":
-                # Aster - 从 balance 输出解析合约账户和现货的 USDT
-                output = run_on_ec2(f"balance {ec2_exchange}")
-                usdt = 0.0
-                for line in output.split('\n'):
-                    parts = line.split()
-                    # 合约账户格式: "USDT      余额:      64937.7085  可提:   45445.7974"
-                    if len(parts) >= 2 and parts[0] == "USDT" and "余额:" in line:
-                        for j, p in enumerate(parts):
-                            if p == "余额:" and j + 1 < len(parts):
-                                try:
-                                    usdt += float(parts[j + 1])
-                                except ValueError:
-                                    pass
-                    # 现货格式: "USDT     可用:      1000.0  冻结:     0.0"
-                    elif len(parts) >= 2 and parts[0] == "USDT" and "可用:" in line:
-                        for j, p in enumerate(parts):
-                            if p == "可用:" and j + 1 < len(parts):
-                                try:
-                                    usdt += float(parts[j + 1])
-                                except ValueError:
-                                    pass
-            else:
-                # Binance 等 - 查现货和理财
-                output = run_on_ec2(f"account_balance {ec2_exchange} SPOT USDT").strip()
-                try:
-                    usdt = float(output)
-                except ValueError:
-                    usdt = 0.0
-                # Binance 只统计现货 (SPOT)，不含理财和统一账户
-
-            results.append((exchange_name, usdt, None))
-            total_usdt += usdt
-
-        except SSHError as e:
-            results.append((exchange_name, None, str(e)))
-
-    # 显示结果
-    for exchange_name, usdt, error in results:
+    def on_result(key, usdt, error):
+        kind, account_id = key
+        if kind == "positions":
+            position_results[account_id] = (usdt, error)
+            return
+        exchange_name = names[account_id]
         if error:
             print(f"  {exchange_name:<18} ⚠️  查询失败: {error}")
         elif usdt is not None:
             print(f"  {exchange_name:<18} {usdt:>14,.2f} USDT")
+            totals["usdt"] += usdt
         else:
             print(f"  {exchange_name:<18} ⚠️  未知错误")
 
+    tasks = []
+    for account_id, _ in accounts:
+        tasks.append((("balance", account_id), lambda a=account_id: _query_stable_balance(user_id, a)))
+        tasks.append((("positions", account_id), lambda a=account_id: _query_account_positions(user_id, a)))
+    run_parallel(tasks, on_result=on_result)
+
     print(f"{'─' * 55}")
-    print(f"  {'合计':<18} {total_usdt:>14,.2f} USDT")
+    print(f"  {'合计':<18} {totals['usdt']:>14,.2f} USDT")
     print(f"{'=' * 55}")
 
-    # 查询合约持仓分布
-    _show_position_distribution(user_id, accounts)
-
-
-def _show_position_distribution(user_id: str, accounts: list):
-    """查询并展示用户所有交易所的合约持仓分布"""
-    config = load_config()
-    user_name = config.get("users", {}).get(user_id, {}).get("name", user_id)
-
-    all_positions = []  # [(symbol, notional, quantity), ...]
-
-    print(f"\n正在查询合约持仓...")
-
-    for account_id, exchange_name in accounts:
-        ec2_exchange = get_ec2_exchange_key(user_id, account_id)
-        exchange_base = get_exchange_base(ec2_exchange)
-
-        # Binance - 通过 EC2 查询 portfolio_um_positions
-        if exchange_base == "binance":
-            try:
-                output = run_on_ec2(f"portfolio_um_positions {ec2_exchange}")
-                positions = json.loads(output.strip())
-                if isinstance(positions, list):
-                    for p in positions:
-                        amt = float(p.get("positionAmt", 0))
-                        if amt == 0:
+    # 展示合约持仓分布 (已与余额一起并发查询)
+    positions = []
+    for account_id, _ in accounts:
+        result, error = position_results.get(account_id, (None, None))
+        if result:
+            positions.extend(result)
+    _show_position_distribution(user_id, accounts, positions)
+
+
+def _query_account_positions(user_id: str, account_id: str) -> list:
+    """查询单个交易所账号的合约持仓，返回 [(symbol, notional, quantity), ...]"""
+    ec2_exchange = get_ec2_exchange_key(user_id, account_id)
+    exchange_base = get_exchange_base(ec2_exchange)
+    positions = []
+
+    # Binance - 通过 EC2 查询 portfolio_um_positions
+    if exchange_base == "binance":
+        output = run_on_ec2(f"portfolio_um_positions {ec2_exchange}")
+        data = json.loads(output.strip())
+        if isinstance(data, list):
+            for p in data:
+                amt = float(p.get("positionAmt", 0))
+                if amt == 0:
+                    continue
+                symbol = p.get("symbol", "").replace("USDT", "")
+                mark = float(p.get("markPrice", 0))
+                notional = abs(amt * mark)
+                positions.append((symbol, notional, abs(amt)))
+
+    # Hyperliquid - 本地查询
+    elif exchange_base == "hyperliquid":
+        from hyperliquid_ops import get_hyperliquid_config
+        from hyperliquid_client import fetch_account_state
+        wallet_address, _ = get_hyperliquid_config(ec2_exchange)
+        state = fetch_account_state(wallet_address, spot=False)
+        user_state, all_mids = state["user_state"], state["all_mids"]
+        for pos in user_state.get("assetPositions", []):
+            position = pos.get("position", {})
+            szi = float(position.get("szi", 0))
+            if szi == 0:
+                continue
+            coin = position.get("coin", "")
+            current_px = float(all_mids.get(coin, 0))
+            notional = abs(szi * current_px)
+            positions.append((coin, notional, abs(szi)))
+
+    # Lighter - 本地查询
+    elif exchange_base == "lighter":
+        from lighter_ops import get_lighter_config
+        from lighter_session import get_lighter_session
+        wallet_address, _, _ = get_lighter_config(ec2_exchange)
+        account_info = get_lighter_session().get_account_info(wallet_address)
+        if account_info and account_info.accounts:
+            for acc in account_info.accounts:
+                if acc.account_type == 0 and acc.positions:
+                    for pos in acc.positions:
+                        size = float(pos.position) if hasattr(pos, 'position') and pos.position else 0
+                        if size == 0:
                             continue
-                        symbol = p.get("symbol", "").replace("USDT", "")
-                        mark = float(p.get("markPrice", 0))
-                        notional = abs(amt * mark)
-                        all_positions.append((symbol, notional, abs(amt)))
-            except (json.JSONDecodeError, SSHError):
-                pass
-
-        # Hyperliquid - 本地查询
-        elif exchange_base == "hyperliquid":
-            try:
-                from hyperliquid_ops import get_hyperliquid_config
-                from hyperliquid.info import Info
-                from hyperliquid.utils import constants
-                wallet_address, _ = get_hyperliquid_config()
-                info = Info(constants.MAINNET_API_URL, skip_ws=True)
-                user_state = info.user_state(wallet_address)
-                all_mids = info.all_mids()
-                for pos in user_state.get("assetPositions", []):
-                    position = pos.get("position", {})
-                    szi = float(position.get("szi", 0))
-                    if szi == 0:
-                        continue
-                    coin = position.get("coin", "")
-                    current_px = float(all_mids.get(coin, 0))
-                    notional = abs(szi * current_px)
-                    all_positions.append((coin, notional, abs(szi)))
-            except Exception:
-                pass
-
-        # Lighter - 本地查询
-        elif exchange_base == "lighter":
-            try:
-                import asyncio
-                from lighter_ops import get_lighter_config, _get_account_info
-                wallet_address, _, _ = get_lighter_config(ec2_exchange)
-                account_info = asyncio.run(_get_account_info(wallet_address))
-                if account_info and account_info.accounts:
-                    for acc in account_info.accounts:
-                        if acc.account_type == 0 and acc.positions:
-                            for pos in acc.positions:
-                                size = float(pos.position) if hasattr(pos, 'position') and pos.position else 0
-                                if size == 0:
-                                    continue
-                                symbol = pos.symbol if hasattr(pos, 'symbol') else "?"
-                                # 去掉 _USDT 后缀
-                                symbol = symbol.replace("_USDT", "").replace("USDT", "")
-                                pv = float(pos.position_value) if hasattr(pos, 'position_value') and pos.position_value else 0
-                                all_positions.append((symbol, abs(pv), abs(size)))
-                            break
-            except Exception:
-                pass
-
-        # Aster - 从 balance 输出解析持仓
-        elif exchange_base == "aster":
-            try:
-                output = run_on_ec2(f"balance {ec2_exchange}")
-                for line in output.split('\n'):
-                    parts = line.split()
-                    # 格式: "ASTERUSDT  SHORT  数量:191176.0000  杠杆:3x"
-                    if len(parts) >= 3 and parts[1] in ("LONG", "SHORT") and parts[2].startswith("数量:"):
-                        symbol = parts[0].replace("USDT", "")
-                        amt = abs(float(parts[2].split(":")[1]))
-                        # 下一行有标记价: "开仓:0.5946  标记:0.6965 ..."
-                        # 从同一输出中查找
-                        lines = output.split('\n')
-                        idx = lines.index(line)
-                        if idx + 1 < len(lines):
-                            next_line = lines[idx + 1]
-                            for part in next_line.split():
-                                if part.startswith("标记:"):
-                                    mark = float(part.split(":")[1])
-                                    notional = amt * mark
-                                    all_positions.append((symbol, notional, amt))
-                                    break
-            except (SSHError, ValueError):
-                pass
-
-        # Bybit - 通过 EC2 出口 IP 调用 V5 API 查询持仓
-        elif exchange_base == "bybit":
-            try:
-                from funding import _BYBIT_SIGNED_GET_SCRIPT
-                script = _BYBIT_SIGNED_GET_SCRIPT + r"""
+                        symbol = pos.symbol if hasattr(pos, 'symbol') else "?"
+                        # 去掉 _USDT 后缀
+                        symbol = symbol.replace("_USDT", "").replace("USDT", "")
+                        pv = float(pos.position_value) if hasattr(pos, 'position_value') and pos.position_value else 0
+                        positions.append((symbol, abs(pv), abs(size)))
+                    break
+
+    # Aster - 从 balance 输出解析持仓
+    elif exchange_base == "aster":
+        for pos in ec2_positions(fetch_records(f"balance {ec2_exchange}")):
+            if pos.mark_price:
+                positions.append((pos.symbol.replace("USDT", ""), pos.size * pos.mark_price, pos.size))
+
+    # Bybit - 通过 EC2 出口 IP 调用 V5 API 查询持仓
+    elif exchange_base == "bybit":
+        from funding import _BYBIT_SIGNED_GET_SCRIPT
+        script = _BYBIT_SIGNED_GET_SCRIPT + r"""
 positions = []
 cursor = ""
 for _ in range(10):
@@ -761,13 +674,32 @@ for _ in range(10):
         break
 print(json.dumps(positions))
 """
-                output = run_bybit_api_script(ec2_exchange, script)
-                if output:
-                    bybit_positions = json.loads(output)
-                    for p in bybit_positions:
-                        all_positions.append((p["symbol"], p["notional"], p.get("qty", 0)))
-            except Exception:
-                pass
+        output = run_bybit_api_script(ec2_exchange, script)
+        if output:
+            for p in json.loads(output):
+                positions.append((p["symbol"], p["notional"], p.get("qty", 0)))
+
+    return positions
+
+
+def _show_position_distribution(user_id: str, accounts: list, all_positions: list = None):
+    """查询并展示用户所有交易所的合约持仓分布
+
+    Args:
+        all_positions: 已查询好的 [(symbol, notional, quantity), ...]，为 None 时并发查询
+    """
+    config = load_config()
+    user_name = config.get("users", {}).get(user_id, {}).get("name", user_id)
+
+    if all_positions is None:
+        print(f"\n正在查询合约持仓...")
+        all_positions = []
+        tasks = [(account_id, lambda a=account_id: _query_account_positions(user_id, a))
+                 for account_id, _ in accounts]
+        for _, positions, error in run_parallel(tasks):
+            # 单个交易所查询失败不影响整体展示
+            if positions:
+                all_positions.extend(positions)
 
     if not all_positions:
         print("\n没有合约持仓")
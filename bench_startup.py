@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""启动耗时基准 - 测量从启动 main.py 到显示第一个菜单的时间，超过阈值时失败
+
+用法:
+    python bench_startup.py                  # 默认 5 次取中位数，阈值 200ms
+    python bench_startup.py --runs 10 --threshold-ms 150
+
+同时检查启动后没有加载重量级 SDK (hyperliquid / eth_account / lighter / requests / numpy)，
+这些依赖应在首次使用对应功能时才导入 (见 main.py 的 _lazy)。
+退出码: 0 通过 / 1 超过阈值或启动时加载了重量级依赖
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 默认阈值 (毫秒) 和测量次数
+DEFAULT_THRESHOLD_MS = 200
+DEFAULT_RUNS = 5
+
+# 首屏输出的标记: 用户选择菜单，或未配置用户时的提示
+FIRST_MENU_MARKERS = ("请选择用户:", "没有配置任何用户")
+
+# 启动时不应加载的重量级依赖
+HEAVY_MODULES = ("hyperliquid", "eth_account", "lighter", "requests", "numpy", "websocket")
+
+# 单次测量的超时 (秒)
+RUN_TIMEOUT = 30
+
+
+def measure_first_menu() -> float:
+    """启动一次 main.py，返回显示第一个菜单的耗时 (秒)"""
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "main.py")], cwd=BASE_DIR, env=env,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True)
+    output = []
+    try:
+        for line in proc.stdout:
+            output.append(line)
+            if any(marker in line for marker in FIRST_MENU_MARKERS):
+                return time.perf_counter() - started
+            if time.perf_counter() - started > RUN_TIMEOUT:
+                break
+    finally:
+        proc.kill()
+        proc.wait()
+    raise RuntimeError("未检测到首屏菜单输出:\n" + "".join(output[-20:]))
+
+
+def loaded_heavy_modules() -> list:
+    """导入 main 后已加载的重量级依赖"""
+    code = ("import sys, main; "
+            f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True,
+                            timeout=RUN_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 main 失败:\n{result.stderr}")
+    return result.stdout.split()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="main.py 启动耗时基准")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="测量次数 (取中位数)")
+    parser.add_argument("--threshold-ms", type=float, default=DEFAULT_THRESHOLD_MS, help="首屏耗时阈值 (毫秒)")
+    args = parser.parse_args()
+
+    ok = True
+    heavy = loaded_heavy_modules()
+    if heavy:
+        print(f"❌ 启动时加载了重量级依赖: {', '.join(heavy)}")
+        ok = False
+    else:
+        print("✅ 启动时未加载重量级依赖")
+
+    timings = [measure_first_menu() * 1000 for _ in range(max(args.runs, 1))]
+    median = statistics.median(timings)
+    detail = " / ".join(f"{t:.0f}" for t in timings)
+    if median > args.threshold_ms:
+        print(f"❌ 首屏耗时 {median:.0f}ms 超过阈值 {args.threshold_ms:.0f}ms (各次: {detail})")
+        ok = False
+    else:
+        print(f"✅ 首屏耗时 {median:.0f}ms (阈值 {args.threshold_ms:.0f}ms，各次: {detail})")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
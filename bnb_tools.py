@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """BNB 工具 - 抵扣开关、小额资产转换、市价买入"""
 
-from utils import run_on_ec2, select_option, select_exchange, input_amount, get_exchange_display_name, SSHError
+from utils import run_on_ec2, run_on_ec2_many, select_option, select_exchange, input_amount, get_exchange_display_name, SSHError
+from ec2_schema import MACHINE_ENV, SchemaError, balance_of, decode_output, fetch_wallet_snapshot, snapshot_cmd
 
 
 def toggle_bnb_burn(exchange: str = None):
@@ -93,21 +94,23 @@ def query_bnb_balance(exchange: str = None):
     print(f"\n正在查询 {display_name} BNB 持仓...")
 
     try:
-        # 查询现货账户 BNB
-        spot_bnb = run_on_ec2(f"account_balance {exchange} SPOT BNB").strip()
-
-        # 查询统一账户 BNB
-        unified_bnb = run_on_ec2(f"account_balance {exchange} UNIFIED BNB").strip()
-
-        # 查询理财持仓 BNB
-        earn_bnb = run_on_ec2(f"account_balance {exchange} EARN BNB").strip()
-
-        # 查询 BNB 当前价格
-        price_output = run_on_ec2(f"bnb_price {exchange} USDT").strip()
-    except SSHError as e:
+        # 钱包快照 (现货 / 统一账户 / 理财持仓) 和当前价格，一次往返查询
+        snapshot_result, price_result = run_on_ec2_many([
+            snapshot_cmd(exchange),
+            f"bnb_price {exchange} USDT",
+        ], env=[MACHINE_ENV, None])
+        if price_result["error"]:
+            raise SSHError(price_result["error"])
+        snapshot = fetch_wallet_snapshot(exchange, coins=["BNB"], result=snapshot_result)
+    except (SSHError, SchemaError) as e:
         print(f"❌ 查询 BNB 持仓失败: {e}")
         return
 
+    if snapshot.errors:
+        print(f"❌ 查询 BNB 持仓失败: {snapshot.errors[0]}")
+        return
+    price_output = price_result["output"].strip()
+
     bnb_price = 0.0
     if "价格:" in price_output:
         try:
@@ -116,13 +119,10 @@ def query_bnb_balance(exchange: str = None):
             pass
 
     # 计算总量和价值
-    try:
-        spot_val = float(spot_bnb) if spot_bnb and spot_bnb != "0" else 0
-        unified_val = float(unified_bnb) if unified_bnb and unified_bnb != "0" else 0
-        earn_val = float(earn_bnb) if earn_bnb and earn_bnb != "0" else 0
-        total = spot_val + unified_val + earn_val
-    except ValueError:
-        spot_val = unified_val = earn_val = total = 0
+    spot_val = snapshot.get("BNB", "SPOT")
+    unified_val = snapshot.get("BNB", "UNIFIED")
+    earn_val = snapshot.get("BNB", "EARN")
+    total = spot_val + unified_val + earn_val
 
     print("\n" + "=" * 50)
     print(f"💎 {display_name} BNB 持仓")
@@ -147,28 +147,28 @@ def quick_buy_bnb_usdt(exchange: str = None):
     # 查询 USDT 余额和 BNB 价格
     print(f"\n正在查询...")
     try:
-        output = run_on_ec2(f"balance {exchange}")
+        balance_result, price_result = run_on_ec2_many([
+            f"balance {exchange}",
+            f"bnb_price {exchange} USDT",
+        ], env=[MACHINE_ENV, None])
     except SSHError as e:
         print(f"❌ 查询余额失败: {e}")
         return
-
-    # 解析 USDT 余额
-    usdt_balance = "0"
-    for line in output.split('\n'):
-        if line.upper().startswith("USDT"):
-            parts = line.split()
-            if len(parts) >= 2:
-                usdt_balance = parts[1]
-                break
-
-    # 查询 BNB 价格
+    if balance_result["error"]:
+        print(f"❌ 查询余额失败: {balance_result['error']}")
+        return
     try:
-        price_output = run_on_ec2(f"bnb_price {exchange} USDT")
-        print(f"💰 USDT 可用: {usdt_balance}")
-        print(price_output)
-    except SSHError as e:
-        print(f"❌ 查询 BNB 价格失败: {e}")
+        usdt_balance = balance_of(decode_output(balance_result["output"]), "USDT")
+    except (SSHError, SchemaError) as e:
+        print(f"❌ 查询余额失败: {e}")
+        return
+
+    # BNB 价格
+    if price_result["error"]:
+        print(f"❌ 查询 BNB 价格失败: {price_result['error']}")
         return
+    print(f"💰 USDT 可用: {usdt_balance}")
+    print(price_result["output"])
 
     # 直接输入金额
     amount = input_amount("请输入 USDT 金额 (小额即可):")
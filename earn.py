@@ -3,6 +3,7 @@
 
 from utils import run_on_ec2, select_option, select_exchange, get_exchange_display_name, get_exchange_base, input_amount, SSHError
 from balance import get_coin_balance, get_coin_price
+from ec2_schema import SchemaError, fetch_records, balances as ec2_balances
 
 # 显示余额的最小价值阈值
 SPOT_MIN_VALUE = 20
@@ -12,43 +13,19 @@ def show_spot_balances(exchange: str):
     """显示现货余额 (≥20U)"""
     print(f"\n正在查询现货余额...")
     try:
-        output = run_on_ec2(f"balance {exchange}")
-    except SSHError as e:
+        records = fetch_records(f"balance {exchange}")
+    except (SSHError, SchemaError) as e:
         print(f"❌ 查询余额失败: {e}")
         return
 
-    # 只解析现货账户部分（在"📦 现货账户余额"和下一个"=="之间）
+    # 只统计现货账户
     balances = []
-    in_spot_section = False
-
-    for line in output.strip().split('\n'):
-        # 检测进入现货账户部分
-        if '现货账户余额' in line or 'SPOT' in line.upper() and '📦' in line:
-            in_spot_section = True
-            continue
-
-        # 检测离开现货账户部分（遇到下一个账户标题）
-        if in_spot_section and ('📊' in line or '💰' in line or '统一账户' in line or '理财持仓' in line):
-            break
-
-        # 跳过标题行和分隔线
-        if not in_spot_section or '正在查询' in line or '===' in line or '---' in line or '币种' in line:
-            continue
-
-        if not line.strip():
+    for b in ec2_balances(records):
+        if b.wallet != "spot":
             continue
-
-        parts = line.split()
-        if len(parts) >= 2:
-            try:
-                coin = parts[0].upper()
-                amount = float(parts[1])
-                price = get_coin_price(coin)
-                value = amount * price
-                if value >= SPOT_MIN_VALUE:
-                    balances.append((coin, amount, value))
-            except (ValueError, IndexError):
-                continue
+        value = b.free * get_coin_price(b.asset)
+        if value >= SPOT_MIN_VALUE:
+            balances.append((b.asset, b.free, value))
 
     if balances:
         # 按市值降序排列
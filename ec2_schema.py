@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""EC2 命令机器模式 - 带版本号的 JSON 记录及本地解码
+
+run.sh 的 balance 等命令默认输出给人看的文本，本地各处再用 split/正则从文本里
+抠数字。机器模式下 (环境变量 EC2_OUTPUT_FORMAT=json) 命令改为输出一个 JSON 信封:
+
+    {"schema": 1, "records": [
+        {"type": "balance", "asset": "USDT", "free": "100.5", "locked": "0", "wallet": "spot"},
+        {"type": "position", "symbol": "ASTERUSDT", "side": "SHORT", "size": "191176", "mark_price": "0.6965"}
+    ]}
+
+本地一次 json 解码得到 Balance / Position 对象，显示格式也在本地生成。远端命令
+尚未支持机器模式时仍输出文本，decode_output 自动回退到文本解析，调用方无需区分。
+
+wallet 取值: spot 现货 / funding 资金 / unified 统一账户 / earn 理财 / trading 交易账户 /
+futures 合约；文本回退时按输出中的分区标题推断，无法判断时为空字符串。
+
+wallet_snapshot 命令一次返回账户全部钱包的全部非零币种，WalletSnapshot 在本地回答
+"某币种在某账户有多少" 之类的问题，替代按币种、按账户逐条 account_balance 查询。
+"""
+
+import json
+import re
+import time
+from typing import NamedTuple
+
+from utils import run_on_ec2, run_on_ec2_many, get_exchange_base, SSHError
+
+# 本地支持的最高 schema 版本
+SCHEMA_VERSION = 1
+
+# 请求机器模式输出的环境变量
+MACHINE_ENV = {"EC2_OUTPUT_FORMAT": "json", "EC2_SCHEMA_VERSION": str(SCHEMA_VERSION)}
+
+
+class SchemaError(ValueError):
+    """机器模式输出无法解码 (版本不支持或记录格式错误)"""
+
+
+class Balance(NamedTuple):
+    """单个币种的余额记录"""
+    asset: str
+    free: float
+    locked: float = 0.0
+    wallet: str = ""
+
+    @property
+    def total(self) -> float:
+        return self.free + self.locked
+
+
+class Position(NamedTuple):
+    """合约持仓记录 (size 为绝对数量，方向见 side)"""
+    symbol: str
+    side: str
+    size: float
+    mark_price: float = 0.0
+    entry_price: float = 0.0
+
+
+def _balance_from_json(rec: dict) -> Balance:
+    return Balance(
+        asset=str(rec["asset"]).upper(),
+        free=float(rec.get("free", 0)),
+        locked=float(rec.get("locked", 0)),
+        wallet=rec.get("wallet", ""),
+    )
+
+
+def _position_from_json(rec: dict) -> Position:
+    return Position(
+        symbol=str(rec["symbol"]).upper(),
+        side=str(rec.get("side", "")).upper(),
+        size=abs(float(rec.get("size", 0))),
+        mark_price=float(rec.get("mark_price", 0)),
+        entry_price=float(rec.get("entry_price", 0)),
+    )
+
+
+# 记录类型 -> 解码函数，未知类型直接跳过 (远端新增类型不影响旧客户端)
+RECORD_TYPES = {
+    "balance": _balance_from_json,
+    "position": _position_from_json,
+}
+
+
+# ===================== 解码 =====================
+
+def is_envelope(output: str) -> bool:
+    """输出是否为机器模式 JSON 信封"""
+    text = output.strip()
+    if not text.startswith("{"):
+        return False
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and "schema" in data
+
+
+def decode_envelope(output: str) -> list:
+    """解码机器模式输出为记录对象列表
+
+    Raises:
+        SSHError: 远端命令返回错误 {"schema": 1, "error": "..."}
+        SchemaError: 版本不支持或记录格式错误
+    """
+    data = json.loads(output.strip())
+    version = data.get("schema")
+    if not isinstance(version, int) or version > SCHEMA_VERSION:
+        raise SchemaError(f"不支持的 schema 版本: {version} (本地最高 {SCHEMA_VERSION})")
+    if data.get("error"):
+        raise SSHError(data["error"])
+    records = []
+    for rec in data.get("records", []):
+        decoder = RECORD_TYPES.get(rec.get("type"))
+        if decoder is None:
+            continue
+        try:
+            records.append(decoder(rec))
+        except (KeyError, TypeError, ValueError) as e:
+            raise SchemaError(f"记录格式错误 {rec}: {e}")
+    return records
+
+
+def decode_output(output: str) -> list:
+    """解码命令输出: 机器模式 JSON 一次解码，文本输出回退到 parse_text"""
+    if is_envelope(output):
+        return decode_envelope(output)
+    return parse_text(output)
+
+
+def fetch_records(cmd: str) -> list:
+    """以机器模式执行一条命令并解码"""
+    return decode_output(run_on_ec2(cmd, env=MACHINE_ENV))
+
+
+def fetch_records_many(cmds: list) -> list:
+    """以机器模式批量执行命令 (一次往返)
+
+    Returns:
+        与 cmds 对应的 [{"records", "error"}]
+    """
+    results = []
+    for r in run_on_ec2_many(cmds, env=MACHINE_ENV):
+        if r["error"]:
+            results.append({"records": [], "error": r["error"]})
+            continue
+        try:
+            results.append({"records": decode_output(r["output"]), "error": None})
+        except (SSHError, SchemaError) as e:
+            results.append({"records": [], "error": str(e)})
+    return results
+
+
+# ===================== 查询 =====================
+
+def balances(records: list, wallet: str = None) -> list:
+    """筛选余额记录；wallet 未知 (文本回退) 的记录视为匹配任意钱包"""
+    return [r for r in records if isinstance(r, Balance) and (wallet is None or r.wallet in (wallet, ""))]
+
+
+def positions(records: list) -> list:
+    return [r for r in records if isinstance(r, Position)]
+
+
+def balance_of(records: list, asset: str, wallet: str = None) -> float:
+    """指定币种的可用余额 (取第一条匹配记录)，没有时返回 0"""
+    asset = asset.upper()
+    for r in balances(records, wallet):
+        if r.asset == asset:
+            return r.free
+    return 0.0
+
+
+def decode_amount(output: str, asset: str, wallet: str = None) -> float:
+    """解码单个数量的命令输出 (如 account_balance)
+
+    机器模式取对应币种的余额记录，文本输出按数字解析 (无法解析时抛出 ValueError)
+    """
+    if is_envelope(output):
+        return balance_of(decode_envelope(output), asset, wallet)
+    return float(output.strip())
+
+
+# ===================== 钱包快照 =====================
+
+# 账户类型 (account_balance / transfer 参数) -> wallet
+ACCOUNT_WALLETS = {
+    "SPOT": "spot",
+    "MAIN": "spot",
+    "FUND": "funding",
+    "FUNDING": "funding",
+    "UNIFIED": "unified",
+    "PM": "unified",
+    "PORTFOLIO_MARGIN": "unified",
+    "EARN": "earn",
+    "TRADING": "trading",
+}
+
+# 远端不支持 wallet_snapshot 时的回退: 逐币 account_balance 查询的账户类型
+SNAPSHOT_FALLBACK_ACCOUNTS = {
+    "binance": ("SPOT", "PM", "EARN"),
+    "bybit": ("UNIFIED",),
+    "okx": ("TRADING", "FUNDING"),
+}
+
+# 回退时 balance 命令已覆盖的交易所 -> 该命令查询的钱包 (文本输出无法区分钱包，按此归属)
+SNAPSHOT_FALLBACK_BALANCE = {
+    "bybit": "funding",
+    "gate": "spot",
+    "bitget": "spot",
+}
+
+# 回退时默认查询的币种
+SNAPSHOT_DEFAULT_COINS = ("USDT", "USDC", "BTC", "ETH")
+
+
+def wallet_of(account_type: str) -> str:
+    """账户类型转换为 wallet 名称"""
+    return ACCOUNT_WALLETS.get(account_type.upper(), account_type.lower())
+
+
+class WalletSnapshot:
+    """单个账户全部钱包余额的快照，按币种/按钱包的查询都在本地完成"""
+
+    def __init__(self, exchange: str, records: list, errors: list = None, queried: list = None):
+        self.exchange = exchange
+        self.records = [r for r in balances(records) if r.total > 0]
+        self.errors = errors or []
+        self.queried = queried  # 回退逐币查询时查过的币种，None 表示快照包含全部币种
+        self.fetched_at = time.time()
+
+    def covers(self, coin: str) -> bool:
+        """快照是否包含该币种的余额 (回退查询只包含查过的币种)"""
+        return self.queried is None or coin.upper() in self.queried
+
+    def _of_wallet(self, account_type: str) -> list:
+        """指定账户的记录 (只匹配钱包完全一致的记录，钱包未知的记录不参与按账户查询)"""
+        wallet = wallet_of(account_type)
+        return [r for r in self.records if r.wallet == wallet]
+
+    def get(self, coin: str, account_type: str = "SPOT") -> float:
+        """指定币种在指定账户的可用余额，没有时返回 0"""
+        return balance_of(self._of_wallet(account_type), coin)
+
+    def wallet(self, account_type: str) -> dict:
+        """指定账户的全部非零余额 {币种: 可用数量}"""
+        result = {}
+        for r in self._of_wallet(account_type):
+            result.setdefault(r.asset, r.free)
+        return result
+
+    def coins(self) -> list:
+        """快照中出现的全部币种"""
+        return sorted({r.asset for r in self.records})
+
+    def total(self, coin: str) -> float:
+        """指定币种在全部钱包的合计 (含冻结)"""
+        coin = coin.upper()
+        return sum(r.total for r in self.records if r.asset == coin)
+
+
+def snapshot_cmd(exchange: str) -> str:
+    """wallet_snapshot 命令 (需以 MACHINE_ENV 执行)，可与其它命令放在同一批次"""
+    return f"wallet_snapshot {exchange}"
+
+
+def _fallback_snapshot(exchange: str, coins) -> WalletSnapshot:
+    """远端不支持 wallet_snapshot: 原有的 balance / account_balance 命令合并为一次批量往返"""
+    exchange_base = get_exchange_base(exchange)
+    coins = [c.upper() for c in (coins or SNAPSHOT_DEFAULT_COINS)]
+    per_coin = [(account_type, coin)
+                for account_type in SNAPSHOT_FALLBACK_ACCOUNTS.get(exchange_base, ())
+                for coin in coins]
+    cmds = [f"account_balance {exchange} {account_type} {coin}" for account_type, coin in per_coin]
+    balance_wallet = SNAPSHOT_FALLBACK_BALANCE.get(exchange_base)
+    if balance_wallet:
+        cmds.append(f"balance {exchange}")
+
+    records, errors = [], []
+    results = run_on_ec2_many(cmds, env=MACHINE_ENV)
+    for (account_type, coin), result in zip(per_coin, results):
+        output = result["output"].strip()
+        if result["error"]:
+            errors.append(f"{account_type} {coin}: {result['error']}")
+            continue
+        if not output or output.startswith(("用法", "未知", "错误")):
+            continue
+        try:
+            amount = decode_amount(output, coin, wallet_of(account_type))
+        except (ValueError, SSHError) as e:
+            errors.append(f"{account_type} {coin}: {e}")
+            continue
+        records.append(Balance(coin, amount, 0.0, wallet_of(account_type)))
+    for result in results[len(per_coin):]:
+        if result["error"]:
+            errors.append(result["error"])
+            continue
+        try:
+            # 文本输出解析的记录没有钱包信息，归属到 balance 命令实际查询的钱包
+            records.extend(r._replace(wallet=balance_wallet) if isinstance(r, Balance) and not r.wallet else r
+                           for r in decode_output(result["output"]))
+        except (SchemaError, SSHError) as e:
+            errors.append(str(e))
+    return WalletSnapshot(exchange, records, errors, queried=coins)
+
+
+def fetch_wallet_snapshot(exchange: str, coins=None, result: dict = None) -> WalletSnapshot:
+    """获取账户全部钱包余额快照
+
+    Args:
+        exchange: 交易所
+        coins: 远端不支持 wallet_snapshot 时回退逐币查询的币种 (默认 USDT/USDC/BTC/ETH)
+        result: 已与其它命令一起批量取回的 snapshot_cmd 结果，省去一次往返
+
+    Raises:
+        SSHError: 连接失败或远端返回错误
+        SchemaError: 快照格式错误
+    """
+    if result is None:
+        result = run_on_ec2_many([snapshot_cmd(exchange)], env=MACHINE_ENV)[0]
+    if not result["error"] and is_envelope(result["output"]):
+        return WalletSnapshot(exchange, decode_envelope(result["output"]))
+    return _fallback_snapshot(exchange, coins)
+
+
+# ===================== 显示 =====================
+
+WALLET_NAMES = {
+    "spot": "现货账户",
+    "funding": "资金账户",
+    "unified": "统一账户",
+    "earn": "理财持仓",
+    "trading": "交易账户",
+    "futures": "合约账户",
+    "": "账户余额",
+}
+
+
+def format_records(records: list) -> str:
+    """余额和持仓记录格式化为终端显示文本 (按钱包分组)"""
+    lines = []
+    groups = {}
+    for r in balances(records):
+        groups.setdefault(r.wallet, []).append(r)
+    for wallet, items in groups.items():
+        lines.append(f"\n📦 {WALLET_NAMES.get(wallet, wallet)}:")
+        lines.append(f"  {'币种':<8} {'可用':>16} {'冻结':>16}")  # 中文标题按双倍宽度对齐
+        for r in sorted(items, key=lambda b: b.asset):
+            lines.append(f"  {r.asset:<10} {r.free:>18,.4f} {r.locked:>18,.4f}")
+    pos = positions(records)
+    if pos:
+        lines.append("\n📊 合约持仓:")
+        for p in pos:
+            mark = f"  标记:{p.mark_price:g}" if p.mark_price else ""
+            lines.append(f"  {p.symbol:<14} {p.side:<5} 数量:{p.size:g}{mark}")
+    return "\n".join(lines) if lines else "暂无余额"
+
+
+def render(output: str) -> str:
+    """命令输出转换为显示文本: 机器模式本地格式化，文本输出原样返回"""
+    if not is_envelope(output):
+        return output
+    try:
+        return format_records(decode_envelope(output))
+    except (SchemaError, SSHError) as e:
+        return f"❌ {e}"
+
+
+# ===================== 文本回退 =====================
+
+# 分区标题关键字 -> wallet
+_SECTION_KEYWORDS = (
+    ("现货", "spot"), ("SPOT", "spot"),
+    ("资金", "funding"), ("FUND", "funding"),
+    ("统一", "unified"), ("UNIFIED", "unified"),
+    ("理财", "earn"), ("EARN", "earn"),
+    ("合约", "futures"), ("FUTURES", "futures"),
+)
+_SECTION_MARKERS = ("📦", "📊", "💰")
+_ASSET_RE = re.compile(r"[A-Za-z0-9]+:?")
+_INLINE_RE = re.compile(r"([A-Za-z0-9]+):(\S+)")
+
+
+def _parse_number(s: str) -> float:
+    """解析数字字符串，支持 K/M/B 后缀和逗号"""
+    s = s.strip().replace(",", "")
+    suffixes = {"K": 1e3, "M": 1e6, "B": 1e9}
+    if s and s[-1].upper() in suffixes:
+        return float(s[:-1]) * suffixes[s[-1].upper()]
+    return float(s)
+
+
+def _token_value(parts: list, label: str):
+    """形如 "可用: 1000.0" 的标签后面的数值，没有时返回 None"""
+    for j, p in enumerate(parts):
+        if p == label and j + 1 < len(parts):
+            try:
+                return _parse_number(parts[j + 1])
+            except ValueError:
+                return None
+    return None
+
+
+def _section_of(line: str):
+    """分区标题行返回对应 wallet，普通行返回 None"""
+    upper = line.upper()
+    is_header = any(m in line for m in _SECTION_MARKERS) or (
+        not any(ch.isdigit() for ch in line) and any(k in upper for k, _ in _SECTION_KEYWORDS))
+    if not is_header:
+        return None
+    for keyword, wallet in _SECTION_KEYWORDS:
+        if keyword in upper:
+            return wallet
+    return ""
+
+
+def parse_text(output: str) -> list:
+    """解析 balance 等命令的文本输出 (远端未支持机器模式时的回退)
+
+    支持的行格式:
+        USDT    100.5                          (COIN 数量)
+        USDT: 100.5 / USDT:100.5               (COIN: 数量)
+        USDT  可用: 1000.0  冻结: 0.0            (Aster 现货)
+        USDT  余额: 64937.7  可提: 45445.8       (Aster 合约账户)
+        ASTERUSDT  SHORT  数量:191176.0  杠杆:3x (Aster 持仓，下一行 "开仓:... 标记:...")
+    """
+    records = []
+    wallet = ""
+    lines = output.split("\n")
+    for idx, line in enumerate(lines):
+        section = _section_of(line)
+        if section is not None:
+            wallet = section
+            continue
+        parts = line.split()
+        inline = _INLINE_RE.fullmatch(parts[0]) if parts else None
+        if inline:
+            # "USDT:100.5" 形式
+            parts = [inline.group(1)] + [inline.group(2)] + parts[1:]
+        if len(parts) < 2 or not _ASSET_RE.fullmatch(parts[0]):
+            continue
+        asset = parts[0].rstrip(":").upper()
+
+        if len(parts) >= 3 and parts[1] in ("LONG", "SHORT") and parts[2].startswith("数量:"):
+            try:
+                size = abs(float(parts[2].split(":", 1)[1]))
+            except ValueError:
+                continue
+            mark = entry = 0.0
+            if idx + 1 < len(lines):
+                for part in lines[idx + 1].split():
+                    try:
+                        if part.startswith("标记:"):
+                            mark = float(part.split(":", 1)[1])
+                        elif part.startswith("开仓:"):
+                            entry = float(part.split(":", 1)[1])
+                    except ValueError:
+                        pass
+            records.append(Position(asset, parts[1], size, mark, entry))
+            continue
+
+        if "余额:" in parts:
+            free = _token_value(parts, "余额:")
+            if free is not None:
+                records.append(Balance(asset, free, 0.0, "futures"))
+            continue
+        if "可用:" in parts:
+            free = _token_value(parts, "可用:")
+            if free is not None:
+                records.append(Balance(asset, free, _token_value(parts, "冻结:") or 0.0, wallet or "spot"))
+            continue
+
+        try:
+            free = _parse_number(parts[1])
+        except ValueError:
+            continue
+        records.append(Balance(asset, free, 0.0, wallet))
+    return records
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""EC2 常驻 worker - 通过 ControlMaster 启动一次，之后用 JSON 帧收发命令
+
+本地只启动一个 ssh 进程，远端运行 _WORKER_SCRIPT，双方通过 stdin/stdout
+交换一行一个 JSON 帧的请求/响应，每条命令只需一次网络往返。
+"""
+
+import asyncio
+import atexit
+import hashlib
+import json
+import shlex
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from utils import SSHError, build_ssh_command, ensure_ssh_connection
+
+# 等待 worker 启动的超时 (秒)
+WORKER_START_TIMEOUT = 30
+
+# 远端 worker 脚本 (仅依赖标准库)
+_WORKER_SCRIPT = r"""
+import hashlib, json, os, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+_out = sys.stdout
+SCRIPT_DIR = os.path.expanduser("~/.ec2_worker_scripts")
+_known_scripts = set()
+
+_reply_lock = threading.Lock()
+
+def reply(msg):
+    data = json.dumps(msg) + "\n"
+    with _reply_lock:
+        _out.write(data)
+        _out.flush()
+
+def load_script(digest, source):
+    # 按内容哈希缓存脚本源码到磁盘，worker 重启后无需重新上传；返回脚本路径
+    path = os.path.join(SCRIPT_DIR, digest + ".py")
+    if digest in _known_scripts:
+        return path
+    if source is None:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+    if hashlib.sha256(source.encode("utf-8")).hexdigest() != digest:
+        raise ValueError("script hash mismatch")
+    if not os.path.exists(path):
+        os.makedirs(SCRIPT_DIR, exist_ok=True)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(source)
+        os.replace(tmp, path)
+    _known_scripts.add(digest)
+    return path
+
+# 脚本在独立进程中运行 (超时可终止)，参数经 stdin 传入，不出现在进程命令行中
+_SCRIPT_BOOTSTRAP = (
+    "import json, runpy, sys; path = sys.argv[1]; "
+    "sys.argv = [path] + json.loads(sys.stdin.readline()); "
+    "runpy.run_path(path, run_name='__main__')"
+)
+
+def run_script(path, argv, timeout):
+    started = time.time()
+    try:
+        p = subprocess.run([sys.executable, "-c", _SCRIPT_BOOTSTRAP, path],
+                           input=json.dumps([str(a) for a in argv]) + "\n",
+                           capture_output=True, text=True, timeout=timeout)
+        return {"stdout": p.stdout, "stderr": p.stderr, "returncode": p.returncode,
+                "elapsed": time.time() - started}
+    except subprocess.TimeoutExpired as e:
+        return {"stdout": _text(e.stdout), "stderr": _text(e.stderr), "returncode": -1,
+                "elapsed": time.time() - started, "timeout": True}
+
+def _text(data):
+    if isinstance(data, bytes):
+        return data.decode("utf-8", "replace")
+    return data or ""
+
+def run_cmd(cmd, timeout, env=None):
+    started = time.time()
+    try:
+        # env: 额外环境变量，如机器模式 EC2_OUTPUT_FORMAT=json
+        p = subprocess.run(["bash", "-c", "./run.sh " + cmd], capture_output=True, text=True, timeout=timeout,
+                           env=dict(os.environ, **env) if env else None)
+        return {"stdout": p.stdout, "stderr": p.stderr, "returncode": p.returncode,
+                "elapsed": time.time() - started}
+    except subprocess.TimeoutExpired as e:
+        return {"stdout": _text(e.stdout), "stderr": _text(e.stderr), "returncode": -1,
+                "elapsed": time.time() - started, "timeout": True}
+
+def handle(req):
+    rid = req.get("id")
+    op = req.get("op")
+    try:
+        if op == "run":
+            result = run_cmd(req["cmd"], req.get("timeout", 120), req.get("env"))
+            result.update({"id": rid, "ok": True})
+            reply(result)
+        elif op == "batch":
+            cmds = req.get("cmds", [])
+            timeout = req.get("timeout", 120)
+            # envs: 每条命令各自的环境变量 (与 cmds 对应)，未提供时全部使用 env
+            envs = req.get("envs") or [req.get("env")] * len(cmds)
+            with ThreadPoolExecutor(max_workers=max(1, min(8, len(cmds)))) as batch_pool:
+                results = list(batch_pool.map(lambda ce: run_cmd(ce[0], timeout, ce[1]), zip(cmds, envs)))
+            reply({"id": rid, "ok": True, "results": results})
+        elif op == "script_run":
+            path = load_script(req["hash"], req.get("source"))
+            if path is None:
+                reply({"id": rid, "ok": False, "missing": True})
+            else:
+                result = run_script(path, req.get("argv", []), req.get("timeout", 60))
+                result.update({"id": rid, "ok": True})
+                reply(result)
+        else:
+            reply({"id": rid, "ok": False, "error": "unknown op: %s" % op})
+    except Exception as e:
+        reply({"id": rid, "ok": False, "error": str(e)})
+
+# 请求并发处理，响应按 id 匹配，可乱序返回
+pool = ThreadPoolExecutor(max_workers=32)
+reply({"id": 0, "ready": True})
+for line in sys.stdin:
+    line = line.strip()
+    if not line:
+        continue
+    try:
+        req = json.loads(line)
+    except ValueError:
+        continue
+    if req.get("op") == "ping":
+        reply({"id": req.get("id"), "ok": True})
+    else:
+        pool.submit(handle, req)
+pool.shutdown(wait=True)
+"""
+
+
+class WorkerUnavailable(Exception):
+    """worker 无法启动，调用方应回退到逐条 ssh 执行"""
+    pass
+
+
+class EC2Worker:
+    """远端常驻 worker 的本地客户端 (线程安全)
+
+    多个请求共用同一条 SSH 通道: 每个请求带唯一 id，远端并发处理并乱序返回，
+    本地读线程按 id 分发响应到对应的 Future。同步调用方用 request()，
+    asyncio 调用方用 request_async()，都不会为每个请求启动新进程。
+    """
+
+    def __init__(self):
+        self._proc = None
+        self._pending = {}
+        self._stderr_tail = deque(maxlen=20)
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._next_id = 0
+
+    # ==================== 生命周期 ====================
+
+    def is_alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def ensure_started(self, quiet: bool = False):
+        """worker 未运行时启动 (并发调用只启动一次)"""
+        if self.is_alive():
+            return
+        with self._start_lock:
+            if not self.is_alive():
+                self.start(quiet=quiet)
+
+    def start(self, quiet: bool = False):
+        """通过 ControlMaster socket 启动远端 worker，等待 ready 帧 (quiet 时不输出连接进度)"""
+        ensure_ssh_connection(quiet=quiet)
+        ssh_cmd = build_ssh_command()
+        ssh_cmd.append("python3 -u -c " + shlex.quote(_WORKER_SCRIPT))
+
+        try:
+            proc = subprocess.Popen(
+                ssh_cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                bufsize=1,
+            )
+        except FileNotFoundError:
+            raise SSHError("找不到 ssh 命令，请确保已安装 OpenSSH")
+
+        ready = Future()
+        pending = {0: ready}
+        self._stderr_tail.clear()
+        threading.Thread(target=self._read_stdout, args=(proc, pending), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(proc,), daemon=True).start()
+
+        try:
+            ok = ready.result(timeout=WORKER_START_TIMEOUT).get("ready")
+        except (FutureTimeout, SSHError):
+            ok = False
+        if not ok:
+            stderr = "\n".join(self._stderr_tail)
+            self._terminate(proc)
+            if "Permission denied" in stderr:
+                raise SSHError("SSH 连接被拒绝，请检查密钥配置")
+            raise WorkerUnavailable(stderr.strip()[:200] or "worker 启动失败")
+
+        self._pending = pending
+        self._proc = proc
+
+    def close(self):
+        """关闭 worker (关闭 stdin 后远端循环自然退出)，未完成的请求以 SSHError 结束"""
+        proc, self._proc = self._proc, None
+        if proc is not None:
+            self._terminate(proc)
+
+    @staticmethod
+    def _terminate(proc):
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=3)
+        except Exception:
+            proc.kill()
+
+    def _read_stdout(self, proc, pending):
+        """读线程: 按 id 把响应帧分发给等待中的 Future，跳过非 JSON 行"""
+        for line in proc.stdout:
+            try:
+                frame = json.loads(line)
+            except ValueError:
+                continue
+            future = pending.pop(frame.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(frame)
+        # EOF: 连接断开，所有未完成的请求失败
+        for rid in list(pending):
+            future = pending.pop(rid, None)
+            if future is not None and not future.done():
+                future.set_exception(SSHError("EC2 worker 连接已断开"))
+
+    def _read_stderr(self, proc):
+        for line in proc.stderr:
+            self._stderr_tail.append(line.rstrip())
+
+    # ==================== 请求 ====================
+
+    def submit(self, payload: dict) -> Future:
+        """发送一个请求帧，返回在收到对应响应时完成的 Future (不等待)"""
+        self.ensure_started()
+        future = Future()
+        with self._write_lock:
+            proc, pending = self._proc, self._pending
+            if proc is None:
+                raise SSHError("EC2 worker 连接已断开")
+            self._next_id += 1
+            rid = self._next_id
+            pending[rid] = future
+            try:
+                proc.stdin.write(json.dumps(dict(payload, id=rid)) + "\n")
+                proc.stdin.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                pending.pop(rid, None)
+                self.close()
+                raise SSHError("EC2 worker 连接已断开")
+        future.rid = rid
+        return future
+
+    def _forget(self, future: Future):
+        """放弃等待某个请求，迟到的响应会被直接丢弃"""
+        self._pending.pop(getattr(future, "rid", None), None)
+
+    def request(self, payload: dict, timeout: float = 120) -> dict:
+        """发送一个请求帧并等待对应响应
+
+        请求发出后超时或连接中断会抛出 SSHError 而不是回退重试，
+        以免提现/下单等写操作被重复执行。
+        """
+        future = self.submit(payload)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            self._forget(future)
+            raise SSHError(f"SSH 命令执行超时 ({timeout}秒)")
+
+    async def request_async(self, payload: dict, timeout: float = 120) -> dict:
+        """request() 的 asyncio 版本: 所有协程共用同一条 SSH 通道"""
+        if not self.is_alive():
+            # 启动 worker 需要建立 SSH 连接，放到线程中避免阻塞事件循环
+            await asyncio.get_running_loop().run_in_executor(None, self.ensure_started)
+        future = self.submit(payload)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self._forget(future)
+            raise SSHError(f"SSH 命令执行超时 ({timeout}秒)")
+
+    @staticmethod
+    def _run_payload(op: str, timeout: int, env: dict = None, **fields) -> dict:
+        payload = dict(fields, op=op, timeout=timeout)
+        if env:
+            payload["env"] = env
+        return payload
+
+    def run(self, cmd: str, timeout: int = 120, env: dict = None) -> dict:
+        """执行一条 run.sh 命令，返回 {stdout, stderr, returncode, elapsed}
+
+        env 为远端命令的额外环境变量 (如 ec2_schema.MACHINE_ENV)
+        """
+        cmd = " ".join(cmd.split())
+        # 远端超时略短于本地等待时间，保证能收到超时响应
+        resp = self.request(self._run_payload("run", timeout, env, cmd=cmd), timeout=timeout + 10)
+        return self._check_run(resp, timeout)
+
+    async def run_async(self, cmd: str, timeout: int = 120, env: dict = None) -> dict:
+        """run() 的 asyncio 版本"""
+        cmd = " ".join(cmd.split())
+        resp = await self.request_async(self._run_payload("run", timeout, env, cmd=cmd), timeout=timeout + 10)
+        return self._check_run(resp, timeout)
+
+    @staticmethod
+    def _check_run(resp: dict, timeout: int) -> dict:
+        if not resp.get("ok"):
+            raise SSHError(resp.get("error", "EC2 worker 执行失败"))
+        if resp.get("timeout"):
+            raise SSHError(f"SSH 命令执行超时 ({timeout}秒)")
+        return resp
+
+    def run_batch(self, cmds: list, timeout: int = 120, envs: list = None) -> list:
+        """一个请求帧发送多条命令，远端并发执行，按输入顺序返回结果列表
+
+        envs 与 cmds 对应，为每条命令的额外环境变量 (None 表示不设置)
+        """
+        cmds = [" ".join(c.split()) for c in cmds]
+        fields = {"cmds": cmds}
+        if envs and any(envs):
+            fields["envs"] = envs
+        resp = self.request(self._run_payload("batch", timeout, **fields), timeout=timeout + 10)
+        if not resp.get("ok"):
+            raise SSHError(resp.get("error", "EC2 worker 执行失败"))
+        return resp.get("results", [])
+
+    def run_script(self, source: str, argv: list = None, timeout: int = 60) -> dict:
+        """在远端执行 Python 脚本，返回 {stdout, stderr, returncode, elapsed}
+
+        脚本按内容哈希缓存在远端磁盘 (~/.ec2_worker_scripts)，只在远端没有时上传一次；
+        由 worker 以独立的 python3 进程运行，超时后终止。参数通过 JSON 帧和 stdin
+        传入脚本的 sys.argv[1:]，不会出现在远端进程命令行中。
+        """
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        payload = {"op": "script_run", "hash": digest, "argv": [str(a) for a in (argv or [])], "timeout": timeout}
+        # 远端超时略短于本地等待时间，保证能收到超时响应
+        resp = self.request(payload, timeout=timeout + 10)
+        if resp.get("missing"):
+            resp = self.request(dict(payload, source=source), timeout=timeout + 10)
+        return self._check_run(resp, timeout)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> EC2Worker:
+    """获取进程内共享的 worker 实例"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = EC2Worker()
+            atexit.register(_worker.close)
+        return _worker
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""分批执行 - 把大额母单拆成子单按时间分片执行 (TWAP)，并限制滑点和盘口参与率
+
+稀薄的交易对 (如 USD1/USDT、U/USDT) 一次性市价成交会吃穿多档盘口。调度器把
+母单按时间均分为若干片，每片只拿最优价到滑点上限之间可见深度的一定比例；
+挂单超过 stale_after 秒未成交就撤单，下一片按新盘口重新挂出。
+
+下单通过 broker 对象完成，需提供:
+    book()                     -> {"bids": [(price, qty)], "asks": [...]} 或 None (盘口不可用)
+    round_qty(qty)             -> 按交易规则取整后的数量 (不足最小数量时返回 0)
+    place(side, qty, price)    -> 订单 ID (市价单或无法获取 ID 时返回 None)；price 为限价/滑点上限
+    poll()                     -> {"open": {未完成订单 ID}, "filled": 累计成交数量, "notional": 累计成交金额,
+                                   "unresolved": {成交状态未知的订单 ID} (可选)}
+    cancel(order_id)
+EC2 实盘 broker 见 trade.py；MockExchange 为本地撮合引擎，用于测试调度逻辑。
+
+没有盘口就无法计算滑点上限和参与量: 开始时取不到盘口直接拒绝执行 (status "no_book")，
+执行中某次取不到盘口则该轮不下单，不会发出不设上限的子单。
+有子单成交状态未知时停止执行 (status "unresolved")，以免按少计的成交继续补单造成超额。
+"""
+
+import itertools
+import time
+
+# 默认参数
+DEFAULT_MAX_SLIPPAGE_BPS = 5
+DEFAULT_PARTICIPATION = 0.3
+DEFAULT_STALE_AFTER = 20
+DEFAULT_POLL_INTERVAL = 2
+
+# 计划时间结束后继续补单的最长时间 (秒)
+CATCH_UP_TIME = 60
+
+
+def make_plan(side: str, total_qty: float, duration: float, slices: int,
+              max_slippage_bps: float = DEFAULT_MAX_SLIPPAGE_BPS,
+              participation: float = DEFAULT_PARTICIPATION,
+              stale_after: float = DEFAULT_STALE_AFTER,
+              poll_interval: float = DEFAULT_POLL_INTERVAL) -> dict:
+    """生成执行计划
+
+    Args:
+        side: "buy" / "sell"
+        total_qty: 母单数量 (基础币)
+        duration: 计划执行时长 (秒)
+        slices: 分片数
+        max_slippage_bps: 相对开始时中间价的最大滑点 (基点)
+        participation: 每片最多吃掉滑点范围内可见深度的比例 (0-1]
+        stale_after: 挂单超过该秒数未完成则撤单重挂
+        poll_interval: 查询成交状态的间隔 (秒)
+    """
+    if side not in ("buy", "sell"):
+        raise ValueError(f"无效方向: {side}")
+    if total_qty <= 0 or slices < 1:
+        raise ValueError("数量和分片数必须大于 0")
+    return {
+        "side": side,
+        "total_qty": float(total_qty),
+        "duration": max(float(duration), 0.0),
+        "slices": int(slices),
+        "max_slippage_bps": float(max_slippage_bps),
+        "participation": min(max(float(participation), 0.01), 1.0),
+        "stale_after": float(stale_after),
+        "poll_interval": float(poll_interval),
+    }
+
+
+def _price_cap(side: str, ref_price: float, bps: float) -> float:
+    """滑点上限: 买入不高于、卖出不低于该价格"""
+    return ref_price * (1 + bps / 10000) if side == "buy" else ref_price * (1 - bps / 10000)
+
+
+def _depth_within(book: dict, side: str, cap: float):
+    """最优对手价和上限以内的可见深度，返回 (best_price, qty)"""
+    levels = book.get("asks" if side == "buy" else "bids") or []
+    if not levels:
+        return None, 0.0
+    inside = [(p, q) for p, q in levels if (p <= cap if side == "buy" else p >= cap)]
+    return levels[0][0], sum(q for _, q in inside)
+
+
+def run_plan(broker, plan: dict, on_progress=None, clock=time.time, sleep=time.sleep,
+             should_stop=None) -> dict:
+    """按计划执行，返回汇总 {"filled", "avg_price", "children", "cancels", "elapsed", "status", "unresolved"}
+
+    Args:
+        on_progress: 每次查询成交后回调 on_progress(event: dict)
+        clock / sleep: 时间函数 (测试时可替换为模拟时钟)
+        should_stop: 返回 True 时提前结束 (撤掉所有挂单)；执行中按 Ctrl+C 效果相同
+    """
+    side, total = plan["side"], plan["total_qty"]
+    start = clock()
+    slice_interval = plan["duration"] / plan["slices"]
+    deadline = start + plan["duration"] + CATCH_UP_TIME
+
+    book = broker.book()
+    if not book or not book.get("bids") or not book.get("asks"):
+        return {"filled": 0.0, "avg_price": 0.0, "children": 0, "cancels": 0, "elapsed": clock() - start,
+                "status": "no_book", "ref_price": None, "unresolved": [],
+                "error": "无法获取盘口，不能计算滑点上限和参与量，未下单"}
+    ref_price = (book["bids"][0][0] + book["asks"][0][0]) / 2
+    cap = _price_cap(side, ref_price, plan["max_slippage_bps"])
+
+    working = {}  # order_id -> (qty, placed_at)
+    children = cancels = 0
+    filled = notional = 0.0
+    unresolved = set()
+    status = "done"
+    next_slice = 0
+
+    def emit(kind, **fields):
+        if on_progress:
+            event = {"type": kind, "filled": filled, "total": total, "working": len(working),
+                     "elapsed": clock() - start, "avg_price": notional / filled if filled else 0.0}
+            event.update(fields)
+            on_progress(event)
+
+    emit("start", ref_price=ref_price, cap=cap)
+
+    def _step():
+        nonlocal filled, notional, next_slice, children, cancels, status
+        state = broker.poll()
+        filled, notional = state["filled"], state["notional"]
+        for order_id in list(working):
+            if order_id not in state["open"]:
+                working.pop(order_id)
+        unresolved.update(state.get("unresolved") or ())
+        remaining = total - filled
+        now = clock()
+
+        if unresolved:
+            status = "unresolved"
+            emit("error", error=f"子单成交状态未知: {', '.join(map(str, sorted(unresolved)))}，停止执行")
+            return False
+
+        if broker.round_qty(remaining) <= 0:
+            return False
+        if should_stop and should_stop():
+            status = "stopped"
+            return False
+        if now >= deadline:
+            status = "timeout"
+            return False
+
+        # 撤掉超时未成交的挂单，下一片按新盘口重挂
+        for order_id, (_, placed_at) in list(working.items()):
+            if now - placed_at >= plan["stale_after"]:
+                broker.cancel(order_id)
+                working.pop(order_id)
+                cancels += 1
+                emit("cancel", order_id=order_id)
+
+        # 到达分片时间: 补足到计划进度 (计划结束后每次轮询都补单)
+        if next_slice < plan["slices"] and now >= start + next_slice * slice_interval:
+            next_slice += 1
+        target = total * next_slice / plan["slices"]
+        outstanding = sum(qty for qty, _ in working.values())
+        want = min(target - filled - outstanding, remaining - outstanding)
+
+        book = broker.book() if want > 0 else None
+        if want > 0 and book is None:
+            # 盘口暂不可用: 本轮不下单 (不发不设上限的子单)，下次轮询再试
+            emit("error", error="盘口暂不可用，本轮不下单")
+        elif want > 0:
+            best, depth = _depth_within(book, side, cap)
+            want = min(want, depth * plan["participation"])
+            # 挂在最优对手价 (立即成交部分)，不超过滑点上限
+            price = cap if best is None else (min(best, cap) if side == "buy" else max(best, cap))
+            qty = broker.round_qty(want)
+            if qty > 0:
+                order_id = broker.place(side, qty, price)
+                children += 1
+                if order_id is not None:
+                    working[order_id] = (qty, clock())
+                emit("child", qty=qty, price=price, order_id=order_id)
+
+        emit("progress")
+        sleep(plan["poll_interval"])
+
+    error = None
+    while True:
+        try:
+            if _step() is False:
+                break
+        except Exception as e:
+            # 下单/查询失败: 停止执行，撤掉已挂出的订单
+            error = str(e) or type(e).__name__
+            status = "error"
+            emit("error", error=error)
+            break
+        except KeyboardInterrupt:
+            # Ctrl+C 中止: 同样撤掉挂单后返回汇总
+            status = "stopped"
+            break
+
+    for order_id in list(working):
+        try:
+            broker.cancel(order_id)
+            cancels += 1
+        except Exception as e:
+            emit("error", error=f"撤单 {order_id} 失败: {e}")
+    try:
+        state = broker.poll()
+        filled, notional = state["filled"], state["notional"]
+        unresolved.update(state.get("unresolved") or ())
+    except Exception:
+        pass
+    summary = {
+        "filled": filled,
+        "avg_price": notional / filled if filled else 0.0,
+        "children": children,
+        "cancels": cancels,
+        "elapsed": clock() - start,
+        "status": status,
+        "ref_price": ref_price,
+        "error": error,
+        "unresolved": sorted(unresolved),
+    }
+    emit("finish", status=status)
+    return summary
+
+
+def format_progress(event: dict, base: str = "") -> str:
+    """进度事件转换为终端显示文本 (start/progress 以外的事件)"""
+    pct = event["filled"] / event["total"] * 100 if event["total"] else 0
+    head = f"[{event['elapsed']:>6.1f}s] {pct:5.1f}% {event['filled']:,.4f}/{event['total']:,.4f} {base}"
+    kind = event["type"]
+    if kind == "start":
+        return f"▶️  开始执行，参考中间价 {event['ref_price']:.5f}，滑点上限 {event['cap']:.5f}"
+    if kind == "child":
+        price = f" @ {event['price']:.5f}" if event.get("price") else " (市价)"
+        return f"{head}  📤 子单 {event['qty']:,}{price}"
+    if kind == "cancel":
+        return f"{head}  ♻️  撤单重挂 {event['order_id']}"
+    if kind == "error":
+        return f"{head}  ❌ {event['error']}"
+    if kind == "finish":
+        avg = f"，均价 {event['avg_price']:.5f}" if event["filled"] else ""
+        return f"{head}  🏁 结束 ({event['status']}){avg}"
+    return ""
+
+
+# ===================== 本地撮合引擎 (测试用) =====================
+
+class MockExchange:
+    """单交易对的本地撮合引擎，同时实现 broker 接口
+
+    限价单先与对手盘口按价格优先撮合，剩余部分挂单；advance() 推进模拟时钟，
+    按 refill 恢复对手盘流动性，并以新的最优价撮合已挂出的订单。
+    """
+
+    def __init__(self, bids: list, asks: list, step: float = 0, min_qty: float = 0, refill: bool = True):
+        self.initial = ([tuple(l) for l in bids], [tuple(l) for l in asks])
+        self.bids = {p: q for p, q in bids}
+        self.asks = {p: q for p, q in asks}
+        self.step = step
+        self.min_qty = min_qty
+        self.refill = refill
+        self.now = 0.0
+        self.orders = {}  # order_id -> {"side", "price", "qty", "filled"}
+        self.filled = 0.0
+        self.notional = 0.0
+        self._ids = itertools.count(1)
+
+    # ---------- 模拟时钟 ----------
+
+    def clock(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+        if self.refill:
+            # 对手盘流动性恢复到初始状态 (模拟其他做市商补单)
+            for price, qty in self.initial[0]:
+                self.bids[price] = max(self.bids.get(price, 0), qty)
+            for price, qty in self.initial[1]:
+                self.asks[price] = max(self.asks.get(price, 0), qty)
+        for order_id, order in list(self.orders.items()):
+            self._match(order)
+
+    # ---------- 撮合 ----------
+
+    def _match(self, order: dict):
+        book = self.asks if order["side"] == "buy" else self.bids
+        prices = sorted(book) if order["side"] == "buy" else sorted(book, reverse=True)
+        for price in prices:
+            remaining = order["qty"] - order["filled"]
+            if remaining <= 1e-12:
+                break
+            if (order["side"] == "buy" and price > order["price"]) or (order["side"] == "sell" and price < order["price"]):
+                break
+            take = min(remaining, book[price])
+            book[price] -= take
+            if book[price] <= 1e-12:
+                del book[price]
+            order["filled"] += take
+            self.filled += take
+            self.notional += take * price
+
+    # ---------- broker 接口 ----------
+
+    def book(self) -> dict:
+        return {
+            "bids": sorted(self.bids.items(), reverse=True),
+            "asks": sorted(self.asks.items()),
+        }
+
+    def round_qty(self, qty: float) -> float:
+        if self.step:
+            qty = int(qty / self.step + 1e-9) * self.step
+        return qty if qty >= max(self.min_qty, 1e-9) else 0
+
+    def place(self, side: str, qty: float, price: float = None):
+        order_id = str(next(self._ids))
+        if price is None:
+            price = float("inf") if side == "buy" else 0.0
+        order = {"side": side, "price": price, "qty": qty, "filled": 0.0}
+        self.orders[order_id] = order
+        self._match(order)
+        return order_id
+
+    def poll(self) -> dict:
+        open_ids = {oid for oid, o in self.orders.items() if o["qty"] - o["filled"] > 1e-12}
+        return {"open": open_ids, "filled": self.filled, "notional": self.notional}
+
+    def cancel(self, order_id: str):
+        order = self.orders.get(order_id)
+        if order:
+            order["qty"] = order["filled"]
@@ -2,11 +2,13 @@
 """资金费率查询"""
 
 import json
-import requests
-import subprocess
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from utils import run_on_ec2, select_option, SSHError, load_config, get_ssh_config, run_bybit_api_script
+from utils import run_on_ec2, select_option, SSHError, load_config, run_bybit_api_script
+from http_client import http_get, http_post
+import funding_store
+from funding_agg import group_daily, group_daily_by_symbol, annualize
+from lighter_session import get_lighter_session
 
 BINANCE_BASE = "https://fapi.binance.com"
 ASTER_BASE = "https://fapi.asterdex.com"
@@ -14,6 +16,10 @@ HYPERLIQUID_BASE = "https://api.hyperliquid.xyz"
 LIGHTER_BASE = "https://mainnet.zklighter.elliot.ai"
 BYBIT_BASE = "https://api.bybit.com"
 
+# Hyperliquid userFunding 单次最多返回 500 条，按最后一条的时间分页
+HYPERLIQUID_FUNDING_PAGE_SIZE = 500
+HYPERLIQUID_FUNDING_MAX_PAGES = 40
+
 
 def get_hyperliquid_funding_history(coin: str, days: int = 7):
     """查询 Hyperliquid 历史资金费率
@@ -38,7 +44,7 @@ def get_hyperliquid_funding_history(coin: str, days: int = 7):
     }
 
     try:
-        resp = requests.post(url, json=payload, timeout=10)
+        resp = http_post(url, json=payload, timeout=10)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -60,30 +66,65 @@ def get_hyperliquid_user_funding(wallet_address: str, coin: str = None, days: in
     Returns:
         list: 资金费收入记录列表
     """
+    try:
+        records, _ = _fetch_hyperliquid_user_funding(wallet_address, days)
+        # 过滤币种
+        if coin:
+            records = [r for r in records if r.get("delta", {}).get("coin", "").upper() == coin.upper()]
+        return records
+    except Exception as e:
+        print(f"请求失败: {e}")
+        return []
+
+
+def _fetch_hyperliquid_user_funding(wallet_address: str, days: int):
+    """拉取 Hyperliquid 用户资金费原始记录 (按时间正序分页)，失败时抛出异常
+
+    Returns:
+        (records, truncated): truncated 为 True 表示达到分页上限，最后一条之后的记录未拉取
+    """
     now = datetime.now(ZoneInfo("Asia/Shanghai"))
     start_time = int((now - timedelta(days=days)).timestamp() * 1000)
 
     url = f"{HYPERLIQUID_BASE}/info"
-    payload = {
-        "type": "userFunding",
-        "user": wallet_address,
-        "startTime": start_time
-    }
+    records = []
+    seen = set()
+    for _ in range(HYPERLIQUID_FUNDING_MAX_PAGES):
+        payload = {
+            "type": "userFunding",
+            "user": wallet_address,
+            "startTime": start_time
+        }
+        resp = http_post(url, json=payload, timeout=10)
+        if resp.status_code != 200:
+            raise Exception(f"API 错误: {resp.status_code}")
+        page = resp.json() or []
+        new_rows = 0
+        for r in page:
+            # 下一页从最后一条的时间开始 (同一时刻可能有多个币种)，重叠部分去重
+            key = (r.get("time"), r.get("hash"), r.get("delta", {}).get("coin"))
+            if key not in seen:
+                seen.add(key)
+                records.append(r)
+                new_rows += 1
+        if len(page) < HYPERLIQUID_FUNDING_PAGE_SIZE:
+            return records, False
+        if not new_rows:
+            break
+        start_time = int(page[-1].get("time", start_time))
+    return records, True
 
-    try:
-        resp = requests.post(url, json=payload, timeout=10)
-        if resp.status_code == 200:
-            records = resp.json()
-            # 过滤币种
-            if coin:
-                records = [r for r in records if r.get("delta", {}).get("coin", "").upper() == coin.upper()]
-            return records
-        else:
-            print(f"API 错误: {resp.status_code}")
-            return []
-    except Exception as e:
-        print(f"请求失败: {e}")
-        return []
+
+def sync_hyperliquid_funding(wallet_address: str, days: int = 7) -> list:
+    """从本地仓库增量同步 Hyperliquid 资金费，返回 [(coin, ts_ms, usdc), ...]"""
+    def fetch_days(n):
+        raw, truncated = _fetch_hyperliquid_user_funding(wallet_address, n)
+        records = [(r.get("delta", {}).get("coin", ""), int(r.get("time", 0)), float(r.get("delta", {}).get("usdc", 0)))
+                   for r in raw]
+        if truncated:
+            return funding_store.FetchResult(records, covered_to=max(ts for _, ts, _ in records))
+        return records
+    return funding_store.sync("hyperliquid", wallet_address, days, fetch_days)
 
 
 def show_hyperliquid_funding_history(user: str = None):
@@ -91,7 +132,7 @@ def show_hyperliquid_funding_history(user: str = None):
     import json
 
     # 从本地配置获取钱包地址
-    config = json.load(open("config.json"))
+    config = load_config()
 
     # 获取用户的 hyperliquid 配置
     if not user:
@@ -116,24 +157,19 @@ def show_hyperliquid_funding_history(user: str = None):
 
     print(f"\n正在查询资金费数据...")
 
-    # 本地直接调用 API 获取资金费收入
+    # 本地仓库增量同步资金费收入
     try:
-        raw_records = get_hyperliquid_user_funding(wallet_address, coin, days)
+        rows = sync_hyperliquid_funding(wallet_address, days)
+        income_records = [
+            {"coin": c, "usdc": amount, "time": ts}
+            for c, ts, amount in rows
+            if not coin or c.upper() == coin
+        ]
 
-        if not raw_records:
+        if not income_records:
             print("没有资金费收入记录")
             return
 
-        # 转换数据格式
-        income_records = []
-        for r in raw_records:
-            delta = r.get("delta", {})
-            income_records.append({
-                "coin": delta.get("coin", ""),
-                "usdc": float(delta.get("usdc", 0)),
-                "time": int(r.get("time", 0))
-            })
-
     except Exception as e:
         print(f"查询失败: {e}")
         return
@@ -142,34 +178,17 @@ def show_hyperliquid_funding_history(user: str = None):
     rate_data = {}
     if coin:
         rate_records = get_hyperliquid_funding_history(coin, days)
-        for record in rate_records:
-            funding_time = int(record.get("time", 0))
-            rate = float(record.get("fundingRate", 0))
-            dt = datetime.fromtimestamp(funding_time / 1000, tz=ZoneInfo("Asia/Shanghai"))
-            date_str = dt.strftime("%Y-%m-%d")
-            if date_str not in rate_data:
-                rate_data[date_str] = {"rates": [], "sum": 0}
-            rate_data[date_str]["rates"].append(rate)
-            rate_data[date_str]["sum"] += rate
+        rate_data = group_daily(
+            [int(r.get("time", 0)) for r in rate_records],
+            [float(r.get("fundingRate", 0)) for r in rate_records],
+        )
 
     # 按币种和日期分组统计
-    coin_daily_stats = {}
-    for record in income_records:
-        record_coin = record.get("coin", "")
-        income = float(record.get("usdc", 0))
-        income_time = int(record.get("time", 0))
-
-        dt = datetime.fromtimestamp(income_time / 1000, tz=ZoneInfo("Asia/Shanghai"))
-        date_str = dt.strftime("%Y-%m-%d")
-
-        if record_coin not in coin_daily_stats:
-            coin_daily_stats[record_coin] = {}
-
-        if date_str not in coin_daily_stats[record_coin]:
-            coin_daily_stats[record_coin][date_str] = {"incomes": [], "sum": 0}
-
-        coin_daily_stats[record_coin][date_str]["incomes"].append(income)
-        coin_daily_stats[record_coin][date_str]["sum"] += income
+    coin_daily_stats = group_daily_by_symbol(
+        [int(r.get("time", 0)) for r in income_records],
+        [r.get("coin", "") for r in income_records],
+        [float(r.get("usdc", 0)) for r in income_records],
+    )
 
     # 显示结果
     print(f"\n{'=' * 80}")
@@ -195,7 +214,7 @@ def show_hyperliquid_funding_history(user: str = None):
         total_rate = 0
         for date_str in sorted(daily_stats.keys(), reverse=True):
             stats = daily_stats[date_str]
-            count = len(stats["incomes"])
+            count = stats["count"]
             daily_sum = stats["sum"]
             coin_total += daily_sum
 
@@ -220,9 +239,9 @@ def show_hyperliquid_funding_history(user: str = None):
 
     print(f"\n{'=' * 80}")
     print(f"总收入: {grand_total:>+,.4f} USDC")
-    avg_daily = grand_total / days if days > 0 else 0
+    avg_daily, annual = annualize(grand_total, days)
     print(f"日均收入: {avg_daily:>+,.4f} USDC")
-    print(f"年化收入: {avg_daily * 365:>+,.2f} USDC")
+    print(f"年化收入: {annual:>+,.2f} USDC")
     print("=" * 80)
 
 
@@ -251,7 +270,7 @@ def get_aster_funding_history(symbol: str, days: int = 7):
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params, timeout=10)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -262,6 +281,22 @@ def get_aster_funding_history(symbol: str, days: int = 7):
         return []
 
 
+def _fetch_ec2_funding_income(command: str, exchange: str, days: int) -> list:
+    """通过 EC2 拉取 Binance/Aster 全部交易对的资金费收入，返回 [(symbol, ts_ms, income), ...]"""
+    output = run_on_ec2(f'{command} {exchange} "" {days}')
+    records = json.loads(output.strip())
+    if isinstance(records, dict) and "error" in records:
+        raise Exception(records["error"])
+    return [(r.get("symbol", ""), int(r.get("time", 0)), float(r.get("income", 0))) for r in records]
+
+
+def sync_ec2_funding_income(venue: str, exchange: str, days: int = 7) -> list:
+    """从本地仓库增量同步 Binance/Aster 资金费收入，返回 [(symbol, ts_ms, income), ...]"""
+    command = f"{venue}_funding_income"
+    return funding_store.sync(venue, exchange, days,
+                              lambda n: _fetch_ec2_funding_income(command, exchange, n))
+
+
 def show_aster_funding_history(exchange: str = None):
     """显示 Aster 历史资金费率和实际收入"""
     import json
@@ -276,18 +311,14 @@ def show_aster_funding_history(exchange: str = None):
 
     print(f"\n正在查询资金费数据...")
 
-    # 从 EC2 获取实际资金费收入
+    # 从本地仓库增量同步实际资金费收入 (只拉取上次同步之后的新记录)
     try:
-        if symbol:
-            output = run_on_ec2(f"aster_funding_income {exchange} {symbol} {days}")
-        else:
-            output = run_on_ec2(f"aster_funding_income {exchange} \"\" {days}")
-
-        income_records = json.loads(output.strip())
-
-        if isinstance(income_records, dict) and "error" in income_records:
-            print(f"查询失败: {income_records['error']}")
-            return
+        rows = sync_ec2_funding_income("aster", exchange, days)
+        income_records = [
+            {"symbol": sym, "income": income, "time": ts}
+            for sym, ts, income in rows
+            if not symbol or sym == symbol
+        ]
 
         if not income_records:
             print("没有资金费收入记录")
@@ -301,34 +332,17 @@ def show_aster_funding_history(exchange: str = None):
     rate_data = {}
     if symbol:
         rate_records = get_aster_funding_history(symbol, days)
-        for record in rate_records:
-            funding_time = int(record.get("fundingTime", 0))
-            rate = float(record.get("fundingRate", 0))
-            dt = datetime.fromtimestamp(funding_time / 1000, tz=ZoneInfo("Asia/Shanghai"))
-            date_str = dt.strftime("%Y-%m-%d")
-            if date_str not in rate_data:
-                rate_data[date_str] = {"rates": [], "sum": 0}
-            rate_data[date_str]["rates"].append(rate)
-            rate_data[date_str]["sum"] += rate
+        rate_data = group_daily(
+            [int(r.get("fundingTime", 0)) for r in rate_records],
+            [float(r.get("fundingRate", 0)) for r in rate_records],
+        )
 
     # 按交易对和日期分组统计
-    symbol_daily_stats = {}
-    for record in income_records:
-        sym = record.get("symbol", "")
-        income = float(record.get("income", 0))
-        income_time = int(record.get("time", 0))
-
-        dt = datetime.fromtimestamp(income_time / 1000, tz=ZoneInfo("Asia/Shanghai"))
-        date_str = dt.strftime("%Y-%m-%d")
-
-        if sym not in symbol_daily_stats:
-            symbol_daily_stats[sym] = {}
-
-        if date_str not in symbol_daily_stats[sym]:
-            symbol_daily_stats[sym][date_str] = {"incomes": [], "sum": 0}
-
-        symbol_daily_stats[sym][date_str]["incomes"].append(income)
-        symbol_daily_stats[sym][date_str]["sum"] += income
+    symbol_daily_stats = group_daily_by_symbol(
+        [int(r.get("time", 0)) for r in income_records],
+        [r.get("symbol", "") for r in income_records],
+        [float(r.get("income", 0)) for r in income_records],
+    )
 
     # 显示结果
     print(f"\n{'=' * 80}")
@@ -354,7 +368,7 @@ def show_aster_funding_history(exchange: str = None):
         total_rate = 0
         for date_str in sorted(daily_stats.keys(), reverse=True):
             stats = daily_stats[date_str]
-            count = len(stats["incomes"])
+            count = stats["count"]
             daily_sum = stats["sum"]
             sym_total += daily_sum
 
@@ -379,9 +393,9 @@ def show_aster_funding_history(exchange: str = None):
 
     print(f"\n{'=' * 80}")
     print(f"💰 总收入: {grand_total:>+,.4f} USDT")
-    avg_daily = grand_total / days if days > 0 else 0
+    avg_daily, annual = annualize(grand_total, days)
     print(f"📈 日均收入: {avg_daily:>+,.4f} USDT")
-    print(f"📅 年化收入: {avg_daily * 365:>+,.2f} USDT")
+    print(f"📅 年化收入: {annual:>+,.2f} USDT")
     print("=" * 80)
 
 
@@ -410,7 +424,7 @@ def get_binance_funding_history(symbol: str, days: int = 7):
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params, timeout=10)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -439,18 +453,14 @@ def show_binance_funding_history(exchange: str = None):
 
     print(f"\n正在查询资金费数据...")
 
-    # 从 EC2 获取实际资金费收入
+    # 从本地仓库增量同步实际资金费收入 (只拉取上次同步之后的新记录)
     try:
-        if symbol:
-            output = run_on_ec2(f"binance_funding_income {exchange} {symbol} {days}")
-        else:
-            output = run_on_ec2(f"binance_funding_income {exchange} \"\" {days}")
-
-        income_records = json.loads(output.strip())
-
-        if isinstance(income_records, dict) and "error" in income_records:
-            print(f"查询失败: {income_records['error']}")
-            return
+        rows = sync_ec2_funding_income("binance", exchange, days)
+        income_records = [
+            {"symbol": sym, "income": income, "time": ts}
+            for sym, ts, income in rows
+            if not symbol or sym == symbol
+        ]
 
         if not income_records:
             print("没有资金费收入记录")
@@ -464,34 +474,17 @@ def show_binance_funding_history(exchange: str = None):
     rate_data = {}
     if symbol:
         rate_records = get_binance_funding_history(symbol, days)
-        for record in rate_records:
-            funding_time = int(record.get("fundingTime", 0))
-            rate = float(record.get("fundingRate", 0))
-            dt = datetime.fromtimestamp(funding_time / 1000, tz=ZoneInfo("Asia/Shanghai"))
-            date_str = dt.strftime("%Y-%m-%d")
-            if date_str not in rate_data:
-                rate_data[date_str] = {"rates": [], "sum": 0}
-            rate_data[date_str]["rates"].append(rate)
-            rate_data[date_str]["sum"] += rate
+        rate_data = group_daily(
+            [int(r.get("fundingTime", 0)) for r in rate_records],
+            [float(r.get("fundingRate", 0)) for r in rate_records],
+        )
 
     # 按交易对和日期分组统计
-    symbol_daily_stats = {}
-    for record in income_records:
-        sym = record.get("symbol", "")
-        income = float(record.get("income", 0))
-        income_time = int(record.get("time", 0))
-
-        dt = datetime.fromtimestamp(income_time / 1000, tz=ZoneInfo("Asia/Shanghai"))
-        date_str = dt.strftime("%Y-%m-%d")
-
-        if sym not in symbol_daily_stats:
-            symbol_daily_stats[sym] = {}
-
-        if date_str not in symbol_daily_stats[sym]:
-            symbol_daily_stats[sym][date_str] = {"incomes": [], "sum": 0}
-
-        symbol_daily_stats[sym][date_str]["incomes"].append(income)
-        symbol_daily_stats[sym][date_str]["sum"] += income
+    symbol_daily_stats = group_daily_by_symbol(
+        [int(r.get("time", 0)) for r in income_records],
+        [r.get("symbol", "") for r in income_records],
+        [float(r.get("income", 0)) for r in income_records],
+    )
 
     # 显示结果
     print(f"\n{'=' * 80}")
@@ -517,7 +510,7 @@ def show_binance_funding_history(exchange: str = None):
         total_rate = 0
         for date_str in sorted(daily_stats.keys(), reverse=True):
             stats = daily_stats[date_str]
-            count = len(stats["incomes"])
+            count = stats["count"]
             daily_sum = stats["sum"]
             sym_total += daily_sum
 
@@ -542,9 +535,9 @@ def show_binance_funding_history(exchange: str = None):
 
     print(f"\n{'=' * 80}")
     print(f"💰 总收入: {grand_total:>+,.4f} USDT")
-    avg_daily = grand_total / days if days > 0 else 0
+    avg_daily, annual = annualize(grand_total, days)
     print(f"📈 日均收入: {avg_daily:>+,.4f} USDT")
-    print(f"📅 年化收入: {avg_daily * 365:>+,.2f} USDT")
+    print(f"📅 年化收入: {annual:>+,.2f} USDT")
     print("=" * 80)
 
 
@@ -571,7 +564,7 @@ def get_bybit_funding_history(symbol: str, days: int = 7):
             "limit": 200
         }
         try:
-            resp = requests.get(url, params=params, timeout=10)
+            resp = http_get(url, params=params, timeout=10)
             if resp.status_code != 200:
                 print(f"API 错误: {resp.status_code}")
                 break
@@ -641,34 +634,17 @@ def show_bybit_funding_history(exchange: str = None):
     rate_data = {}
     if symbol:
         rate_records = get_bybit_funding_history(symbol, days)
-        for record in rate_records:
-            ts = int(record.get("fundingRateTimestamp", 0))
-            rate = float(record.get("fundingRate", 0))
-            dt = datetime.fromtimestamp(ts / 1000, tz=ZoneInfo("Asia/Shanghai"))
-            date_str = dt.strftime("%Y-%m-%d")
-            if date_str not in rate_data:
-                rate_data[date_str] = {"rates": [], "sum": 0}
-            rate_data[date_str]["rates"].append(rate)
-            rate_data[date_str]["sum"] += rate
+        rate_data = group_daily(
+            [int(r.get("fundingRateTimestamp", 0)) for r in rate_records],
+            [float(r.get("fundingRate", 0)) for r in rate_records],
+        )
 
     # 按交易对和日期分组统计
-    symbol_daily_stats = {}
-    for record in income_records:
-        sym = record.get("symbol", "")
-        funding = float(record.get("funding", 0))
-        income_time = int(record.get("time", 0))
-
-        dt = datetime.fromtimestamp(income_time / 1000, tz=ZoneInfo("Asia/Shanghai"))
-        date_str = dt.strftime("%Y-%m-%d")
-
-        if sym not in symbol_daily_stats:
-            symbol_daily_stats[sym] = {}
-
-        if date_str not in symbol_daily_stats[sym]:
-            symbol_daily_stats[sym][date_str] = {"incomes": [], "sum": 0}
-
-        symbol_daily_stats[sym][date_str]["incomes"].append(funding)
-        symbol_daily_stats[sym][date_str]["sum"] += funding
+    symbol_daily_stats = group_daily_by_symbol(
+        [int(r.get("time", 0)) for r in income_records],
+        [r.get("symbol", "") for r in income_records],
+        [float(r.get("funding", 0)) for r in income_records],
+    )
 
     # 显示结果
     print(f"\n{'=' * 80}")
@@ -694,7 +670,7 @@ def show_bybit_funding_history(exchange: str = None):
         total_rate = 0
         for date_str in sorted(daily_stats.keys(), reverse=True):
             stats = daily_stats[date_str]
-            count = len(stats["incomes"])
+            count = stats["count"]
             daily_sum = stats["sum"]
             sym_total += daily_sum
 
@@ -719,68 +695,19 @@ def show_bybit_funding_history(exchange: str = None):
 
     print(f"\n{'=' * 80}")
     print(f"💰 总收入: {grand_total:>+,.4f} USDT")
-    avg_daily = grand_total / days if days > 0 else 0
+    avg_daily, annual = annualize(grand_total, days)
     print(f"📈 日均收入: {avg_daily:>+,.4f} USDT")
-    print(f"📅 年化收入: {avg_daily * 365:>+,.2f} USDT")
+    print(f"📅 年化收入: {annual:>+,.2f} USDT")
     print("=" * 80)
 
 
 def get_bybit_traded_symbols_via_ec2(exchange: str, days: int = 7):
     """通过 EC2 出口 IP 调用 Bybit 私有接口，获取近 N 天交易过的 symbol"""
     try:
-        config = load_config()
-        legacy = config.get("_legacy", {})
-        user_id = legacy.get(exchange)
-        if not user_id:
-            if "_" in exchange:
-                user_id = exchange.split("_", 1)[0]
-            else:
-                return [], "无法从 exchange 推断用户"
-
-        user = config.get("users", {}).get(user_id, {})
-        bybit_cfg = user.get("accounts", {}).get("bybit", {})
-        api_key = bybit_cfg.get("api_key")
-        api_secret = bybit_cfg.get("api_secret")
-        if not api_key or not api_secret:
-            return [], "Bybit API 凭证未配置"
-
-        ssh_host, ssh_user, ssh_hostname, ssh_port, ssh_key = get_ssh_config()
-        if ssh_hostname:
-            target = f"{ssh_user}@{ssh_hostname}" if ssh_user else ssh_hostname
-        else:
-            target = ssh_host
-
-        ssh_cmd = ["ssh"]
-        if ssh_key:
-            ssh_cmd.extend(["-i", ssh_key])
-        if ssh_port and ssh_hostname:
-            ssh_cmd.extend(["-p", str(ssh_port)])
-        ssh_cmd.extend([target, "python3", "-", api_key, api_secret, str(days)])
-
-        script = r"""
-import sys, time, hmac, hashlib, json, urllib.request, urllib.parse
-api_key = sys.argv[1]
-api_secret = sys.argv[2]
+        script = _BYBIT_SIGNED_GET_SCRIPT + r"""
 days = int(sys.argv[3])
 cutoff = int((time.time() - days * 24 * 3600) * 1000)
 
-def signed_get(path, params):
-    qs = "&".join(f"{k}={urllib.parse.quote(str(params[k]))}" for k in sorted(params))
-    ts = str(int(time.time() * 1000))
-    recv = "5000"
-    sign = hmac.new(api_secret.encode(), (ts + api_key + recv + qs).encode(), hashlib.sha256).hexdigest()
-    req = urllib.request.Request(
-        "https://api.bybit.com" + path + "?" + qs,
-        headers={
-            "X-BAPI-API-KEY": api_key,
-            "X-BAPI-TIMESTAMP": ts,
-            "X-BAPI-SIGN": sign,
-            "X-BAPI-RECV-WINDOW": recv,
-        },
-    )
-    with urllib.request.urlopen(req, timeout=20) as r:
-        return json.loads(r.read().decode("utf-8"))
-
 symbols = set()
 cursor = ""
 max_pages = 15
@@ -815,19 +742,11 @@ for _ in range(max_pages):
 
 print(json.dumps({"symbols": sorted(symbols)}))
 """
-        result = subprocess.run(
-            ssh_cmd,
-            input=script,
-            capture_output=True,
-            text=True,
-            timeout=90
-        )
-
-        if result.returncode != 0:
-            err = (result.stderr or result.stdout).strip()
-            return [], err or "SSH 执行失败"
+        try:
+            out = run_bybit_api_script(exchange, script, extra_args=[days], timeout=90)
+        except SSHError as e:
+            return [], str(e) or "SSH 执行失败"
 
-        out = (result.stdout or "").strip()
         if not out:
             return [], "空响应"
 
@@ -842,46 +761,13 @@ print(json.dumps({"symbols": sorted(symbols)}))
 
 
 def get_lighter_markets():
-    """获取 Lighter 市场信息，返回 symbol -> market_id 映射"""
-    url = f"{LIGHTER_BASE}/api/v1/orderBooks"
-    try:
-        resp = requests.get(url, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            markets = {}
-            for market in data.get("order_books", []):
-                symbol = market.get("symbol", "")
-                market_id = market.get("market_id")
-                if symbol and market_id is not None:
-                    markets[symbol] = market_id
-            return markets
-        return {}
-    except Exception:
-        return {}
+    """获取 Lighter 市场信息，返回 symbol -> market_id 映射 (会话内缓存)"""
+    return get_lighter_session().get_markets()
 
 
 def get_lighter_account_index(wallet_address: str):
-    """通过钱包地址获取 account_index"""
-    url = f"{LIGHTER_BASE}/api/v1/account"
-    params = {
-        "by": "l1_address",
-        "value": wallet_address
-    }
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            # 返回主账户的 index
-            accounts = data.get("accounts", [])
-            for acc in accounts:
-                if acc.get("account_type") == 0:
-                    return acc.get("account_index")
-            # 如果没有主账户，返回第一个
-            if accounts:
-                return accounts[0].get("account_index")
-        return None
-    except Exception:
-        return None
+    """通过钱包地址获取 account_index (会话内缓存)"""
+    return get_lighter_session().get_account_index(wallet_address)
 
 
 def get_lighter_funding_history(market_id: int, days: int = 7):
@@ -908,7 +794,7 @@ def get_lighter_funding_history(market_id: int, days: int = 7):
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params, timeout=10)
         if resp.status_code == 200:
             data = resp.json()
             return data.get("fundings", [])
@@ -939,7 +825,7 @@ def get_lighter_position_funding(account_index: int, market_id: int = 255, limit
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params, timeout=10)
         if resp.status_code == 200:
             data = resp.json()
             return data.get("fundings", [])
@@ -954,33 +840,8 @@ def get_lighter_position_funding(account_index: int, market_id: int = 255, limit
 
 def _get_lighter_position_funding_with_auth(account_index: int, api_secret: str, key_index: int, market_id: int = 255, days: int = 7):
     """使用认证获取用户资金费收入 (使用 requests 避免 brotli 问题，支持分页)"""
-    import time
-    from lighter.signer_client import get_signer
-
-    # 创建底层 signer 并生成 auth token
-    signer = get_signer()
-    chain_id = 304  # mainnet
-
-    # 创建 client (传入所有必需参数，api_secret 是私钥)
-    err = signer.CreateClient(
-        LIGHTER_BASE.encode("utf-8"),
-        api_secret.encode("utf-8"),
-        chain_id,
-        key_index,
-        account_index,
-    )
-    if err is not None:
-        raise Exception(f"CreateClient 失败: {err.decode('utf-8')}")
-
-    # 计算 deadline (10分钟后)
-    deadline = int(time.time()) + 10 * 60
-
-    # 创建 auth token
-    result = signer.CreateAuthToken(deadline, key_index, account_index)
-    auth_token = result.str.decode("utf-8") if result.str else None
-    error = result.err.decode("utf-8") if result.err else None
-    if error:
-        raise Exception(f"创建认证token失败: {error}")
+    # 认证 token 在有效期内复用
+    auth_token = get_lighter_session().create_auth_token(api_secret, key_index, account_index)
 
     # 计算截止时间
     now = datetime.now(ZoneInfo("Asia/Shanghai"))
@@ -992,6 +853,7 @@ def _get_lighter_position_funding_with_auth(account_index: int, api_secret: str,
     all_fundings = []
     cursor = None
     max_pages = 50  # 防止无限循环，50页 x 100条 = 5000条
+    truncated = False  # 达到分页上限时为 True，最早一条之前的记录未拉取
 
     for _ in range(max_pages):
         params = {
@@ -1003,7 +865,7 @@ def _get_lighter_position_funding_with_auth(account_index: int, api_secret: str,
         if cursor:
             params["cursor"] = cursor
 
-        resp = requests.get(url, params=params, headers=headers, timeout=30)
+        resp = http_get(url, params=params, headers=headers, timeout=30)
         if resp.status_code != 200:
             raise Exception(f"API 错误: {resp.status_code} - {resp.text}")
 
@@ -1019,14 +881,28 @@ def _get_lighter_position_funding_with_auth(account_index: int, api_secret: str,
                 all_fundings.append(type('Funding', (), f)())
             else:
                 # 数据按时间倒序，遇到超出范围的就停止
-                return type('Result', (), {'fundings': all_fundings})()
+                return type('Result', (), {'fundings': all_fundings, 'truncated': False})()
 
         # 获取下一页 cursor
         cursor = data.get("next_cursor")
         if not cursor:
             break
+    else:
+        truncated = True
+
+    return type('Result', (), {'fundings': all_fundings, 'truncated': truncated})()
 
-    return type('Result', (), {'fundings': all_fundings})()
+
+def sync_lighter_funding(account_index: int, api_secret: str, key_index: int, days: int = 7) -> list:
+    """从本地仓库增量同步 Lighter 全部市场资金费，返回 [(market_id, ts_ms, change), ...]"""
+    def fetch_days(n):
+        result = _get_lighter_position_funding_with_auth(account_index, api_secret, key_index, market_id=255, days=n)
+        records = [(getattr(f, "market_id", 0), int(getattr(f, "timestamp", 0)) * 1000, float(getattr(f, "change", 0)))
+                   for f in getattr(result, "fundings", None) or []]
+        if getattr(result, "truncated", False) and records:
+            return funding_store.FetchResult(records, covered_from=min(ts for _, ts, _ in records))
+        return records
+    return funding_store.sync("lighter", account_index, days, fetch_days)
 
 
 def get_funding_income_lighter(user_id: str, days: int = 7):
@@ -1048,20 +924,8 @@ def get_funding_income_lighter(user_id: str, days: int = 7):
         if account_index is None:
             return None, "无法获取账户"
 
-        result = _get_lighter_position_funding_with_auth(
-            account_index, api_secret, key_index, market_id=255, days=days
-        )
-        if not result or not hasattr(result, "fundings"):
-            return 0.0, None  # 无记录视为 0
-
-        now = datetime.now(ZoneInfo("Asia/Shanghai"))
-        cutoff_time = int((now - timedelta(days=days)).timestamp())
-        total = 0.0
-        for record in result.fundings:
-            ts = int(record.timestamp) if hasattr(record, "timestamp") else int(record.get("timestamp", 0))
-            if ts >= cutoff_time:
-                change = float(record.change) if hasattr(record, "change") else float(record.get("change", 0))
-                total += change
+        rows = sync_lighter_funding(account_index, api_secret, key_index, days)
+        total = sum(change for _, _, change in rows)
         return total, None
     except Exception as e:
         return None, str(e)
@@ -1110,7 +974,7 @@ def show_lighter_funding_history(user: str = "eb65"):
     income_records = []
     account_index = None
     try:
-        config = json.load(open("config.json"))
+        config = load_config()
         user_data = config.get("users", {}).get(user, {})
         lighter_config = user_data.get("accounts", {}).get("lighter", {})
         wallet_address = lighter_config.get("wallet_address")
@@ -1123,11 +987,12 @@ def show_lighter_funding_history(user: str = "eb65"):
             if account_index is not None:
                 print("\n正在获取实际资金费收入...")
                 try:
-                    result = _get_lighter_position_funding_with_auth(
-                        account_index, api_secret, key_index, target_market_id, days=days
-                    )
-                    if result and hasattr(result, 'fundings'):
-                        income_records = result.fundings or []
+                    rows = sync_lighter_funding(account_index, api_secret, int(key_index), days)
+                    income_records = [
+                        {"market_id": int(market_id), "timestamp": ts // 1000, "change": change}
+                        for market_id, ts, change in rows
+                        if target_market_id == 255 or int(market_id) == target_market_id
+                    ]
                 except Exception as e:
                     print(f"获取收入失败: {e}")
     except Exception:
@@ -1153,29 +1018,18 @@ def show_lighter_funding_history(user: str = "eb65"):
 def show_lighter_all_income(income_records: list, market_id_to_symbol: dict, days: int):
     """显示所有币种的资金费收入"""
     now = datetime.now(ZoneInfo("Asia/Shanghai"))
-    cutoff_time = int((now - timedelta(days=days)).timestamp())
+    cutoff_ms = int((now - timedelta(days=days)).timestamp()) * 1000
 
     # 按币种和日期分组
-    coin_daily_stats = {}
+    ts_ms, coins, changes = [], [], []
     for record in income_records:
         timestamp = int(record.timestamp) if hasattr(record, 'timestamp') else int(record.get("timestamp", 0))
-        if timestamp < cutoff_time:
-            continue
-
         change = float(record.change) if hasattr(record, 'change') else float(record.get("change", 0))
         market_id = record.market_id if hasattr(record, 'market_id') else record.get("market_id")
-        coin = market_id_to_symbol.get(market_id, f"MARKET_{market_id}")
-
-        dt = datetime.fromtimestamp(timestamp, tz=ZoneInfo("Asia/Shanghai"))
-        date_str = dt.strftime("%Y-%m-%d")
-
-        if coin not in coin_daily_stats:
-            coin_daily_stats[coin] = {}
-        if date_str not in coin_daily_stats[coin]:
-            coin_daily_stats[coin][date_str] = {"sum": 0, "count": 0}
-
-        coin_daily_stats[coin][date_str]["sum"] += change
-        coin_daily_stats[coin][date_str]["count"] += 1
+        ts_ms.append(timestamp * 1000)
+        coins.append(market_id_to_symbol.get(market_id, f"MARKET_{market_id}"))
+        changes.append(change)
+    coin_daily_stats = group_daily_by_symbol(ts_ms, coins, changes, since_ms=cutoff_ms)
 
     if not coin_daily_stats:
         print("没有资金费收入记录")
@@ -1208,53 +1062,38 @@ def show_lighter_all_income(income_records: list, market_id_to_symbol: dict, day
 
     print(f"\n{'=' * 70}")
     print(f"总收入: ${grand_total:>+.4f}")
-    avg_daily = grand_total / days if days > 0 else 0
+    avg_daily, annual = annualize(grand_total, days)
     print(f"日均收入: ${avg_daily:>+.4f}")
-    print(f"年化收入: ${avg_daily * 365:>+.2f}")
+    print(f"年化收入: ${annual:>+.2f}")
     print("=" * 70)
 
 
 def show_lighter_rate_and_income(coin: str, rate_records: list, income_records: list, market_id_to_symbol: dict, days: int):
     """显示费率和实际收入数据"""
     # 处理费率数据
-    rate_data = {}
-    for record in rate_records:
-        funding_time = int(record.get("timestamp", 0))
-        rate = float(record.get("rate", 0))
-        if funding_time > 0:
-            dt = datetime.fromtimestamp(funding_time, tz=ZoneInfo("Asia/Shanghai"))
-            date_str = dt.strftime("%Y-%m-%d")
-            if date_str not in rate_data:
-                rate_data[date_str] = {"rates": [], "sum": 0, "count": 0}
-            rate_data[date_str]["rates"].append(rate)
-            rate_data[date_str]["sum"] += rate
-            rate_data[date_str]["count"] += 1
+    rate_records = [r for r in rate_records if int(r.get("timestamp", 0)) > 0]
+    rate_data = group_daily(
+        [int(r.get("timestamp", 0)) * 1000 for r in rate_records],
+        [float(r.get("rate", 0)) for r in rate_records],
+    )
 
     # 处理收入数据
-    income_data = {}
     now = datetime.now(ZoneInfo("Asia/Shanghai"))
-    cutoff_time = int((now - timedelta(days=days)).timestamp())
+    cutoff_ms = int((now - timedelta(days=days)).timestamp()) * 1000
 
+    ts_ms, changes = [], []
     for record in income_records:
         # SDK 返回的是对象
-        timestamp = int(record.timestamp) if hasattr(record, 'timestamp') else int(record.get("timestamp", 0))
-        if timestamp < cutoff_time:
-            continue
-
-        change = float(record.change) if hasattr(record, 'change') else float(record.get("change", 0))
         market_id = record.market_id if hasattr(record, 'market_id') else record.get("market_id")
 
         # 检查是否是目标币种
-        record_symbol = market_id_to_symbol.get(market_id, "")
-        if record_symbol != coin:
+        if market_id_to_symbol.get(market_id, "") != coin:
             continue
 
-        dt = datetime.fromtimestamp(timestamp, tz=ZoneInfo("Asia/Shanghai"))
-        date_str = dt.strftime("%Y-%m-%d")
-        if date_str not in income_data:
-            income_data[date_str] = {"sum": 0, "count": 0}
-        income_data[date_str]["sum"] += change
-        income_data[date_str]["count"] += 1
+        timestamp = int(record.timestamp) if hasattr(record, 'timestamp') else int(record.get("timestamp", 0))
+        ts_ms.append(timestamp * 1000)
+        changes.append(float(record.change) if hasattr(record, 'change') else float(record.get("change", 0)))
+    income_data = group_daily(ts_ms, changes, since_ms=cutoff_ms)
 
     if not rate_data:
         print("没有费率数据")
@@ -1355,11 +1194,8 @@ def get_funding_income_binance(exchange: str, days: int = 7):
     """获取 Binance 资金费收入数据（不显示，仅返回数据）"""
     import json
     try:
-        output = run_on_ec2(f'binance_funding_income {exchange} "" {days}')
-        income_records = json.loads(output.strip())
-        if isinstance(income_records, dict) and "error" in income_records:
-            return None, income_records.get("error")
-        total = sum(float(r.get("income", 0)) for r in income_records)
+        rows = sync_ec2_funding_income("binance", exchange, days)
+        total = sum(income for _, _, income in rows)
         return total, None
     except Exception as e:
         return None, str(e)
@@ -1369,11 +1205,8 @@ def get_funding_income_aster(exchange: str, days: int = 7):
     """获取 Aster 资金费收入数据（不显示，仅返回数据）"""
     import json
     try:
-        output = run_on_ec2(f'aster_funding_income {exchange} "" {days}')
-        income_records = json.loads(output.strip())
-        if isinstance(income_records, dict) and "error" in income_records:
-            return None, income_records.get("error")
-        total = sum(float(r.get("income", 0)) for r in income_records)
+        rows = sync_ec2_funding_income("aster", exchange, days)
+        total = sum(income for _, _, income in rows)
         return total, None
     except Exception as e:
         return None, str(e)
@@ -1382,10 +1215,8 @@ def get_funding_income_aster(exchange: str, days: int = 7):
 def get_funding_income_hyperliquid(wallet_address: str, days: int = 7):
     """获取 Hyperliquid 资金费收入数据（不显示，仅返回数据）"""
     try:
-        records = get_hyperliquid_user_funding(wallet_address, None, days)
-        if not records:
-            return 0.0, None
-        total = sum(float(r.get("delta", {}).get("usdc", 0)) for r in records)
+        rows = sync_hyperliquid_funding(wallet_address, days)
+        total = sum(usdc for _, _, usdc in rows)
         return total, None
     except Exception as e:
         return None, str(e)
@@ -1417,18 +1248,34 @@ def signed_get(path, params):
 
 def get_bybit_funding_records(exchange: str, days: int = 7):
     """获取 Bybit 资金费明细列表，返回 [{"symbol": ..., "funding": ..., "time": ...}, ...]"""
+    try:
+        rows = sync_bybit_funding(exchange, days)
+        return [{"symbol": sym, "funding": funding, "time": ts} for sym, ts, funding in rows]
+    except Exception:
+        return []
+
+
+def _fetch_bybit_funding_records(exchange: str, days: int):
+    """通过 EC2 拉取 Bybit 资金费明细，失败时抛出异常
+
+    Returns:
+        (records, truncated_from): 分页达到上限时 truncated_from 为实际拉取到的最早时间 (毫秒)，否则为 None
+    """
     script = _BYBIT_SIGNED_GET_SCRIPT + r"""
 days = int(sys.argv[3])
 now_ms = int(time.time() * 1000)
 cutoff = now_ms - days * 24 * 3600 * 1000
 records = []
+truncated_from = None
 
 # Bybit transaction-log 限制: endTime - startTime <= 7天, 需分窗口查询
+# 从最近的窗口往前查，某个窗口达到分页上限时停止，并报告实际拉取到的最早时间
 window = 7 * 24 * 3600 * 1000  # 7天毫秒
 w_end = now_ms
-while w_end > cutoff:
+while w_end > cutoff and truncated_from is None:
     w_start = max(w_end - window, cutoff)
     cursor = ""
+    earliest = w_end
     for _ in range(30):
         params = {"accountType": "UNIFIED", "category": "linear", "type": "SETTLEMENT", "limit": "50", "startTime": str(w_start), "endTime": str(w_end)}
         if cursor:
@@ -1442,35 +1289,48 @@ while w_end > cutoff:
         if not rows:
             break
         for row in rows:
+            tx_time = int(row.get("transactionTime", 0))
+            earliest = min(earliest, tx_time)
             funding = float(row.get("funding", 0))
             if funding == 0:
                 continue
-            tx_time = int(row.get("transactionTime", 0))
             records.append({"symbol": row.get("symbol", ""), "funding": funding, "time": tx_time})
         cursor = result.get("nextPageCursor", "")
         if not cursor:
             break
+    else:
+        truncated_from = earliest
     w_end = w_start - 1
 
-print(json.dumps(records))
+print(json.dumps({"records": records, "truncated_from": truncated_from}))
 """
-    try:
-        output = run_bybit_api_script(exchange, script, extra_args=[days])
-        if not output:
-            return []
-        data = json.loads(output)
-        if isinstance(data, dict) and "error" in data:
-            return []
-        return data if isinstance(data, list) else []
-    except Exception:
-        return []
+    output = run_bybit_api_script(exchange, script, extra_args=[days])
+    if not output:
+        return [], None
+    data = json.loads(output)
+    if isinstance(data, dict) and "error" in data:
+        raise Exception(data["error"])
+    if isinstance(data, list):
+        return data, None
+    return data.get("records") or [], data.get("truncated_from")
+
+
+def sync_bybit_funding(exchange: str, days: int = 7) -> list:
+    """从本地仓库增量同步 Bybit 资金费，返回 [(symbol, ts_ms, funding), ...]"""
+    def fetch_days(n):
+        raw, truncated_from = _fetch_bybit_funding_records(exchange, n)
+        records = [(r.get("symbol", ""), int(r.get("time", 0)), float(r.get("funding", 0))) for r in raw]
+        if truncated_from is not None:
+            return funding_store.FetchResult(records, covered_from=truncated_from)
+        return records
+    return funding_store.sync("bybit", exchange, days, fetch_days)
 
 
 def get_funding_income_bybit(exchange: str, days: int = 7):
     """获取 Bybit 资金费收入总和，返回 (total, error)"""
     try:
-        records = get_bybit_funding_records(exchange, days)
-        total = sum(r.get("funding", 0) for r in records)
+        rows = sync_bybit_funding(exchange, days)
+        total = sum(funding for _, _, funding in rows)
         return total, None
     except Exception as e:
         return None, str(e)
@@ -1479,8 +1339,7 @@ def get_funding_income_bybit(exchange: str, days: int = 7):
 def show_combined_funding_summary(user_id: str):
     """显示用户所有交易所的综合费率收益汇总"""
     import json
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    from utils import load_config, get_user_accounts, get_ec2_exchange_key, get_exchange_base
+    from utils import load_config, get_user_accounts, get_ec2_exchange_key, get_exchange_base, run_parallel
 
     config = load_config()
     user_data = config.get("users", {}).get(user_id, {})
@@ -1543,25 +1402,23 @@ def show_combined_funding_summary(user_id: str):
     results = []
     currency_totals = {}
 
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        futures = {
-            executor.submit(query_exchange, acc_id, acc_info): acc_info.get("exchange", acc_id).upper()
-            for acc_id, acc_info in accounts.items()
-        }
+    def on_result(acc_id, result, error):
+        if error:
+            exchange_name = accounts[acc_id].get("exchange", acc_id).upper()
+            print(f"  {exchange_name}: 错误 ({error})")
+            results.append({"exchange": exchange_name, "income": None, "currency": "USDT", "error": error})
+            return
+        results.append(result)
+        if result["income"] is not None:
+            print(f"  {result['exchange']}: {result['income']:+,.2f} {result['currency']}")
+            currency_totals[result["currency"]] = currency_totals.get(result["currency"], 0) + result["income"]
+        else:
+            print(f"  {result['exchange']}: 跳过 ({result['error']})")
 
-        for future in as_completed(futures):
-            exchange_name = futures[future]
-            try:
-                result = future.result()
-                results.append(result)
-                if result["income"] is not None:
-                    print(f"  {result['exchange']}: {result['income']:+,.2f} {result['currency']}")
-                    currency_totals[result["currency"]] = currency_totals.get(result["currency"], 0) + result["income"]
-                else:
-                    print(f"  {result['exchange']}: 跳过 ({result['error']})")
-            except Exception as e:
-                print(f"  {exchange_name}: 错误 ({e})")
-                results.append({"exchange": exchange_name, "income": None, "currency": "USDT", "error": str(e)})
+    # 资金费历史需要翻页，单个交易所超时放宽到 3 分钟
+    tasks = [(acc_id, lambda a=acc_id, i=acc_info: query_exchange(a, i))
+             for acc_id, acc_info in accounts.items()]
+    run_parallel(tasks, timeout=180, on_result=on_result)
 
     # 按交易所名称排序结果
     results.sort(key=lambda x: x["exchange"])
@@ -1584,10 +1441,10 @@ def show_combined_funding_summary(user_id: str):
 
     # 按币种显示小计
     for currency, total in currency_totals.items():
-        avg_daily = total / days if days > 0 else 0
+        avg_daily, annual = annualize(total, days)
         print(f"\n{currency} 汇总:")
         print(f"  总收入: {total:+,.4f} {currency}")
         print(f"  日均收入: {avg_daily:+,.4f} {currency}")
-        print(f"  年化收入: {avg_daily * 365:+,.2f} {currency}")
+        print(f"  年化收入: {annual:+,.2f} {currency}")
 
     print("=" * 70)
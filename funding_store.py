@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""资金费收入本地仓库 - SQLite 保存结算明细，按账户增量同步
+
+每条记录以 (venue, account, symbol, ts) 为主键；每个账户记录已同步的时间区间
+[synced_from, synced_to]。查询 N 天数据时只拉取 synced_to 之后的新记录，
+区间不够早时才回补一次完整窗口，因此 90 天报表与 1 天报表的网络开销相当。
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from utils import BASE_DIR
+
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+FUNDING_DB_FILE = os.path.join(CACHE_DIR, "funding.db")
+
+DAY_MS = 24 * 3600 * 1000
+
+# 距上次同步不足该秒数时直接读本地，不再请求
+MIN_SYNC_INTERVAL = 60
+
+# 增量同步时与上次同步终点重叠的时长 (毫秒)，防止交易所延迟入账的记录被漏掉
+SYNC_OVERLAP_MS = 2 * 3600 * 1000
+
+_lock = threading.Lock()
+_initialized = False
+
+
+class FetchResult(NamedTuple):
+    """fetch_days 的返回值 (直接返回记录列表表示完整覆盖了请求的窗口)
+
+    交易所分页达到上限时记录被截断，用 covered_from / covered_to 标明实际覆盖的区间:
+    按时间正序分页时 covered_to 为最后一条记录的时间，倒序分页时 covered_from 为最早一条的时间。
+    """
+    records: list
+    covered_from: Optional[int] = None
+    covered_to: Optional[int] = None
+
+
+@contextmanager
+def _connect():
+    """打开数据库连接并在一个事务中执行 (每次调用新建连接，便于在线程池中使用)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(FUNDING_DB_FILE, timeout=10)
+    try:
+        _init_schema(conn)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _init_schema(conn: sqlite3.Connection):
+    global _initialized
+    if not _initialized:
+        with _lock:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS funding (
+                    venue TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    amount REAL NOT NULL,
+                    PRIMARY KEY (venue, account, symbol, ts)
+                );
+                CREATE INDEX IF NOT EXISTS idx_funding_ts ON funding (venue, account, ts);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    venue TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    synced_from INTEGER NOT NULL,
+                    synced_to INTEGER NOT NULL,
+                    PRIMARY KEY (venue, account)
+                );
+            """)
+            _initialized = True
+
+
+def get_sync_range(venue: str, account: str):
+    """获取已同步区间 (synced_from, synced_to)，毫秒时间戳，未同步过返回 None"""
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT synced_from, synced_to FROM sync_state WHERE venue = ? AND account = ?",
+            (venue, str(account)),
+        ).fetchone()
+    return tuple(row) if row else None
+
+
+def save_records(venue: str, account: str, records: list, synced_from: int, synced_to: int):
+    """写入结算记录 [(symbol, ts_ms, amount), ...] 并更新已同步区间"""
+    account = str(account)
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO funding (venue, account, symbol, ts, amount) VALUES (?, ?, ?, ?, ?)",
+            [(venue, account, str(symbol), int(ts), float(amount)) for symbol, ts, amount in records],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state (venue, account, synced_from, synced_to) VALUES (?, ?, ?, ?)",
+            (venue, account, int(synced_from), int(synced_to)),
+        )
+
+
+def load_records(venue: str, account: str, since_ms: int, symbol: str = None) -> list:
+    """读取 since_ms 之后的记录 [(symbol, ts_ms, amount), ...]，按时间倒序"""
+    sql = "SELECT symbol, ts, amount FROM funding WHERE venue = ? AND account = ? AND ts >= ?"
+    args = [venue, str(account), int(since_ms)]
+    if symbol:
+        sql += " AND symbol = ?"
+        args.append(str(symbol))
+    sql += " ORDER BY ts DESC"
+    with _connect() as conn:
+        return conn.execute(sql, args).fetchall()
+
+
+def _coverage(result, fetch_start: int, now_ms: int):
+    """拆分 fetch_days 的返回值为 (records, covered_from, covered_to)"""
+    if isinstance(result, FetchResult):
+        covered_from = fetch_start if result.covered_from is None else max(int(result.covered_from), fetch_start)
+        covered_to = now_ms if result.covered_to is None else min(int(result.covered_to), now_ms)
+        return result.records, covered_from, covered_to
+    return result, fetch_start, now_ms
+
+
+def sync(venue: str, account: str, days: int, fetch_days) -> list:
+    """增量同步并返回最近 days 天的记录 [(symbol, ts_ms, amount), ...]
+
+    Args:
+        venue: 交易所标识，如 binance / aster / bybit / hyperliquid / lighter
+        account: 账户标识 (EC2 交易所 key、钱包地址或账户索引)
+        days: 需要的天数
+        fetch_days: fetch_days(n) 从交易所拉取最近 n 天的记录 [(symbol, ts_ms, amount), ...]，
+                    记录被截断时返回 FetchResult，同步区间只推进到实际覆盖的范围；
+                    失败时应抛出异常，此时不更新同步区间
+    """
+    now_ms = int(time.time() * 1000)
+    start_ms = now_ms - days * DAY_MS
+    synced = get_sync_range(venue, account)
+
+    if synced and synced[0] <= start_ms:
+        synced_from, synced_to = synced
+        if now_ms - synced_to >= MIN_SYNC_INTERVAL * 1000:
+            # 只拉取上次同步之后的新数据 (含少量重叠)
+            fetch_n = max(1, math.ceil((now_ms - synced_to + SYNC_OVERLAP_MS) / DAY_MS))
+            records, covered_from, covered_to = _coverage(fetch_days(fetch_n), now_ms - fetch_n * DAY_MS, now_ms)
+            if covered_from <= synced_to:
+                synced_to = max(synced_to, covered_to)
+            # 否则新数据与已同步区间之间有缺口，区间保持不变，下次重新拉取
+            save_records(venue, account, records, synced_from, synced_to)
+    else:
+        # 首次同步或需要更早的数据: 拉取完整窗口
+        records, covered_from, covered_to = _coverage(fetch_days(days), start_ms, now_ms)
+        save_records(venue, account, records, covered_from, covered_to)
+
+    return load_records(venue, account, start_ms)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""共享 HTTP 客户端 - 按主机复用连接池的 requests.Session
+
+所有本地直连交易所的 REST 请求都通过这里发出：同一主机复用 keep-alive
+连接 (翻页查询不再每页都做 TCP+TLS 握手)，429/5xx 自动退避重试，
+响应默认 gzip 压缩。返回值和异常与 requests.get/post 一致。
+"""
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 每个主机的最大连接数 (与 utils.PARALLEL_MAX_WORKERS 并发数匹配)
+POOL_MAXSIZE = 8
+
+# 重试策略: 429/5xx 退避重试，间隔 0.5s, 1s, 2s，优先遵循 Retry-After
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _new_session() -> requests.Session:
+    retry = Retry(
+        total=RETRY_TOTAL,
+        connect=RETRY_TOTAL,
+        read=0,  # 读超时不重试，避免放大等待时间
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS,
+        # 本地直连的请求都是只读查询 (Hyperliquid /info 也是 POST)，可以安全重试
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """获取 url 所属主机的共享 Session"""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _new_session()
+    return session
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """等价于 requests.get，但复用连接池"""
+    kwargs.setdefault("timeout", 10)
+    return get_session(url).get(url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> requests.Response:
+    """等价于 requests.post，但复用连接池"""
+    kwargs.setdefault("timeout", 10)
+    return get_session(url).post(url, **kwargs)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Hyperliquid 共享客户端 - 进程内复用 Info 并缓存 meta / spotMeta
+
+hyperliquid.info.Info 的构造函数会同步请求 meta 和 spotMeta，每个查询界面都新建
+一个 Info 会带来两次多余的串行往返。这里进程内只构造一次 (meta 过期后重建)，
+账户查询需要的 user_state / spot_user_state / all_mids 在一轮并发请求中完成。
+"""
+
+import threading
+import time
+
+from hyperliquid.info import Info
+from hyperliquid.utils import constants
+
+from http_client import get_session
+
+# meta / spotMeta 缓存有效期 (秒)，上新币时才会变化
+META_TTL = 300
+
+# 单次 Info 请求超时 (秒)
+REQUEST_TIMEOUT = 15
+
+_lock = threading.Lock()
+_info = None
+_meta = None
+_spot_meta = None
+_meta_fetched_at = 0.0
+
+
+def _fetch_meta(api: Info):
+    """并发获取 meta 和 spotMeta"""
+    from utils import run_parallel
+    results = {key: (result, error) for key, result, error in run_parallel(
+        [("meta", api.meta), ("spot_meta", api.spot_meta)], timeout=REQUEST_TIMEOUT,
+    )}
+    for key, (_, error) in results.items():
+        if error:
+            raise RuntimeError(f"获取 Hyperliquid {key} 失败: {error}")
+    return results["meta"][0], results["spot_meta"][0]
+
+
+def _build_info(meta, spot_meta) -> Info:
+    info = Info(constants.MAINNET_API_URL, skip_ws=True, meta=meta, spot_meta=spot_meta,
+                timeout=REQUEST_TIMEOUT)
+    # 复用共享连接池 (keep-alive + 429/5xx 重试)
+    info.session = get_session(constants.MAINNET_API_URL)
+    return info
+
+
+def get_info() -> Info:
+    """获取进程共享的 Info 实例 (meta 超过 META_TTL 秒后重建)"""
+    global _info, _meta, _spot_meta, _meta_fetched_at
+    with _lock:
+        if _info is not None and time.time() - _meta_fetched_at < META_TTL:
+            return _info
+        # 用不带 meta 解析的轻量实例请求 meta，避免构造函数里的串行请求
+        api = _info or _build_info({"universe": []}, {"universe": [], "tokens": []})
+        meta, spot_meta = _fetch_meta(api)
+        _info = _build_info(meta, spot_meta)
+        _meta, _spot_meta, _meta_fetched_at = meta, spot_meta, time.time()
+        return _info
+
+
+def get_meta():
+    """返回缓存的 (meta, spot_meta)"""
+    get_info()
+    return _meta, _spot_meta
+
+
+def fetch_account_state(wallet_address: str, spot: bool = True, mids: bool = True) -> dict:
+    """一轮并发获取账户状态
+
+    Returns:
+        {"user_state": {...}, "spot_user_state": {...}, "all_mids": {...}}，
+        未请求的项不包含；任一请求失败时抛出异常
+    """
+    from utils import run_parallel
+    info = get_info()
+    tasks = [("user_state", lambda: info.user_state(wallet_address))]
+    if spot:
+        tasks.append(("spot_user_state", lambda: info.spot_user_state(wallet_address)))
+    if mids:
+        tasks.append(("all_mids", info.all_mids))
+
+    state = {}
+    for key, result, error in run_parallel(tasks, timeout=REQUEST_TIMEOUT):
+        if error:
+            raise RuntimeError(f"Hyperliquid {key} 查询失败: {error}")
+        state[key] = result
+    return state
+
+
+def new_exchange(wallet, account_address: str):
+    """创建 Exchange 客户端，复用缓存的 meta (不再重复请求)
+
+    下单/划转请求不走共享连接池，避免 5xx 自动重试导致重复提交
+    """
+    from hyperliquid.exchange import Exchange
+    meta, spot_meta = get_meta()
+    exchange = Exchange(wallet, constants.MAINNET_API_URL, account_address=account_address,
+                        meta=meta, spot_meta=spot_meta, timeout=REQUEST_TIMEOUT)
+    exchange.info.session = get_session(constants.MAINNET_API_URL)
+    return exchange
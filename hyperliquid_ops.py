@@ -2,9 +2,7 @@
 """Hyperliquid 交易所专用功能 - 本地直接运行"""
 
 from eth_account import Account
-from hyperliquid.info import Info
-from hyperliquid.exchange import Exchange
-from hyperliquid.utils import constants
+from hyperliquid_client import fetch_account_state, new_exchange
 from utils import load_config, get_exchange_display_name, input_amount, select_option
 
 
@@ -43,10 +41,11 @@ def show_hyperliquid_balance(exchange: str = "hyperliquid"):
 
     try:
         wallet_address, _ = get_hyperliquid_config(exchange)
-        info = Info(constants.MAINNET_API_URL, skip_ws=True)
 
-        # 获取用户状态
-        user_state = info.user_state(wallet_address)
+        # 合约状态、现货余额、中间价一轮并发获取
+        state = fetch_account_state(wallet_address)
+        user_state = state["user_state"]
+        all_mids = state["all_mids"]
 
         print("\n" + "=" * 50)
         print("📊 Hyperliquid 账户概览:")
@@ -88,7 +87,6 @@ def show_hyperliquid_balance(exchange: str = "hyperliquid"):
                     print("\n" + "-" * 50)
                     print("📈 当前持仓:")
                     print("-" * 50)
-                    all_mids = info.all_mids()
                     has_position = True
 
                 coin = position.get("coin", "")
@@ -117,7 +115,7 @@ def show_hyperliquid_balance(exchange: str = "hyperliquid"):
                     print(f"  平仓价: ${liquidation_px:,.4f}  距平仓线: {distance_pct:.2f}%{warning}")
 
         # 查询现货余额
-        spot_state = info.spot_user_state(wallet_address)
+        spot_state = state["spot_user_state"]
         balances = spot_state.get("balances", [])
         has_spot = False
         for bal in balances:
@@ -145,9 +143,9 @@ def show_hyperliquid_margin_ratio(exchange: str = "hyperliquid"):
 
     try:
         wallet_address, _ = get_hyperliquid_config(exchange)
-        info = Info(constants.MAINNET_API_URL, skip_ws=True)
 
-        user_state = info.user_state(wallet_address)
+        state = fetch_account_state(wallet_address, spot=False)
+        user_state = state["user_state"]
         margin_summary = user_state.get("marginSummary", {})
 
         account_value = float(margin_summary.get("accountValue", 0))
@@ -180,8 +178,8 @@ def show_hyperliquid_margin_ratio(exchange: str = "hyperliquid"):
                 print("📈 持仓详情:")
                 print("-" * 50)
 
-                # 获取所有币种的当前价格
-                all_mids = info.all_mids()
+                # 所有币种的当前价格
+                all_mids = state["all_mids"]
 
                 for pos in positions:
                     position = pos.get("position", {})
@@ -234,13 +232,13 @@ def do_hyperliquid_transfer(exchange: str):
 
     try:
         wallet_address, private_key = get_hyperliquid_config(exchange)
-        info = Info(constants.MAINNET_API_URL, skip_ws=True)
 
         # 获取当前余额
-        user_state = info.user_state(wallet_address)
+        state = fetch_account_state(wallet_address, mids=False)
+        user_state = state["user_state"]
         perp_balance = float(user_state.get("withdrawable", 0))
 
-        spot_state = info.spot_user_state(wallet_address)
+        spot_state = state["spot_user_state"]
         spot_usdc = 0
         for bal in spot_state.get("balances", []):
             if bal.get("coin") == "USDC":
@@ -285,7 +283,7 @@ def do_hyperliquid_transfer(exchange: str):
 
         # 执行划转 (使用 API Wallet 模式，wallet_address 是主账户，私钥是 API Wallet 的)
         wallet = Account.from_key(private_key)
-        exchange_client = Exchange(wallet, constants.MAINNET_API_URL, account_address=wallet_address)
+        exchange_client = new_exchange(wallet, wallet_address)
 
         # usd_class_transfer: to_perp=True 划转到合约, to_perp=False 划转到现货
         result = exchange_client.usd_class_transfer(amount, is_spot_to_perp)
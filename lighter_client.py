@@ -1,17 +1,12 @@
 #!/usr/bin/env python3
 """Lighter 通用客户端库 - 可被其他模块复用"""
 
-import asyncio
 import os
-import time
-import requests
 from datetime import datetime, timedelta
 from typing import Optional
 from zoneinfo import ZoneInfo
-from lighter import ApiClient, AccountApi, InfoApi, OrderApi
-from lighter.configuration import Configuration
-
-LIGHTER_BASE_URL = "https://mainnet.zklighter.elliot.ai"
+from http_client import http_get
+from lighter_session import LIGHTER_BASE_URL, get_lighter_session
 
 
 class LighterClient:
@@ -29,8 +24,8 @@ class LighterClient:
         self.api_key = api_key
         self.key_index = key_index
         self.base_url = LIGHTER_BASE_URL
-        self._account_index = None
-        self._markets_cache = None
+        # 连接、account_index 和市场列表由进程共享的会话缓存
+        self._session = get_lighter_session()
 
     @classmethod
     def from_config(cls, user_id: str = "eb65"):
@@ -66,25 +61,7 @@ class LighterClient:
 
     def get_markets(self) -> dict:
         """获取市场信息，返回 symbol -> market_id 映射"""
-        if self._markets_cache:
-            return self._markets_cache
-
-        url = f"{self.base_url}/api/v1/orderBooks"
-        try:
-            resp = requests.get(url, timeout=10)
-            if resp.status_code == 200:
-                data = resp.json()
-                markets = {}
-                for market in data.get("order_books", []):
-                    symbol = market.get("symbol", "")
-                    market_id = market.get("market_id")
-                    if symbol and market_id is not None:
-                        markets[symbol] = market_id
-                self._markets_cache = markets
-                return markets
-            return {}
-        except Exception:
-            return {}
+        return self._session.get_markets()
 
     def get_market_id_to_symbol(self) -> dict:
         """获取 market_id -> symbol 映射"""
@@ -93,63 +70,29 @@ class LighterClient:
 
     async def get_market_prices_async(self) -> dict:
         """异步获取所有市场当前价格"""
-        config = Configuration(host=self.base_url)
-        async with ApiClient(config) as api_client:
-            order_api = OrderApi(api_client)
-            result = await order_api.order_book_details()
-            prices = {}
-            if result and result.order_book_details:
-                for book in result.order_book_details:
-                    if hasattr(book, 'symbol') and hasattr(book, 'last_trade_price'):
-                        prices[book.symbol] = float(book.last_trade_price) if book.last_trade_price else 0
-            return prices
+        return await self._session.run_async(self._session._market_prices())
 
     def get_market_prices(self) -> dict:
         """同步获取所有市场当前价格"""
-        return asyncio.run(self.get_market_prices_async())
+        return self._session.get_market_prices()
 
     # ==================== 账户信息 ====================
 
     def get_account_index(self) -> Optional[int]:
         """通过钱包地址获取 account_index"""
-        if self._account_index is not None:
-            return self._account_index
-
-        if not self.wallet_address:
-            return None
-
-        url = f"{self.base_url}/api/v1/account"
-        params = {"by": "l1_address", "value": self.wallet_address}
-        try:
-            resp = requests.get(url, params=params, timeout=10)
-            if resp.status_code == 200:
-                data = resp.json()
-                accounts = data.get("accounts", [])
-                for acc in accounts:
-                    if acc.get("account_type") == 0:
-                        self._account_index = acc.get("account_index")
-                        return self._account_index
-                if accounts:
-                    self._account_index = accounts[0].get("account_index")
-                    return self._account_index
-            return None
-        except Exception:
-            return None
+        return self._session.get_account_index(self.wallet_address)
 
     async def get_account_info_async(self):
         """异步获取账户信息"""
         if not self.wallet_address:
             return None
-
-        config = Configuration(host=self.base_url)
-        async with ApiClient(config) as api_client:
-            account_api = AccountApi(api_client)
-            result = await account_api.account(by="l1_address", value=self.wallet_address)
-            return result
+        return await self._session.run_async(self._session._account(self.wallet_address))
 
     def get_account_info(self):
         """同步获取账户信息"""
-        return asyncio.run(self.get_account_info_async())
+        if not self.wallet_address:
+            return None
+        return self._session.get_account_info(self.wallet_address)
 
     # ==================== 资金费率 ====================
 
@@ -177,7 +120,7 @@ class LighterClient:
         }
 
         try:
-            resp = requests.get(url, params=params, timeout=10)
+            resp = http_get(url, params=params, timeout=10)
             if resp.status_code == 200:
                 data = resp.json()
                 return data.get("fundings", [])
@@ -210,7 +153,7 @@ class LighterClient:
         }
 
         try:
-            resp = requests.get(url, params=params, timeout=10)
+            resp = http_get(url, params=params, timeout=10)
             if resp.status_code == 200:
                 data = resp.json()
                 return data.get("fundings", [])
@@ -238,29 +181,7 @@ class LighterClient:
         if account_index is None:
             raise ValueError("无法获取 account_index")
 
-        from lighter.signer_client import get_signer
-
-        # 创建 signer 并生成 auth token
-        signer = get_signer()
-        chain_id = 304  # mainnet
-
-        err = signer.CreateClient(
-            self.base_url.encode("utf-8"),
-            self.api_key.encode("utf-8"),
-            chain_id,
-            self.key_index,
-            account_index,
-        )
-        if err is not None:
-            raise Exception(f"CreateClient 失败: {err.decode('utf-8')}")
-
-        # 创建 auth token (10分钟有效)
-        deadline = int(time.time()) + 10 * 60
-        result = signer.CreateAuthToken(deadline, self.key_index, account_index)
-        auth_token = result.str.decode("utf-8") if result.str else None
-        error = result.err.decode("utf-8") if result.err else None
-        if error:
-            raise Exception(f"创建认证token失败: {error}")
+        auth_token = self._session.create_auth_token(self.api_key, self.key_index, account_index)
 
         # 计算截止时间
         now = datetime.now(ZoneInfo("Asia/Shanghai"))
@@ -283,7 +204,7 @@ class LighterClient:
             if cursor:
                 params["cursor"] = cursor
 
-            resp = requests.get(url, params=params, headers=headers, timeout=30)
+            resp = http_get(url, params=params, headers=headers, timeout=30)
             if resp.status_code != 200:
                 raise Exception(f"API 错误: {resp.status_code} - {resp.text}")
 
@@ -324,27 +245,5 @@ class LighterClient:
         if account_index is None:
             raise ValueError("无法获取 account_index")
 
-        from lighter.signer_client import get_signer
-
-        signer = get_signer()
-        chain_id = 304
-
-        err = signer.CreateClient(
-            self.base_url.encode("utf-8"),
-            self.api_key.encode("utf-8"),
-            chain_id,
-            self.key_index,
-            account_index,
-        )
-        if err is not None:
-            raise Exception(f"CreateClient 失败: {err.decode('utf-8')}")
-
-        deadline = int(time.time()) + deadline_minutes * 60
-        result = signer.CreateAuthToken(deadline, self.key_index, account_index)
-        auth_token = result.str.decode("utf-8") if result.str else None
-        error = result.err.decode("utf-8") if result.err else None
-
-        if error:
-            raise Exception(f"创建认证token失败: {error}")
-
-        return auth_token
+        return self._session.create_auth_token(self.api_key, self.key_index, account_index,
+                                               ttl=deadline_minutes * 60)
@@ -1,13 +1,9 @@
 #!/usr/bin/env python3
 """Lighter 交易所专用功能 - 本地直接运行"""
 
-import asyncio
-from lighter import ApiClient, AccountApi, InfoApi
-from lighter.configuration import Configuration
+from lighter_session import get_lighter_session
 from utils import load_config, get_exchange_display_name, input_amount, select_option
 
-LIGHTER_MAINNET_URL = "https://mainnet.zklighter.elliot.ai"
-
 
 def get_lighter_config(exchange: str = "lighter"):
     """获取 Lighter 配置，根据 exchange 参数查找对应用户"""
@@ -38,32 +34,6 @@ def get_lighter_config(exchange: str = "lighter"):
     return wallet_address, api_key, key_index
 
 
-async def _get_account_info(wallet_address: str):
-    """异步获取账户信息"""
-    config = Configuration(host=LIGHTER_MAINNET_URL)
-    async with ApiClient(config) as api_client:
-        account_api = AccountApi(api_client)
-        # 使用地址查询账户 (参数是 l1_address 不是 l1Address)
-        result = await account_api.account(by="l1_address", value=wallet_address)
-        return result
-
-
-async def _get_market_prices():
-    """异步获取所有市场当前价格"""
-    from lighter import OrderApi
-    config = Configuration(host=LIGHTER_MAINNET_URL)
-    async with ApiClient(config) as api_client:
-        order_api = OrderApi(api_client)
-        result = await order_api.order_book_details()
-        # 返回 symbol -> price 的映射
-        prices = {}
-        if result and result.order_book_details:
-            for book in result.order_book_details:
-                if hasattr(book, 'symbol') and hasattr(book, 'last_trade_price'):
-                    prices[book.symbol] = float(book.last_trade_price) if book.last_trade_price else 0
-        return prices
-
-
 def show_lighter_balance(exchange: str = "lighter"):
     """查询 Lighter 账户余额"""
     display_name = get_exchange_display_name(exchange)
@@ -72,8 +42,7 @@ def show_lighter_balance(exchange: str = "lighter"):
     try:
         wallet_address, _, _ = get_lighter_config(exchange)
 
-        # 运行异步查询
-        account_info = asyncio.run(_get_account_info(wallet_address))
+        account_info = get_lighter_session().get_account_info(wallet_address)
 
         if not account_info or not account_info.accounts:
             print("❌ 未找到账户信息")
@@ -152,13 +121,8 @@ def show_lighter_margin_ratio(exchange: str = "lighter"):
     try:
         wallet_address, _, _ = get_lighter_config(exchange)
 
-        # 运行异步查询 - 同时获取账户信息和市场价格
-        async def fetch_all():
-            account_task = _get_account_info(wallet_address)
-            prices_task = _get_market_prices()
-            return await asyncio.gather(account_task, prices_task)
-
-        account_info, market_prices = asyncio.run(fetch_all())
+        # 同时获取账户信息和市场价格
+        account_info, market_prices = get_lighter_session().get_account_and_prices(wallet_address)
 
         if not account_info or not account_info.accounts:
             print("❌ 未找到账户信息")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Lighter 共享会话 - 一个后台事件循环 + 一个 ApiClient 连接池
+
+lighter SDK 是异步接口，之前每次查询都 asyncio.run 新建事件循环、ApiClient
+和 aiohttp 连接池，用完即销毁。这里进程内只保留一个后台事件循环线程和一个
+ApiClient，同步代码通过 run() 提交协程；account_index、市场列表、认证 token
+也在进程内缓存，lighter_ops / lighter_client / funding / balance 共用。
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+import time
+
+from http_client import http_get
+
+LIGHTER_BASE_URL = "https://mainnet.zklighter.elliot.ai"
+LIGHTER_CHAIN_ID = 304  # mainnet
+
+# 市场列表缓存有效期 (秒)
+MARKETS_TTL = 600
+
+# 认证 token 有效期 (秒)，提前 AUTH_TOKEN_MARGIN 秒重新生成
+AUTH_TOKEN_TTL = 10 * 60
+AUTH_TOKEN_MARGIN = 60
+
+# 单个协程的默认超时 (秒)
+DEFAULT_TIMEOUT = 30
+
+
+class LighterSession:
+    """进程共享的 Lighter 会话 (线程安全)"""
+
+    def __init__(self, base_url: str = LIGHTER_BASE_URL):
+        self.base_url = base_url
+        self._loop = None
+        self._api_client = None
+        self._start_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._signer_lock = threading.Lock()
+        self._account_indexes = {}  # wallet_address -> account_index
+        self._markets = None
+        self._markets_at = 0.0
+        self._auth_tokens = {}  # (account_index, key_index) -> (token, expires_at)
+
+    # ==================== 事件循环 ====================
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="lighter-session", daemon=True)
+            thread.start()
+
+            async def _create_client():
+                # aiohttp 连接池必须在所属事件循环中创建
+                from lighter import ApiClient
+                from lighter.configuration import Configuration
+                return ApiClient(Configuration(host=self.base_url))
+
+            self._api_client = asyncio.run_coroutine_threadsafe(_create_client(), loop).result(DEFAULT_TIMEOUT)
+            self._loop = loop
+            atexit.register(self.close)
+
+    def close(self):
+        """关闭连接池并停止事件循环"""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._api_client.close(), loop).result(5)
+            except Exception:
+                pass
+            loop.call_soon_threadsafe(loop.stop)
+            self._api_client = None
+
+    def run(self, coro, timeout: float = DEFAULT_TIMEOUT):
+        """在共享事件循环中执行协程并等待结果 (同步调用)"""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def run_async(self, coro):
+        """在共享事件循环中执行协程 (供其他事件循环 await)"""
+        self._ensure_started()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    @property
+    def api_client(self):
+        self._ensure_started()
+        return self._api_client
+
+    # ==================== 账户 ====================
+
+    async def _account(self, wallet_address: str):
+        from lighter import AccountApi
+        result = await AccountApi(self._api_client).account(by="l1_address", value=wallet_address)
+        # 顺便缓存 account_index
+        if result and result.accounts:
+            self._remember_account_index(wallet_address, result.accounts)
+        return result
+
+    def get_account_info(self, wallet_address: str):
+        """获取账户详情 (DetailedAccounts)"""
+        return self.run(self._account(wallet_address))
+
+    def _remember_account_index(self, wallet_address: str, accounts):
+        main = next((a for a in accounts if _field(a, "account_type") == 0), accounts[0])
+        with self._cache_lock:
+            self._account_indexes[wallet_address] = _field(main, "account_index")
+
+    def get_account_index(self, wallet_address: str):
+        """钱包地址对应的主账户 account_index (进程内缓存)，查询失败返回 None"""
+        if not wallet_address:
+            return None
+        with self._cache_lock:
+            if wallet_address in self._account_indexes:
+                return self._account_indexes[wallet_address]
+        try:
+            resp = http_get(f"{self.base_url}/api/v1/account",
+                            params={"by": "l1_address", "value": wallet_address}, timeout=10)
+            if resp.status_code != 200:
+                return None
+            accounts = resp.json().get("accounts", [])
+        except Exception:
+            return None
+        if not accounts:
+            return None
+        self._remember_account_index(wallet_address, accounts)
+        return self._account_indexes[wallet_address]
+
+    # ==================== 市场 ====================
+
+    def get_markets(self) -> dict:
+        """symbol -> market_id 映射 (缓存 MARKETS_TTL 秒)，失败时返回旧数据或空 dict"""
+        with self._cache_lock:
+            if self._markets is not None and time.time() - self._markets_at < MARKETS_TTL:
+                return self._markets
+        try:
+            resp = http_get(f"{self.base_url}/api/v1/orderBooks", timeout=10)
+            if resp.status_code != 200:
+                return self._markets or {}
+            markets = {}
+            for market in resp.json().get("order_books", []):
+                symbol = market.get("symbol", "")
+                market_id = market.get("market_id")
+                if symbol and market_id is not None:
+                    markets[symbol] = market_id
+        except Exception:
+            return self._markets or {}
+        with self._cache_lock:
+            self._markets, self._markets_at = markets, time.time()
+        return markets
+
+    async def _market_prices(self) -> dict:
+        from lighter import OrderApi
+        result = await OrderApi(self._api_client).order_book_details()
+        prices = {}
+        if result and result.order_book_details:
+            for book in result.order_book_details:
+                if hasattr(book, 'symbol') and hasattr(book, 'last_trade_price'):
+                    prices[book.symbol] = float(book.last_trade_price) if book.last_trade_price else 0
+        return prices
+
+    def get_market_prices(self) -> dict:
+        """所有市场最新成交价 symbol -> price (实时，不缓存)"""
+        return self.run(self._market_prices())
+
+    def get_account_and_prices(self, wallet_address: str):
+        """并发获取账户详情和市场价格，返回 (account_info, prices)"""
+        async def fetch_all():
+            return await asyncio.gather(self._account(wallet_address), self._market_prices())
+        return tuple(self.run(fetch_all()))
+
+    # ==================== 认证 ====================
+
+    def create_auth_token(self, api_secret: str, key_index: int, account_index: int,
+                          ttl: int = AUTH_TOKEN_TTL) -> str:
+        """生成只读接口认证 token，新 token 有效期 ttl 秒；剩余有效期足够的旧 token 直接复用"""
+        cache_key = (account_index, key_index)
+        with self._cache_lock:
+            cached = self._auth_tokens.get(cache_key)
+            if cached and cached[1] - time.time() > AUTH_TOKEN_MARGIN:
+                return cached[0]
+
+        from lighter.signer_client import get_signer
+        # signer 是进程级的原生库状态，CreateClient 与 CreateAuthToken 需成对串行
+        with self._signer_lock:
+            signer = get_signer()
+            err = signer.CreateClient(
+                self.base_url.encode("utf-8"),
+                api_secret.encode("utf-8"),
+                LIGHTER_CHAIN_ID,
+                key_index,
+                account_index,
+            )
+            if err is not None:
+                raise Exception(f"CreateClient 失败: {err.decode('utf-8')}")
+
+            deadline = int(time.time()) + ttl
+            result = signer.CreateAuthToken(deadline, key_index, account_index)
+        auth_token = result.str.decode("utf-8") if result.str else None
+        error = result.err.decode("utf-8") if result.err else None
+        if error:
+            raise Exception(f"创建认证token失败: {error}")
+
+        with self._cache_lock:
+            self._auth_tokens[cache_key] = (auth_token, deadline)
+        return auth_token
+
+
+def _field(obj, name):
+    """兼容 dict (REST JSON) 和 SDK 模型对象"""
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_lighter_session() -> LighterSession:
+    """获取进程共享的 LighterSession"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = LighterSession()
+    return _session
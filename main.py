@@ -4,22 +4,115 @@
 本地控制 -> EC2执行
 """
 
-from utils import (
-    select_option, select_user, select_account, get_ec2_exchange_key,
-    get_exchange_base, get_user_accounts, load_config
-)
-from balance import show_balance, show_pm_ratio, show_bybit_margin_ratio, show_gate_subaccounts, show_position_analysis, show_multi_exchange_balance
-from aster import show_aster_margin_ratio
-from hyperliquid_ops import show_hyperliquid_balance, do_hyperliquid_transfer
-from lighter_ops import show_lighter_balance, show_lighter_margin_ratio
-from withdraw_ops import do_withdraw
-from transfer import do_transfer, do_binance_subaccount_transfer
-from earn import manage_earn
-from trade import do_stablecoin_trade, cancel_orders_menu, market_sell_menu, futures_close_menu, spot_trade_menu, futures_trade_menu, buy_gt, buy_bgb
-from addresses import manage_addresses
-from bnb_tools import manage_bnb_tools
-from funding import show_funding_rate, show_binance_funding_history, show_aster_funding_history, show_hyperliquid_funding_history, show_lighter_funding_history, show_bybit_funding_history, show_combined_funding_summary
-from vip_loan import manage_vip_loan, get_vip_loan_config
+import importlib
+
+from utils import select_option, select_user, select_account, get_account_record, load_config
+
+
+def _lazy(module: str, name: str):
+    """延迟导入: 首次调用时才加载功能模块
+
+    功能模块会连带加载 hyperliquid / eth_account / lighter SDK、requests、numpy 等重量级依赖，
+    多数会话用不到其中大部分，启动时只加载选择用户/账户所需的 utils，首屏菜单不必等待。
+    """
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module), name)(*args, **kwargs)
+    call.__name__ = name
+    call.__qualname__ = f"{module}.{name}"
+    return call
+
+
+show_balance = _lazy("balance", "show_balance")
+show_pm_ratio = _lazy("balance", "show_pm_ratio")
+show_bybit_margin_ratio = _lazy("balance", "show_bybit_margin_ratio")
+show_gate_subaccounts = _lazy("balance", "show_gate_subaccounts")
+show_position_analysis = _lazy("balance", "show_position_analysis")
+show_multi_exchange_balance = _lazy("balance", "show_multi_exchange_balance")
+show_aster_margin_ratio = _lazy("aster", "show_aster_margin_ratio")
+show_hyperliquid_balance = _lazy("hyperliquid_ops", "show_hyperliquid_balance")
+do_hyperliquid_transfer = _lazy("hyperliquid_ops", "do_hyperliquid_transfer")
+show_lighter_balance = _lazy("lighter_ops", "show_lighter_balance")
+show_lighter_margin_ratio = _lazy("lighter_ops", "show_lighter_margin_ratio")
+do_withdraw = _lazy("withdraw_ops", "do_withdraw")
+do_transfer = _lazy("transfer", "do_transfer")
+do_binance_subaccount_transfer = _lazy("transfer", "do_binance_subaccount_transfer")
+manage_earn = _lazy("earn", "manage_earn")
+do_stablecoin_trade = _lazy("trade", "do_stablecoin_trade")
+cancel_all_user_orders = _lazy("trade", "cancel_all_user_orders")
+spot_trade_menu = _lazy("trade", "spot_trade_menu")
+futures_trade_menu = _lazy("trade", "futures_trade_menu")
+buy_gt = _lazy("trade", "buy_gt")
+buy_bgb = _lazy("trade", "buy_bgb")
+manage_addresses = _lazy("addresses", "manage_addresses")
+manage_bnb_tools = _lazy("bnb_tools", "manage_bnb_tools")
+show_binance_funding_history = _lazy("funding", "show_binance_funding_history")
+show_aster_funding_history = _lazy("funding", "show_aster_funding_history")
+show_hyperliquid_funding_history = _lazy("funding", "show_hyperliquid_funding_history")
+show_lighter_funding_history = _lazy("funding", "show_lighter_funding_history")
+show_bybit_funding_history = _lazy("funding", "show_bybit_funding_history")
+show_combined_funding_summary = _lazy("funding", "show_combined_funding_summary")
+manage_vip_loan = _lazy("vip_loan", "manage_vip_loan")
+get_vip_loan_config = _lazy("vip_loan", "get_vip_loan_config")
+start_prefetch = _lazy("prefetch", "start_prefetch")
+cancel_prefetch = _lazy("prefetch", "cancel_prefetch")
+
+
+# 菜单项: (功能, {交易所类型: (显示名称, 操作)})，None 表示其他交易所的默认实现
+# 操作统一接收 (ec2_exchange, user_id)，菜单按此顺序显示
+MENU_ITEMS = [
+    ("balance", {
+        "hyperliquid": ("查询余额", lambda ex, u: show_hyperliquid_balance(ex)),
+        "lighter": ("查询余额", lambda ex, u: show_lighter_balance(ex)),
+        None: ("查询余额", lambda ex, u: show_balance(ex)),
+    }),
+    ("withdraw", {None: ("提现", lambda ex, u: do_withdraw(ex, u))}),
+    ("transfer", {
+        "hyperliquid": ("账户划转", lambda ex, u: do_hyperliquid_transfer(ex)),
+        None: ("账户划转", lambda ex, u: do_transfer(ex)),
+    }),
+    ("spot_trade", {None: ("现货交易", lambda ex, u: spot_trade_menu(ex))}),
+    ("futures_trade", {None: ("永续交易", lambda ex, u: futures_trade_menu(ex))}),
+    ("earn", {None: ("理财管理", lambda ex, u: manage_earn(ex))}),
+    ("position_analysis", {None: ("持仓分析", lambda ex, u: show_position_analysis(ex))}),
+    ("stablecoin_trade", {None: ("稳定币交易", lambda ex, u: do_stablecoin_trade(ex))}),
+    ("bnb_tools", {None: ("BNB工具", lambda ex, u: manage_bnb_tools(ex))}),
+    ("margin_ratio", {
+        "lighter": ("保证金率", lambda ex, u: show_lighter_margin_ratio(ex)),
+        "binance": ("统一保证金率", lambda ex, u: show_pm_ratio(ex)),
+        "bybit": ("统一保证金率", lambda ex, u: show_bybit_margin_ratio(ex)),
+        "aster": ("统一保证金率", lambda ex, u: show_aster_margin_ratio(ex)),
+    }),
+    ("funding_history", {
+        "hyperliquid": ("历史费率", lambda ex, u: show_hyperliquid_funding_history(u)),
+        "lighter": ("历史费率", lambda ex, u: show_lighter_funding_history(u)),
+        "binance": ("历史费率", lambda ex, u: show_binance_funding_history(ex)),
+        "bybit": ("历史费率", lambda ex, u: show_bybit_funding_history(ex)),
+        "aster": ("历史费率", lambda ex, u: show_aster_funding_history(ex)),
+    }),
+    ("subaccount_transfer", {None: ("子账户划转", lambda ex, u: do_binance_subaccount_transfer(ex))}),
+    ("buy_gt", {None: ("买入GT", lambda ex, u: buy_gt(ex))}),
+    ("gate_subaccounts", {None: ("子账户资产", lambda ex, u: show_gate_subaccounts())}),
+    ("buy_bgb", {None: ("买入BGB", lambda ex, u: buy_bgb(ex))}),
+    ("addresses", {None: ("管理地址簿", lambda ex, u: manage_addresses(ex, u))}),
+]
+
+
+def _build_menu_options(record) -> list:
+    """根据账户记录的功能集生成菜单 [(显示名称, 操作), ...]"""
+    ex, user_id = record.ec2_key, record.user_id
+    options = []
+    for capability, impls in MENU_ITEMS:
+        if capability not in record.capabilities:
+            continue
+        impl = impls.get(record.venue) or impls.get(None)
+        if impl is None:
+            continue
+        name, action = impl
+        options.append((name, lambda a=action: a(ex, user_id)))
+        # VIP 借贷 (按用户配置启用) 紧跟在 Binance 历史费率之后
+        if capability == "funding_history" and record.venue == "binance" and get_vip_loan_config(user_id):
+            options.append(("VIP借贷", lambda: manage_vip_loan(user_id, ex)))
+    return options
 
 
 def main():
@@ -53,13 +146,19 @@ def main():
             input("\n按回车继续...")
             continue
 
-        # 获取 EC2 使用的交易所 key
-        ec2_exchange = get_ec2_exchange_key(user_id, account_id)
-        exchange_base = get_exchange_base(ec2_exchange)
+        if account_id == "__cancel_all__":
+            cancel_all_user_orders(user_id)
+            input("\n按回车继续...")
+            continue
 
-        # 获取显示名称
-        accounts = get_user_accounts(user_id)
-        exchange_name = next((name for aid, name in accounts if aid == account_id), account_id.upper())
+        # 从账户路由表获取 EC2 key、交易所类型和可用功能
+        record = get_account_record(user_id, account_id)
+        if record is None:
+            continue
+        exchange_name = record.display.split(" - ")[0]
+
+        # 选中账户后立即在后台预取常用数据 (余额/持仓/挂单/交易规则)
+        start_prefetch(record)
 
         # 3. 显示功能菜单
         while True:
@@ -67,80 +166,8 @@ def main():
             print(f"    {user_name} - {exchange_name}")
             print("=" * 50)
 
-            # 根据交易所类型构建菜单
-            options = []
-
-            # Hyperliquid 和 Lighter 使用本地函数，其他交易所通过 EC2
-            if exchange_base == "hyperliquid":
-                options.append(("查询余额", lambda ex=ec2_exchange: show_hyperliquid_balance(ex)))
-                options.append(("账户划转", lambda ex=ec2_exchange: do_hyperliquid_transfer(ex)))
-                options.append(("历史费率", lambda u=user_id: show_hyperliquid_funding_history(u)))
-            elif exchange_base == "lighter":
-                options.append(("查询余额", lambda ex=ec2_exchange: show_lighter_balance(ex)))
-                options.append(("保证金率", lambda ex=ec2_exchange: show_lighter_margin_ratio(ex)))
-                options.append(("历史费率", lambda u=user_id: show_lighter_funding_history(u)))
-            else:
-                # 所有其他交易所都支持查询余额
-                options.append(("查询余额", lambda ex=ec2_exchange: show_balance(ex)))
-
-                # Aster 和 Gate 不支持提现，Frances/Vanie/李天一 禁用提现
-                if exchange_base not in ("aster", "gate") and user_id not in ("frances", "vanie", "litianyi"):
-                    options.append(("提现", lambda ex=ec2_exchange, u=user_id: do_withdraw(ex, u)))
-
-                # 账户划转 (Gate 不支持)
-                if exchange_base != "gate":
-                    options.append(("账户划转", lambda ex=ec2_exchange: do_transfer(ex)))
-
-                # 现货交易 (市价卖出 + 撤单)
-                options.append(("现货交易", lambda ex=ec2_exchange: spot_trade_menu(ex)))
-
-                # 永续交易 (平仓 + 撤单) - Binance / Bybit / Aster
-                if exchange_base in ("binance", "bybit", "aster"):
-                    options.append(("永续交易", lambda ex=ec2_exchange: futures_trade_menu(ex)))
-
-                # Binance / OKX 理财管理
-                if exchange_base in ("binance", "okx"):
-                    options.append(("理财管理", lambda ex=ec2_exchange: manage_earn(ex)))
-
-                # Binance 特有功能
-                if exchange_base == "binance":
-                    options.append(("持仓分析", lambda ex=ec2_exchange: show_position_analysis(ex)))
-                    if user_id != "litianyi":
-                        options.append(("稳定币交易", lambda ex=ec2_exchange: do_stablecoin_trade(ex)))
-                    options.append(("BNB工具", lambda ex=ec2_exchange: manage_bnb_tools(ex)))
-                    options.append(("统一保证金率", lambda ex=ec2_exchange: show_pm_ratio(ex)))
-                    options.append(("历史费率", lambda ex=ec2_exchange: show_binance_funding_history(ex)))
-                    # VIP 借贷 (仅 dennis 和 柏青)
-                    if get_vip_loan_config(user_id):
-                        options.append(("VIP借贷", lambda u=user_id, ex=ec2_exchange: manage_vip_loan(u, ex)))
-                    # 子账户划转 (仅 dennis)
-                    if user_id == "dennis":
-                        options.append(("子账户划转", lambda ex=ec2_exchange: do_binance_subaccount_transfer(ex)))
-
-                # Gate 特有功能
-                if exchange_base == "gate":
-                    options.append(("买入GT", lambda ex=ec2_exchange: buy_gt(ex)))
-                    options.append(("子账户资产", lambda: show_gate_subaccounts()))
-
-                # Bitget 特有功能
-                if exchange_base == "bitget":
-                    options.append(("买入BGB", lambda ex=ec2_exchange: buy_bgb(ex)))
-
-                # Bybit 特有功能
-                if exchange_base == "bybit":
-                    options.append(("稳定币交易", lambda ex=ec2_exchange: do_stablecoin_trade(ex)))
-                    options.append(("统一保证金率", lambda ex=ec2_exchange: show_bybit_margin_ratio(ex)))
-                    if user_id == "eb65":
-                        options.append(("历史费率", lambda ex=ec2_exchange: show_bybit_funding_history(ex)))
-
-                # Aster 特有功能
-                if exchange_base == "aster":
-                    options.append(("统一保证金率", lambda ex=ec2_exchange: show_aster_margin_ratio(ex)))
-                    options.append(("历史费率", lambda ex=ec2_exchange: show_aster_funding_history(ex)))
-
-                # 地址管理 (Aster 不需要，Frances/Vanie/李天一 禁用)
-                if exchange_base != "aster" and user_id not in ("frances", "vanie", "litianyi"):
-                    options.append(("管理地址簿", lambda ex=ec2_exchange, u=user_id: manage_addresses(ex, u)))
+            # 根据账户路由表中的功能集构建菜单
+            options = _build_menu_options(record)
 
             # 导航选项
             options.append(("切换用户/交易所", None))
@@ -155,7 +182,8 @@ def main():
                 print("\n再见!")
                 return
             elif action is None:
-                # 切换用户/交易所
+                # 切换用户/交易所，取消尚未完成的预取
+                cancel_prefetch()
                 break
             else:
                 action()
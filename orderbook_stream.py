@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""实时盘口 - 基于交易所增量深度推送在本地维护 L2 订单簿
+
+稳定币交易界面每次刷新都要通过 SSH 在 EC2 上拉一次 orderbook。这里改为本地订阅
+公开深度推送 (无需 API Key)：先取快照，再按更新序号应用增量；发现序号缺口时
+自动重新同步。订阅在进程内保持，刷新盘口和下单前估算成交价都不再需要网络往返。
+
+支持的市场:
+    binance_spot: 快照 REST /api/v3/depth + <symbol>@depth@100ms 增量 (U/u 序号)
+    bybit_spot:   orderbook.50.<symbol> 推送 snapshot/delta (u 序号)
+
+测试时可用 ReplayServer 在本地回放录制的推送，代替交易所行情源:
+    server = ReplayServer.from_file("usdc.jsonl").start()
+    stream = OrderBookStream("binance_spot", "USDCUSDT",
+                             ws_base=server.ws_base, rest_base=server.rest_base).start()
+"""
+
+import json
+import threading
+import time
+
+from http_client import http_get
+
+# 连接断开后的重连间隔 (秒)，逐次翻倍
+RECONNECT_DELAY = 1
+RECONNECT_DELAY_MAX = 30
+
+# 订阅失败后多久再尝试 (秒)，期间交易界面直接走 EC2 查询
+FAILED_RETRY_DELAY = 60
+
+# 等待首次同步完成的默认时长 (秒)
+READY_TIMEOUT = 3
+
+BINANCE_WS_BASE = "wss://stream.binance.com:9443"
+BINANCE_REST_BASE = "https://api.binance.com"
+BYBIT_WS_BASE = "wss://stream.bybit.com"
+
+
+class GapError(Exception):
+    """增量序号不连续，需要重新同步"""
+
+
+# ===================== 订单簿 =====================
+
+class L2Book:
+    """价格档位订单簿 {price: qty}，数量为 0 表示删除该档位"""
+
+    def __init__(self):
+        self.bids = {}
+        self.asks = {}
+        self.update_id = None
+
+    def reset(self, bids, asks, update_id):
+        self.bids = {float(p): float(q) for p, q in bids if float(q) > 0}
+        self.asks = {float(p): float(q) for p, q in asks if float(q) > 0}
+        self.update_id = update_id
+
+    def apply(self, bids, asks, update_id):
+        for side, levels in ((self.bids, bids), (self.asks, asks)):
+            for p, q in levels:
+                price, qty = float(p), float(q)
+                if qty > 0:
+                    side[price] = qty
+                else:
+                    side.pop(price, None)
+        self.update_id = update_id
+
+    def top(self, depth: int = 5):
+        """返回 (bids, asks)，各为 [(price, qty), ...]，从最优价开始"""
+        bids = sorted(self.bids.items(), reverse=True)[:depth]
+        asks = sorted(self.asks.items())[:depth]
+        return bids, asks
+
+    def estimate_fill(self, side: str, qty: float):
+        """按当前盘口估算市价单成交，返回 (均价, 可成交数量)
+
+        Args:
+            side: "buy" 吃卖盘，"sell" 吃买盘
+            qty: 基础币数量
+        """
+        levels = sorted(self.asks.items()) if side == "buy" else sorted(self.bids.items(), reverse=True)
+        remaining, cost = qty, 0.0
+        for price, level_qty in levels:
+            take = min(remaining, level_qty)
+            cost += take * price
+            remaining -= take
+            if remaining <= 0:
+                break
+        filled = qty - max(remaining, 0)
+        return (cost / filled if filled > 0 else 0.0), filled
+
+
+# ===================== 各交易所协议 =====================
+
+class _BinanceProtocol:
+    """Binance 现货增量深度: 先缓冲推送，再取快照，丢弃 u <= lastUpdateId 的事件，
+    之后每个事件须满足 U <= 上次 u + 1 <= u"""
+
+    def __init__(self, symbol: str, ws_base: str = None, rest_base: str = None):
+        self.symbol = symbol.upper()
+        self.ws_base = ws_base or BINANCE_WS_BASE
+        self.rest_base = rest_base or BINANCE_REST_BASE
+
+    @property
+    def url(self) -> str:
+        return f"{self.ws_base}/ws/{self.symbol.lower()}@depth@100ms"
+
+    def on_open(self, ws, book: L2Book):
+        book.update_id = None
+
+    def _load_snapshot(self, book: L2Book):
+        resp = http_get(f"{self.rest_base}/api/v3/depth",
+                        params={"symbol": self.symbol, "limit": 1000}, timeout=10)
+        resp.raise_for_status()
+        data = resp.json()
+        book.reset(data.get("bids", []), data.get("asks", []), int(data["lastUpdateId"]))
+
+    def handle(self, ws, book: L2Book, msg: dict) -> bool:
+        """处理一条推送，返回订单簿是否已同步"""
+        if msg.get("e") != "depthUpdate":
+            return book.update_id is not None
+        first_id, last_id = int(msg["U"]), int(msg["u"])
+
+        if book.update_id is None:
+            # 收到第一条增量后再取快照，保证快照不早于该增量
+            self._load_snapshot(book)
+            if book.update_id + 1 < first_id:
+                # 快照比推送还旧 (极少见)，下一条推送时重取
+                book.update_id = None
+                return False
+
+        if last_id <= book.update_id:
+            return True  # 快照已包含
+        if first_id > book.update_id + 1:
+            raise GapError(f"{self.symbol} 序号缺口: 期望 {book.update_id + 1}，收到 {first_id}")
+        book.apply(msg.get("b", []), msg.get("a", []), last_id)
+        return True
+
+    def resync(self, ws, book: L2Book):
+        # 下一条推送触发重新取快照
+        book.update_id = None
+
+    def keepalive(self, ws):
+        pass  # 服务端 ping，websocket-client 自动回 pong
+
+
+class _BybitProtocol:
+    """Bybit v5 现货 orderbook.50: snapshot 重置，delta 的 u 须连续；u=1 为服务重启后的快照"""
+
+    def __init__(self, symbol: str, ws_base: str = None, rest_base: str = None):
+        self.symbol = symbol.upper()
+        self.ws_base = ws_base or BYBIT_WS_BASE
+        self.topic = f"orderbook.50.{self.symbol}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.ws_base}/v5/public/spot"
+
+    def on_open(self, ws, book: L2Book):
+        book.update_id = None
+        ws.send(json.dumps({"op": "subscribe", "args": [self.topic]}))
+
+    def handle(self, ws, book: L2Book, msg: dict) -> bool:
+        if msg.get("topic") != self.topic:
+            return book.update_id is not None
+        data = msg.get("data", {})
+        update_id = int(data.get("u", 0))
+
+        if msg.get("type") == "snapshot" or update_id == 1:
+            book.reset(data.get("b", []), data.get("a", []), update_id)
+            return True
+        if book.update_id is None:
+            return False  # 等待快照
+        if update_id <= book.update_id:
+            return True
+        if update_id != book.update_id + 1:
+            raise GapError(f"{self.symbol} 序号缺口: 期望 {book.update_id + 1}，收到 {update_id}")
+        book.apply(data.get("b", []), data.get("a", []), update_id)
+        return True
+
+    def resync(self, ws, book: L2Book):
+        # 重新订阅，服务端会先推送一次完整快照
+        book.update_id = None
+        ws.send(json.dumps({"op": "unsubscribe", "args": [self.topic]}))
+        ws.send(json.dumps({"op": "subscribe", "args": [self.topic]}))
+
+    def keepalive(self, ws):
+        ws.send(json.dumps({"op": "ping"}))
+
+
+PROTOCOLS = {
+    "binance_spot": _BinanceProtocol,
+    "bybit_spot": _BybitProtocol,
+}
+
+
+# ===================== 订阅 =====================
+
+class OrderBookStream:
+    """后台线程维护一个交易对的实时订单簿"""
+
+    def __init__(self, venue: str, symbol: str, ws_base: str = None, rest_base: str = None):
+        if venue not in PROTOCOLS:
+            raise ValueError(f"不支持的市场: {venue}")
+        self.venue = venue
+        self.symbol = symbol.upper()
+        self.protocol = PROTOCOLS[venue](symbol, ws_base=ws_base, rest_base=rest_base)
+        self.book = L2Book()
+        self.resync_count = 0
+        self.last_update = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._ws = None
+        self._thread = None
+
+    def start(self) -> "OrderBookStream":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"book-{self.venue}-{self.symbol}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._ws is not None:
+            self._ws.close()
+
+    def wait_ready(self, timeout: float = READY_TIMEOUT) -> bool:
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        import websocket
+
+        delay = RECONNECT_DELAY
+        while not self._stopped.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.protocol.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+            )
+            keepalive = threading.Thread(target=self._keepalive, args=(self._ws,), daemon=True)
+            keepalive.start()
+            self._ws.run_forever(ping_interval=20, ping_timeout=10)
+            self._ready.clear()
+            if self._stopped.wait(delay):
+                break
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    def _keepalive(self, ws):
+        while not self._stopped.wait(20):
+            if ws is not self._ws:
+                return
+            try:
+                self.protocol.keepalive(ws)
+            except Exception:
+                return
+
+    def _on_open(self, ws):
+        with self._lock:
+            self.protocol.on_open(ws, self.book)
+
+    def _on_error(self, ws, error):
+        self.last_error = str(error)
+
+    def _on_message(self, ws, message):
+        try:
+            msg = json.loads(message)
+        except ValueError:
+            return
+        with self._lock:
+            try:
+                synced = self.protocol.handle(ws, self.book, msg)
+            except GapError as e:
+                self.last_error = str(e)
+                self.resync_count += 1
+                self._ready.clear()
+                self.protocol.resync(ws, self.book)
+                return
+            except Exception as e:
+                # 取快照失败等: 保持未同步状态，下一条推送时重试
+                self.last_error = str(e)
+                self.book.update_id = None
+                self._ready.clear()
+                return
+            if synced:
+                self.last_update = time.time()
+                self._ready.set()
+
+    # ---------- 读取 ----------
+
+    def snapshot(self, depth: int = 5) -> dict:
+        """当前盘口 {"bids", "asks", "update_id", "age"}，未同步时返回 None"""
+        with self._lock:
+            if not self._ready.is_set():
+                return None
+            bids, asks = self.book.top(depth)
+            return {
+                "bids": bids,
+                "asks": asks,
+                "update_id": self.book.update_id,
+                "age": time.time() - self.last_update,
+            }
+
+    def estimate_fill(self, side: str, qty: float):
+        """按本地盘口估算市价单 (均价, 可成交数量)，未同步时返回 None"""
+        with self._lock:
+            if not self._ready.is_set():
+                return None
+            return self.book.estimate_fill(side, qty)
+
+    def format(self, depth: int = 5) -> str:
+        """格式化盘口，用于交易界面显示"""
+        snap = self.snapshot(depth)
+        if snap is None:
+            return "盘口未同步"
+        lines = [f"📖 {self.symbol} 实时盘口 (本地维护，{snap['age']:.1f}秒前更新)"]
+        for i, (price, qty) in reversed(list(enumerate(snap["asks"], 1))):
+            lines.append(f"  卖{i} {price:>12.5f} {qty:>16,.2f}")
+        if snap["bids"] and snap["asks"]:
+            lines.append(f"  {'-' * 14} 价差 {snap['asks'][0][0] - snap['bids'][0][0]:.5f}")
+        for i, (price, qty) in enumerate(snap["bids"], 1):
+            lines.append(f"  买{i} {price:>12.5f} {qty:>16,.2f}")
+        return "\n".join(lines)
+
+
+_streams = {}  # (venue, symbol) -> OrderBookStream
+_failed = {}  # (venue, symbol) -> 失败时间
+_streams_lock = threading.Lock()
+
+
+def get_live_book(venue: str, symbol: str, wait: float = READY_TIMEOUT):
+    """获取已同步的实时订单簿 (首次调用时开始订阅，之后在后台持续维护)
+
+    订阅失败或 wait 秒内未完成同步时返回 None，调用方应回退到 EC2 查询；
+    FAILED_RETRY_DELAY 秒内不再重复尝试。
+    """
+    if venue not in PROTOCOLS:
+        return None
+    key = (venue, symbol.upper())
+    with _streams_lock:
+        if time.time() - _failed.get(key, 0) < FAILED_RETRY_DELAY:
+            return None
+        stream = _streams.get(key)
+        if stream is None:
+            try:
+                import websocket  # noqa: F401
+            except ImportError:
+                _failed[key] = time.time()
+                return None
+            stream = _streams[key] = OrderBookStream(venue, symbol).start()
+
+    if stream.wait_ready(wait):
+        return stream
+    with _streams_lock:
+        _failed[key] = time.time()
+    return None
+
+
+# ===================== REST 快照 =====================
+
+# 不支持推送或推送未同步时的 REST 深度快照接口: venue -> URL
+REST_DEPTH_URLS = {
+    "binance_spot": BINANCE_REST_BASE + "/api/v3/depth",
+    "bybit_spot": "https://api.bybit.com/v5/market/orderbook",
+    "gate_spot": "https://api.gateio.ws/api/v4/spot/order_book",
+    "bitget_spot": "https://api.bitget.com/api/v2/spot/market/orderbook",
+    "aster_spot": "https://sapi.asterdex.com/api/v1/depth",
+}
+
+
+def fetch_depth(venue: str, symbol: str, limit: int = 50) -> dict:
+    """REST 拉取一次公开盘口快照 {"bids": [(price, qty)], "asks": [...]}，失败抛出异常"""
+    url = REST_DEPTH_URLS.get(venue)
+    if url is None:
+        raise ValueError(f"不支持的市场: {venue}")
+    if venue == "bybit_spot":
+        params = {"category": "spot", "symbol": symbol, "limit": limit}
+    elif venue == "gate_spot":
+        params = {"currency_pair": symbol, "limit": limit}
+    else:
+        params = {"symbol": symbol, "limit": limit}
+    resp = http_get(url, params=params, timeout=10)
+    resp.raise_for_status()
+    data = resp.json()
+    if venue == "bybit_spot":
+        if data.get("retCode") != 0:
+            raise RuntimeError(data.get("retMsg", "查询盘口失败"))
+        data = {"bids": data["result"].get("b", []), "asks": data["result"].get("a", [])}
+    elif venue == "bitget_spot":
+        if data.get("code") != "00000":
+            raise RuntimeError(data.get("msg", "查询盘口失败"))
+        data = data.get("data") or {}
+    return {
+        "bids": [(float(level[0]), float(level[1])) for level in data.get("bids", [])],
+        "asks": [(float(level[0]), float(level[1])) for level in data.get("asks", [])],
+    }
+
+
+def get_book_snapshot(venue: str, symbol: str, depth: int = 20):
+    """当前盘口快照: 优先取实时订单簿，不可用时 REST 拉取，都失败返回 None"""
+    stream = get_live_book(venue, symbol)
+    snapshot = stream.snapshot(depth) if stream is not None else None
+    if snapshot:
+        return snapshot
+    try:
+        return fetch_depth(venue, symbol, depth)
+    except Exception:
+        return None
+
+
+# ===================== 录制与回放 =====================
+
+def record(venue: str, symbol: str, path: str, seconds: float = 60):
+    """录制原始推送到 JSONL 文件，供 ReplayServer 回放
+
+    每行 {"t": 相对秒数, "frame": 推送内容}；Binance 额外在首行写入 {"snapshot": REST 快照}
+    (在首条推送之后获取，与正常同步顺序一致)。
+    """
+    import websocket
+
+    protocol = PROTOCOLS[venue](symbol)
+    ws = websocket.create_connection(protocol.url, timeout=10)
+    book = L2Book()
+    frames = []
+    snapshot = None
+    start = time.time()
+    try:
+        protocol.on_open(ws, book)
+        while time.time() - start < seconds:
+            try:
+                message = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            frame = json.loads(message)
+            if venue == "binance_spot" and snapshot is None and frame.get("e") == "depthUpdate":
+                resp = http_get(f"{protocol.rest_base}/api/v3/depth",
+                                params={"symbol": protocol.symbol, "limit": 1000}, timeout=10)
+                snapshot = resp.json()
+            frames.append({"t": round(time.time() - start, 3), "frame": frame})
+    finally:
+        ws.close()
+
+    with open(path, "w", encoding="utf-8") as f:
+        if snapshot is not None:
+            f.write(json.dumps({"snapshot": snapshot}) + "\n")
+        for item in frames:
+            f.write(json.dumps(item) + "\n")
+    return len(frames)
+
+
+class ReplayServer:
+    """本地回放录制的深度推送 (websocket) 和快照 (HTTP)，代替交易所行情源
+
+    每个 websocket 连接从头按录制时的间隔 (除以 speed) 发送全部推送；
+    客户端发来的订阅消息被忽略。HTTP 任意路径都返回录制的快照。
+    """
+
+    def __init__(self, frames: list, snapshot: dict = None, speed: float = 1.0, host: str = "127.0.0.1"):
+        self.frames = frames
+        self.snapshot = snapshot or {}
+        self.speed = speed
+        self.host = host
+        self._ws_server = None
+        self._http_server = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplayServer":
+        frames, snapshot = [], None
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "snapshot" in item:
+                    snapshot = item["snapshot"]
+                else:
+                    frames.append(item)
+        return cls(frames, snapshot, **kwargs)
+
+    def _serve_ws(self, connection):
+        previous = 0.0
+        try:
+            for item in self.frames:
+                t = float(item.get("t", previous))
+                if t > previous and self.speed > 0:
+                    time.sleep((t - previous) / self.speed)
+                previous = t
+                connection.send(json.dumps(item["frame"]))
+            # 推送结束后保持连接，模拟无新成交的行情
+            for _ in connection:
+                pass
+        except Exception:
+            pass
+
+    def start(self) -> "ReplayServer":
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from websockets.sync.server import serve
+
+        snapshot_body = json.dumps(self.snapshot).encode("utf-8")
+
+        class _SnapshotHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(snapshot_body)))
+                self.end_headers()
+                self.wfile.write(snapshot_body)
+
+            def log_message(self, *args):
+                pass
+
+        self._http_server = ThreadingHTTPServer((self.host, 0), _SnapshotHandler)
+        threading.Thread(target=self._http_server.serve_forever, daemon=True).start()
+        self._ws_server = serve(self._serve_ws, self.host, 0)
+        threading.Thread(target=self._ws_server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def ws_base(self) -> str:
+        return f"ws://{self.host}:{self._ws_server.socket.getsockname()[1]}"
+
+    @property
+    def rest_base(self) -> str:
+        return f"http://{self.host}:{self._http_server.server_address[1]}"
+
+    def stop(self):
+        if self._ws_server:
+            self._ws_server.shutdown()
+        if self._http_server:
+            self._http_server.shutdown()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 5 and sys.argv[1] == "record":
+        # python orderbook_stream.py record binance_spot USDCUSDT usdc.jsonl [秒数]
+        seconds = float(sys.argv[5]) if len(sys.argv) > 5 else 60
+        count = record(sys.argv[2], sys.argv[3], sys.argv[4], seconds)
+        print(f"✅ 已录制 {count} 条推送 -> {sys.argv[4]}")
+    elif len(sys.argv) >= 3:
+        # python orderbook_stream.py binance_spot USDCUSDT
+        stream = OrderBookStream(sys.argv[1], sys.argv[2]).start()
+        try:
+            while True:
+                if stream.wait_ready(5):
+                    print("\n" + stream.format())
+                else:
+                    print(f"⏳ 等待同步... {stream.last_error or ''}")
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stream.stop()
+    else:
+        print("用法: python orderbook_stream.py <venue> <symbol>")
+        print("      python orderbook_stream.py record <venue> <symbol> <file> [秒数]")
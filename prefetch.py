@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""预取 - 选中账户后在后台预热该账户的常用数据
+
+操作员选好用户/账户后通常要先看一会儿菜单，这段时间 EC2 连接是空闲的，之后每个
+操作又都从冷启动开始查询。选中账户时立即在后台:
+
+    ssh              建立 SSH ControlMaster / 常驻 worker
+    balance          查询余额页面的数据
+    wallet_snapshot  全部钱包余额快照 (提现页面)
+    positions        永续持仓
+    symbols          交易对规则 (下单取整)
+
+结果写入 snapshot_cache (交易规则写入 symbol_filters 的缓存)，各操作先查缓存。
+切换账户时取消上一个账户尚未开始的预取任务；已经在执行的远端命令无法中断，
+其结果仍按原账户写入缓存。预取失败静默忽略，操作时会重新查询并报错。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import snapshot_cache
+
+# 预取并发数
+PREFETCH_WORKERS = 4
+
+# 使用本地 SDK 查询的交易所，不经过 EC2，不预取
+LOCAL_VENUES = ("hyperliquid", "lighter")
+
+
+def _warm_balance(ec2_key: str):
+    from balance import _fetch_balance_view
+    snapshot_cache.get(ec2_key, "balance", lambda: _fetch_balance_view(ec2_key))
+
+
+def _warm_wallet_snapshot(ec2_key: str):
+    from ec2_schema import fetch_wallet_snapshot
+    snapshot_cache.get(ec2_key, "wallet_snapshot", lambda: fetch_wallet_snapshot(ec2_key))
+
+
+def _warm_positions(ec2_key: str):
+    from trade import fetch_um_positions
+    snapshot_cache.get(ec2_key, "um_positions", lambda: fetch_um_positions(ec2_key))
+
+
+def _warm_symbols(ec2_key: str, markets: tuple):
+    from symbol_filters import get_venue, warm_venue
+    for market in markets:
+        venue = get_venue(ec2_key, market)
+        if venue:
+            warm_venue(venue, quiet=True)
+
+
+def plan_tasks(record) -> list:
+    """根据账户记录的功能集生成预取任务 [(名称, fn)]，按执行顺序"""
+    if record.venue in LOCAL_VENUES:
+        return []
+    from utils import warm_ec2_connection
+
+    ec2_key, caps = record.ec2_key, record.capabilities
+    markets = ("spot", "futures") if "futures_trade" in caps else ("spot",)
+    tasks = [("ssh", warm_ec2_connection)]
+    if "balance" in caps:
+        tasks.append(("balance", lambda: _warm_balance(ec2_key)))
+    if "withdraw" in caps:
+        tasks.append(("wallet_snapshot", lambda: _warm_wallet_snapshot(ec2_key)))
+    if caps & {"futures_trade", "position_analysis"}:
+        tasks.append(("positions", lambda: _warm_positions(ec2_key)))
+    if caps & {"spot_trade", "futures_trade"}:
+        tasks.append(("symbols", lambda: _warm_symbols(ec2_key, markets)))
+    return tasks
+
+
+class Prefetcher:
+    """单个账户的一轮预取，cancel() 后未开始的任务不再执行"""
+
+    def __init__(self, record):
+        self.account = record.ec2_key
+        self.status = {}  # 任务名称 -> pending / running / done / error / cancelled
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._tasks = plan_tasks(record)
+
+    def _run(self, name: str, fn):
+        if self._cancelled.is_set():
+            self._set(name, "cancelled")
+            return
+        self._set(name, "running")
+        try:
+            fn()
+        except Exception:
+            self._set(name, "error")
+            return
+        self._set(name, "done")
+
+    def _set(self, name: str, state: str):
+        with self._lock:
+            self.status[name] = state
+
+    def start(self):
+        if not self._tasks:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        # SSH 连接先建立，其余查询复用同一条通道
+        ssh_tasks = [(n, fn) for n, fn in self._tasks if n == "ssh"]
+        other_tasks = [(n, fn) for n, fn in self._tasks if n != "ssh"]
+        for name, _ in self._tasks:
+            self._set(name, "pending")
+
+        def run_all():
+            for name, fn in ssh_tasks:
+                self._run(name, fn)
+            for name, fn in other_tasks:
+                try:
+                    if self._cancelled.is_set():
+                        raise RuntimeError("cancelled")
+                    self._executor.submit(self._run, name, fn)
+                except RuntimeError:
+                    # 已取消 (线程池已关闭)
+                    self._set(name, "cancelled")
+            self._executor.shutdown(wait=False)
+
+        threading.Thread(target=run_all, name=f"prefetch-{self.account}", daemon=True).start()
+
+    def cancel(self):
+        """取消尚未开始的任务 (已在执行的远端命令无法中断)"""
+        self._cancelled.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for name, state in self.status.items():
+                if state == "pending":
+                    self.status[name] = "cancelled"
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def start_prefetch(record) -> Prefetcher:
+    """选中账户后开始预取，同时取消上一个账户的预取"""
+    global _current
+    prefetcher = Prefetcher(record)
+    with _current_lock:
+        if _current is not None:
+            _current.cancel()
+        _current = prefetcher
+    prefetcher.start()
+    return prefetcher
+
+
+def cancel_prefetch():
+    """取消当前账户的预取 (切换用户/交易所时调用)"""
+    global _current
+    with _current_lock:
+        if _current is not None:
+            _current.cancel()
+            _current = None
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""币价服务 - 一次批量拉取 Binance 全量行情，内存 + 磁盘 TTL 缓存
+
+取代逐币请求 /api/v3/ticker/price?symbol=... 的做法：持有几十个小币的账户
+原来需要上百次 HTTP 请求，现在整张价格表只拉取一次，之后 O(1) 查询。
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+
+from http_client import http_get
+from utils import BASE_DIR, load_config
+
+BINANCE_TICKER_URL = "https://api.binance.com/api/v3/ticker/price"
+
+# 稳定币列表，价格视为 1 USD
+STABLECOINS = ['USDT', 'USDC', 'USD1', 'BUSD', 'TUSD', 'FDUSD']
+
+# 计价币回退顺序
+QUOTE_ASSETS = ("USDT", "BUSD", "FDUSD", "USDC")
+
+# 默认缓存有效期 (秒)，可在 config.json 中通过 "price_cache_ttl" 覆盖
+DEFAULT_PRICE_TTL = 60
+
+# 拉取失败后的重试间隔 (秒)，避免逐币查询时反复请求、反复报错
+FAIL_RETRY_DELAY = 10
+
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+PRICE_CACHE_FILE = os.path.join(CACHE_DIR, "prices.json")
+
+_prices = {}
+_fetched_at = 0.0
+_ttl = None
+_retry_after = 0.0
+_lock = threading.Lock()
+
+
+def get_price_ttl() -> float:
+    """获取价格缓存有效期 (秒)，首次调用时从配置读取"""
+    global _ttl
+    if _ttl is None:
+        try:
+            _ttl = float(load_config().get("price_cache_ttl", DEFAULT_PRICE_TTL))
+        except (TypeError, ValueError):
+            _ttl = DEFAULT_PRICE_TTL
+    return _ttl
+
+
+def _load_disk_cache():
+    """读取磁盘缓存，返回 (prices, fetched_at)，不存在或损坏时返回空表"""
+    try:
+        with open(PRICE_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("prices", {}), float(data.get("fetched_at", 0))
+    except (OSError, ValueError, TypeError, AttributeError):
+        return {}, 0.0
+
+
+def _save_disk_cache(prices: dict, fetched_at: float):
+    """写入磁盘缓存 (先写临时文件再替换，避免并发读到半个文件)"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = PRICE_CACHE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": fetched_at, "prices": prices}, f)
+        os.replace(tmp, PRICE_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def _fetch_all_prices() -> dict:
+    """一次请求拉取全部交易对价格 {symbol: price}"""
+    resp = http_get(BINANCE_TICKER_URL, timeout=10)
+    resp.raise_for_status()
+    prices = {}
+    for item in resp.json():
+        try:
+            prices[item["symbol"]] = float(item["price"])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return prices
+
+
+def get_price_table(force: bool = False) -> dict:
+    """获取价格表 {symbol: price}，过期时重新拉取
+
+    拉取失败时沿用已有的 (可能过期的) 缓存，都没有则返回空表。
+    """
+    global _prices, _fetched_at, _retry_after
+    ttl = get_price_ttl()
+
+    with _lock:
+        now = time.time()
+        if not force and _prices and now - _fetched_at < ttl:
+            return _prices
+
+        if not force and not _prices:
+            disk_prices, disk_fetched_at = _load_disk_cache()
+            if disk_prices:
+                _prices, _fetched_at = disk_prices, disk_fetched_at
+                if now - _fetched_at < ttl:
+                    return _prices
+
+        if not force and now < _retry_after:
+            return _prices
+
+        try:
+            prices = _fetch_all_prices()
+        except requests.exceptions.Timeout:
+            print("⚠️  获取币价超时")
+            _retry_after = now + FAIL_RETRY_DELAY
+            return _prices
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️  获取币价失败: {e}")
+            _retry_after = now + FAIL_RETRY_DELAY
+            return _prices
+        except ValueError as e:
+            print(f"⚠️  解析币价失败: {e}")
+            _retry_after = now + FAIL_RETRY_DELAY
+            return _prices
+
+        if prices:
+            _prices, _fetched_at = prices, now
+            _save_disk_cache(prices, now)
+        return _prices
+
+
+def get_price(coin: str) -> float:
+    """获取币种对 USD 的价格，稳定币返回 1，未知币种返回 0
+
+    按 USDT → BUSD → FDUSD → USDC 顺序在同一张价格表中查找，不产生额外请求。
+    """
+    coin = coin.upper()
+    if coin in STABLECOINS:
+        return 1.0
+
+    return _lookup(get_price_table(), coin)
+
+
+def get_prices(coins) -> dict:
+    """批量查询多个币种价格 {coin: price}，整批只取一次价格表"""
+    table = get_price_table()
+    result = {}
+    for coin in coins:
+        coin = coin.upper()
+        result[coin] = 1.0 if coin in STABLECOINS else _lookup(table, coin)
+    return result
+
+
+def _lookup(table: dict, coin: str) -> float:
+    for quote in QUOTE_ASSETS:
+        price = table.get(coin + quote)
+        if price:
+            return price
+    return 0.0
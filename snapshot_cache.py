@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""账户快照缓存 - 按 (账户, 数据类型) 缓存余额/持仓，过期后先显示旧数据再后台刷新
+
+各菜单页面 (查询余额、持仓分析、市价卖出列表……) 原来每次都阻塞等待 EC2 实时查询，
+即使几秒前另一个页面刚查过同样的数据。缓存策略为 stale-while-revalidate:
+
+    未过期            直接返回缓存
+    已过期 (< MAX_STALE)  立即返回旧数据并标注时间，同时在后台线程刷新
+    没有缓存/太旧       同步查询
+
+划转、提现、下单、撤单等写操作执行后 (utils.run_on_ec2 等统一调用
+invalidate_for_command)，对应账户的全部快照作废，下次显示时重新查询。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+
+# 各数据类型的默认有效期 (秒)，可在 config.json 中通过 "snapshot_ttl": {"balance": 60} 覆盖
+# 数据类型可带 ":" 后缀细分 (如 "orders:spot_orders")，有效期按 ":" 之前的部分查找
+DEFAULT_TTLS = {
+    "balance": 30,
+    "wallet_snapshot": 30,
+    "spot_balances": 30,
+    "um_positions": 10,
+    "orders": 20,
+}
+DEFAULT_TTL = 30
+
+# 超过该时长的旧数据不再展示，改为同步查询
+MAX_STALE = 600
+
+# 后台刷新线程数
+REFRESH_WORKERS = 2
+
+# 只读命令: 执行后不影响账户快照，其余命令一律视为写操作
+READ_ONLY_COMMANDS = frozenset({
+    "balance", "account_balance", "wallet_snapshot", "spot_balance",
+    "aster_spot_assets", "bitget_spot_assets", "gate_spot_assets",
+    "portfolio_um_positions", "bybit_positions", "aster_positions_json",
+    "open_orders", "spot_orders", "gate_spot_orders", "bitget_spot_orders", "aster_spot_orders",
+    "aster_orders", "bybit_open_orders", "portfolio_um_orders", "futures_orders",
+    "orderbook", "funding_rate",
+    "pm_ratio", "pm_max_withdraw", "aster_margin_ratio",
+    "bnb_price", "bnb_burn_status", "dust_list",
+    "gate_subaccounts", "gate_list_subaccounts", "gate_subaccount_balance",
+    "bitget_list_subaccounts", "binance_subaccount_assets",
+    "vip_loan_orders", "vip_loan_rates",
+})
+
+# 带子命令的命令中只读的子命令 (如 earn position)
+READ_ONLY_SUBCOMMANDS = {
+    "earn": frozenset({"position", "quota", "history"}),
+}
+
+# 账户参数不在第二个位置的命令: 命令 -> 账户参数位置 (earn <子命令> <账户> ...)
+ACCOUNT_ARG_INDEX = {
+    "earn": 2,
+}
+
+# 参数为子账户 UID 的命令: 命令 -> 母账户的交易所类型 (作废该交易所的全部账户)
+SUBACCOUNT_COMMANDS = {
+    "gate_subaccount_transfer": "gate",
+}
+
+
+class Snapshot(NamedTuple):
+    """一份缓存数据"""
+    value: Any
+    fetched_at: float
+    refreshing: bool = False  # 是否正在后台刷新
+
+    @property
+    def age(self) -> float:
+        return max(time.time() - self.fetched_at, 0.0)
+
+
+_entries = {}      # (account, kind) -> Snapshot
+_generations = {}  # (account, kind) -> 作废次数，刷新结果仅在期间未作废时写入
+_inflight = {}     # (account, kind) -> Future
+_ttls = None
+_lock = threading.Lock()
+_executor = None
+
+
+def get_ttl(kind: str) -> float:
+    """数据类型的有效期 (秒)，首次调用时从配置读取"""
+    global _ttls
+    if _ttls is None:
+        from utils import load_config
+        ttls = dict(DEFAULT_TTLS)
+        try:
+            for k, v in (load_config().get("snapshot_ttl") or {}).items():
+                ttls[k] = float(v)
+        except (AttributeError, TypeError, ValueError):
+            pass
+        _ttls = ttls
+    return _ttls.get(kind, _ttls.get(kind.split(":", 1)[0], DEFAULT_TTL))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="snapshot")
+    return _executor
+
+
+def _store(key, generation: int, value):
+    """写入查询结果 (查询期间账户被写操作作废时丢弃)"""
+    with _lock:
+        if _generations.get(key, 0) == generation:
+            _entries[key] = Snapshot(value, time.time())
+
+
+def _refresh(key, fetch, generation: int):
+    try:
+        _store(key, generation, fetch())
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def get(account: str, kind: str, fetch, fresh: bool = False, stale_ok: bool = True) -> Snapshot:
+    """获取快照 (stale-while-revalidate)
+
+    Args:
+        account: 账户 (EC2 交易所 key)
+        kind: 数据类型 (见 DEFAULT_TTLS)
+        fetch: 无参数的查询函数，失败时抛出异常 (不会缓存失败结果)
+        fresh: 强制同步查询 (下单前确认数量等场景)
+        stale_ok: 是否接受过期数据 (False 时只用有效期内的缓存，如撤单前的挂单列表)
+
+    Returns:
+        Snapshot；同步查询失败时抛出 fetch 的异常，后台刷新失败则保留旧数据
+    """
+    key = (account, kind)
+    with _lock:
+        entry = _entries.get(key)
+        # 先登记 key，同步查询期间发生的作废也能使本次结果失效
+        generation = _generations.setdefault(key, 0)
+        if entry is not None and not fresh:
+            age = time.time() - entry.fetched_at
+            if age < get_ttl(kind):
+                return entry
+            if stale_ok and age < MAX_STALE:
+                if key not in _inflight:
+                    _inflight[key] = _get_executor().submit(_refresh, key, fetch, generation)
+                return entry._replace(refreshing=True)
+
+    value = fetch()
+    _store(key, generation, value)
+    return Snapshot(value, time.time())
+
+
+def peek(account: str, kind: str):
+    """返回已缓存的快照 (不查询、不刷新)，没有时返回 None"""
+    with _lock:
+        return _entries.get((account, kind))
+
+
+def invalidate(account: str, kinds=None):
+    """作废账户的快照 (kinds 为 None 时作废全部类型)"""
+    with _lock:
+        keys = {k for k in list(_entries) + list(_inflight) + list(_generations) if k[0] == account}
+        if kinds is not None:
+            keys = {k for k in keys if k[1] in kinds}
+            keys.update((account, kind) for kind in kinds)
+        for key in keys:
+            _entries.pop(key, None)
+            _generations[key] = _generations.get(key, 0) + 1
+
+
+def _invalidate_where(predicate):
+    """作废 predicate(account) 为真的全部账户的快照"""
+    with _lock:
+        accounts = {k[0] for k in list(_entries) + list(_inflight) + list(_generations)}
+    for account in accounts:
+        if predicate(account):
+            invalidate(account)
+
+
+def invalidate_for_command(cmd: str):
+    """EC2 命令执行后调用: 写操作作废对应账户的快照
+
+    账户默认取命令的第二个参数 ("<命令> <账户> ...")，earn 等子命令形式见 ACCOUNT_ARG_INDEX，
+    子账户操作作废母账户所在交易所的全部账户；无法确定账户的写命令作废全部快照。
+    """
+    from utils import get_exchange_base, get_exchanges
+
+    parts = cmd.split()
+    if not parts or parts[0] in READ_ONLY_COMMANDS:
+        return
+    verb = parts[0]
+    if len(parts) > 1 and parts[1] in READ_ONLY_SUBCOMMANDS.get(verb, ()):
+        return
+    if verb in SUBACCOUNT_COMMANDS:
+        venue = SUBACCOUNT_COMMANDS[verb]
+        _invalidate_where(lambda account: get_exchange_base(account) == venue)
+        return
+
+    index = ACCOUNT_ARG_INDEX.get(verb, 1)
+    account = parts[index] if len(parts) > index else None
+    if account is not None and account in {key for key, _ in get_exchanges()}:
+        invalidate(account)
+    else:
+        clear()
+
+
+def clear():
+    """清空全部快照 (正在查询的结果也作废)"""
+    with _lock:
+        for key in set(_entries) | set(_inflight) | set(_generations):
+            _generations[key] = _generations.get(key, 0) + 1
+        _entries.clear()
+
+
+def format_age(snapshot: Snapshot) -> str:
+    """快照时间说明，如 "🕒 数据截至 12 秒前 (后台刷新中)"；刚查询的数据返回空字符串"""
+    age = snapshot.age
+    if age < 1 and not snapshot.refreshing:
+        return ""
+    if age < 60:
+        text = f"{age:.0f} 秒前"
+    else:
+        text = f"{age / 60:.0f} 分钟前"
+    suffix = " (后台刷新中)" if snapshot.refreshing else ""
+    return f"🕒 数据截至 {text}{suffix}"
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""稳定币智能路由 - 跨交易所、跨账户计算最优成交路径并并发下单
+
+手动换汇时要先选一个账户、一个交易对。路由器一次并发拉取所有可用交易所的
+公开盘口和所有账户的余额 (一轮并行查询)，把目标数量按有效价格从优到劣分配到
+各账户，需要时先从资金钱包划转到交易钱包，最后各账户子单并发执行。
+
+plan_route() 是纯函数，只依赖传入的盘口和余额，可直接用固定的盘口数据测试:
+    books = load_books("books.json")
+    route = plan_route("buy", 50000, books, accounts)
+"""
+
+import json
+import math
+
+from orderbook_stream import fetch_depth
+from utils import (
+    run_on_ec2_many, run_parallel, select_option, select_multiple, input_amount,
+    get_exchanges, get_exchange_base, SSHError
+)
+
+# 盘口深度档数
+BOOK_DEPTH = 50
+
+# 稳定币交易对 taker 手续费 (基点)，按账户实际费率调整
+TAKER_FEE_BPS = {
+    "binance_spot": 0.0,
+    "bybit_spot": 0.0,
+}
+
+# 需要划转才能使用的余额，每单位额外计入的成本 (基点)，同价时优先使用交易钱包余额
+TRANSFER_PENALTY_BPS = 0.5
+
+# 买入时为价格取整和手续费多划转的比例
+TRANSFER_BUFFER = 0.001
+
+# 各交易所的交易钱包、可划转来源钱包及划转命令参数
+# balance: account_balance 的账户类型；transfer: transfer 命令的 (from, to)
+WALLETS = {
+    "binance": {"balance": "SPOT", "source": "UNIFIED", "transfer": ("PORTFOLIO_MARGIN", "MAIN")},
+    "bybit": {"balance": "UNIFIED", "source": "FUND", "transfer": ("FUND", "UNIFIED")},
+}
+
+
+def get_routes(base: str, side: str) -> list:
+    """可交易 base/USDT 的 venue 列表 [{"venue", "symbol", "exchange_base"}]"""
+    from trade import STABLE_PAIRS
+    routes = []
+    if base in STABLE_PAIRS:
+        routes.append({"venue": "binance_spot", "symbol": STABLE_PAIRS[base]["symbol"], "exchange_base": "binance"})
+    if base == "USDC" and side == "buy":
+        # Bybit 只有买入 USDC 的下单命令
+        routes.append({"venue": "bybit_spot", "symbol": "USDCUSDT", "exchange_base": "bybit"})
+    return routes
+
+
+# ===================== 盘口 =====================
+
+def fetch_book(venue: str, symbol: str) -> dict:
+    """REST 拉取公开盘口 {"bids": [(price, qty)], "asks": [...]}"""
+    return fetch_depth(venue, symbol, BOOK_DEPTH)
+
+
+def load_books(path: str) -> dict:
+    """读取盘口数据文件 {"<venue>:<symbol>": {"bids": [[p, q]], "asks": [...]}}"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    books = {}
+    for key, book in data.items():
+        venue, symbol = key.split(":", 1)
+        books[(venue, symbol)] = {
+            "bids": [(float(p), float(q)) for p, q in book.get("bids", [])],
+            "asks": [(float(p), float(q)) for p, q in book.get("asks", [])],
+        }
+    return books
+
+
+# ===================== 路径计算 =====================
+
+def _round_down(qty: float, step, min_qty: float) -> float:
+    if step:
+        qty = math.floor(qty / step + 1e-9) * step
+        if step >= 1:
+            qty = int(qty)
+    else:
+        qty = math.floor(qty * 10000) / 10000
+    return qty if qty > 0 and qty >= min_qty else 0
+
+
+def plan_route(side: str, qty: float, books: dict, accounts: list, fee_bps: dict = None,
+               transfer_penalty_bps: float = TRANSFER_PENALTY_BPS) -> dict:
+    """计算最优成交路径
+
+    每个账户的余额分为交易钱包 (直接可用) 和来源钱包 (需先划转) 两部分。把所有
+    (盘口档位, 钱包) 组合按有效价格 (含手续费和划转成本) 从优到劣排序后依次分配；
+    同一 venue 的多个账户共享同一份盘口深度。
+
+    Args:
+        side: "buy" 用 USDT 买入稳定币 / "sell" 卖出稳定币换 USDT
+        qty: 目标数量 (稳定币)
+        books: {(venue, symbol): {"bids", "asks"}}
+        accounts: [{"exchange", "display", "venue", "symbol", "balance", "source_balance",
+                    "step", "min_qty"}]，余额为支出币种 (买入为 USDT，卖出为稳定币)
+        fee_bps: venue -> taker 手续费基点，默认 TAKER_FEE_BPS
+
+    Returns:
+        {"side", "qty", "filled", "notional", "fees", "avg_price", "shortfall",
+         "legs": [{"exchange", "display", "venue", "symbol", "qty", "limit_price",
+                   "notional", "transfer"}]}
+    """
+    fee_bps = TAKER_FEE_BPS if fee_bps is None else fee_bps
+    book_side = "asks" if side == "buy" else "bids"
+    sign = 1 if side == "buy" else -1
+
+    # (有效价格, 账户序号, 是否需划转, 档位)
+    candidates = []
+    capacity = {}
+    for i, account in enumerate(accounts):
+        levels = (books.get((account["venue"], account["symbol"])) or {}).get(book_side) or []
+        fee = fee_bps.get(account["venue"], 0) / 10000
+        for transfer, amount in ((False, account["balance"]), (True, account.get("source_balance", 0))):
+            if amount <= 0:
+                continue
+            capacity[(i, transfer)] = amount
+            penalty = transfer_penalty_bps / 10000 if transfer else 0
+            for level, (price, _) in enumerate(levels):
+                effective = price * (1 + sign * fee) + sign * price * penalty
+                candidates.append((effective * sign, i, transfer, level))
+    candidates.sort()
+
+    level_left = {}
+    allocations = {}
+    remaining = float(qty)
+    for _, i, transfer, level in candidates:
+        if remaining <= 1e-9:
+            break
+        account = accounts[i]
+        key = (account["venue"], account["symbol"])
+        price, level_qty = books[key][book_side][level]
+        left = level_left.get((key, level), level_qty)
+        cap = capacity[(i, transfer)]
+        if left <= 1e-9 or cap <= 1e-9:
+            continue
+        fee = fee_bps.get(account["venue"], 0) / 10000
+        cap_qty = cap / (price * (1 + fee)) if side == "buy" else cap
+        take = min(remaining, left, cap_qty)
+        level_left[(key, level)] = left - take
+        capacity[(i, transfer)] = cap - (take * price * (1 + fee) if side == "buy" else take)
+        remaining -= take
+
+        alloc = allocations.setdefault(i, {"qty": 0.0, "notional": 0.0, "limit_price": price})
+        alloc["qty"] += take
+        alloc["notional"] += take * price
+        alloc["limit_price"] = max(alloc["limit_price"], price) if side == "buy" else min(alloc["limit_price"], price)
+
+    # 按交易规则取整；子单以最差档位价格限价成交，按该价格计算所需划转
+    legs = []
+    filled = notional = fees = 0.0
+    for i, alloc in sorted(allocations.items()):
+        account = accounts[i]
+        leg_qty = _round_down(alloc["qty"], account.get("step"), account.get("min_qty", 0))
+        if not leg_qty:
+            continue
+        fee = fee_bps.get(account["venue"], 0) / 10000
+        leg_notional = alloc["notional"] * leg_qty / alloc["qty"]
+        if side == "buy":
+            need = leg_qty * alloc["limit_price"] * (1 + fee) * (1 + TRANSFER_BUFFER)
+        else:
+            need = leg_qty
+        transfer = 0.0
+        if need > account["balance"]:
+            transfer = min(math.ceil((need - account["balance"]) * 100) / 100, account.get("source_balance", 0))
+        legs.append({
+            "exchange": account["exchange"],
+            "display": account["display"],
+            "venue": account["venue"],
+            "symbol": account["symbol"],
+            "qty": leg_qty,
+            "limit_price": alloc["limit_price"],
+            "notional": leg_notional,
+            "transfer": transfer,
+        })
+        filled += leg_qty
+        notional += leg_notional
+        fees += leg_notional * fee
+
+    return {
+        "side": side,
+        "qty": float(qty),
+        "filled": filled,
+        "notional": notional,
+        "fees": fees,
+        "avg_price": notional / filled if filled else 0.0,
+        "shortfall": max(float(qty) - filled, 0.0),
+        "legs": legs,
+    }
+
+
+# ===================== 报价与执行 =====================
+
+def quote(base: str, side: str, exchanges: list, fetch=fetch_book) -> tuple:
+    """一轮并行查询所有 venue 的盘口和所有账户余额
+
+    Args:
+        exchanges: [(ec2_key, display), ...]
+        fetch: 盘口查询函数 fetch(venue, symbol)
+
+    Returns:
+        (books, accounts, errors)
+    """
+    from trade import STABLE_PAIRS
+
+    routes = {r["exchange_base"]: r for r in get_routes(base, side)}
+    eligible = [(key, display) for key, display in exchanges if get_exchange_base(key) in routes]
+    spend = "USDT" if side == "buy" else base
+
+    cmds = []
+    for key, _ in eligible:
+        wallets = WALLETS[get_exchange_base(key)]
+        cmds.append(f"account_balance {key} {wallets['balance']} {spend}")
+        cmds.append(f"account_balance {key} {wallets['source']} {spend}")
+
+    tasks = [((r["venue"], r["symbol"]), lambda r=r: fetch(r["venue"], r["symbol"])) for r in routes.values()]
+    if cmds:
+        tasks.append(("balances", lambda: run_on_ec2_many(cmds)))
+
+    books, errors, balances = {}, [], []
+    for key, result, error in run_parallel(tasks):
+        if error:
+            errors.append(f"{key}: {error}")
+        elif key == "balances":
+            balances = result
+        else:
+            books[key] = result
+
+    pair = STABLE_PAIRS.get(base, {})
+    accounts = []
+    for n, (key, display) in enumerate(eligible):
+        if not balances:
+            break
+        direct, source = balances[2 * n], balances[2 * n + 1]
+        if direct["error"]:
+            errors.append(f"{display}: {direct['error']}")
+            continue
+        route = routes[get_exchange_base(key)]
+        accounts.append({
+            "exchange": key,
+            "display": display,
+            "venue": route["venue"],
+            "symbol": route["symbol"],
+            "balance": _to_float(direct["output"]),
+            "source_balance": 0.0 if source["error"] else _to_float(source["output"]),
+            "step": pair.get("step"),
+            "min_qty": pair.get("min_qty", 0),
+        })
+    return books, accounts, errors
+
+
+def _to_float(output: str) -> float:
+    try:
+        return max(float(output.strip()), 0.0)
+    except ValueError:
+        return 0.0
+
+
+def _order_cmd(base: str, side: str, leg: dict) -> str:
+    from trade import STABLE_PAIRS, _pair_order_cmd
+    if leg["venue"] == "bybit_spot":
+        return f"buy_usdc {leg['exchange']} limit {leg['qty']} {leg['limit_price']}"
+    return _pair_order_cmd(STABLE_PAIRS[base], leg["exchange"], side, leg["qty"], leg["limit_price"])
+
+
+def execute_route(base: str, route: dict) -> list:
+    """执行路由: 先并发完成所有划转，再并发下单 (划转失败的账户不下单)
+
+    Returns:
+        [{"leg", "ok", "output"}]，与 route["legs"] 对应
+    """
+    from trade import _order_failed
+
+    side = route["side"]
+    spend = "USDT" if side == "buy" else base
+    legs = route["legs"]
+    results = [{"leg": leg, "ok": True, "output": ""} for leg in legs]
+
+    transfers = [(n, leg) for n, leg in enumerate(legs) if leg["transfer"] > 0]
+    if transfers:
+        cmds = []
+        for _, leg in transfers:
+            from_type, to_type = WALLETS[get_exchange_base(leg["exchange"])]["transfer"]
+            cmds.append(f"transfer {leg['exchange']} {from_type} {to_type} {spend} {leg['transfer']}")
+        try:
+            transfer_results = run_on_ec2_many(cmds)
+        except SSHError as e:
+            transfer_results = [{"output": "", "error": str(e)}] * len(transfers)
+        for (n, _), r in zip(transfers, transfer_results):
+            output = r["output"].strip()
+            if r["error"] or _order_failed(output):
+                results[n].update(ok=False, output=f"划转失败: {r['error'] or output}")
+
+    pending = [n for n, r in enumerate(results) if r["ok"]]
+    if not pending:
+        return results
+    try:
+        order_results = run_on_ec2_many([_order_cmd(base, side, legs[n]) for n in pending])
+    except SSHError as e:
+        order_results = [{"output": "", "error": f"{e} (部分订单可能已提交)"}] * len(pending)
+    for n, r in zip(pending, order_results):
+        output = r["output"].strip()
+        ok = not r["error"] and not _order_failed(output)
+        results[n].update(ok=ok, output=(output.splitlines()[-1] if output else "已提交") if ok else (r["error"] or output))
+    return results
+
+
+# ===================== 交互界面 =====================
+
+def format_route(route: dict, base: str) -> str:
+    side_name = "买入" if route["side"] == "buy" else "卖出"
+    lines = [f"\n{'账户':<24} {'市场':<12} {side_name + '数量':>14} {'限价':>10} {'划转':>12}", "-" * 78]
+    for leg in route["legs"]:
+        transfer = f"{leg['transfer']:,.2f}" if leg["transfer"] else "-"
+        lines.append(f"{leg['display']:<24} {leg['venue']:<12} {leg['qty']:>14,} {leg['limit_price']:>10.5f} {transfer:>12}")
+    lines.append("-" * 78)
+    lines.append(f"合计{side_name} {route['filled']:,.4f} {base}，预计成交金额 {route['notional']:,.4f} USDT，"
+                 f"均价 {route['avg_price']:.5f}" + (f"，手续费 {route['fees']:,.4f}" if route["fees"] else ""))
+    if route["shortfall"] >= 0.01:
+        lines.append(f"⚠️ 盘口深度或余额不足，未分配 {route['shortfall']:,.4f} {base}")
+    return "\n".join(lines)
+
+
+def smart_route_menu():
+    """稳定币智能路由换汇"""
+    from trade import STABLE_PAIRS
+
+    print("\n=== 稳定币智能路由 (多交易所/多账户最优成交) ===")
+    bases = list(STABLE_PAIRS)
+    idx = select_option("选择稳定币:", [f"{b}/USDT" for b in bases], allow_back=True)
+    if idx == -1:
+        return
+    base = bases[idx]
+    side_idx = select_option("选择方向:", [f"买入 {base} (USDT -> {base})", f"卖出 {base} ({base} -> USDT)"],
+                             allow_back=True)
+    if side_idx == -1:
+        return
+    side = "buy" if side_idx == 0 else "sell"
+
+    venues = {r["exchange_base"] for r in get_routes(base, side)}
+    candidates = [(key, display) for key, display in get_exchanges() if get_exchange_base(key) in venues]
+    if not candidates:
+        print("没有可用账户")
+        return
+    exchanges = select_multiple("选择参与路由的账户:", candidates)
+    if not exchanges:
+        return
+    amount = input_amount(f"请输入目标{'买入' if side == 'buy' else '卖出'} {base} 数量:")
+    if amount is None:
+        return
+
+    print(f"\n正在并发查询 {len(venues)} 个市场盘口和 {len(exchanges)} 个账户余额...")
+    books, accounts, errors = quote(base, side, exchanges)
+    for error in errors:
+        print(f"⚠️ {error}")
+    route = plan_route(side, float(amount), books, accounts)
+    if not route["legs"]:
+        print("❌ 没有可成交的路径")
+        return
+    print(format_route(route, base))
+
+    if select_option(f"确认按以上路径并发下单 ({len(route['legs'])} 个子单)?", ["确认", "取消"]) != 0:
+        print("已取消")
+        return
+
+    print("\n正在执行...")
+    results = execute_route(base, route)
+    for r in results:
+        print(f"{'✅' if r['ok'] else '❌'} {r['leg']['display']}: {r['output']}")
+    print(f"\n完成: {sum(r['ok'] for r in results)}/{len(results)} 个子单提交成功")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""交易对规则缓存 - 下单数量/价格取整所需的 stepSize、tickSize、minNotional 等
+
+每个市场 (venue) 一次批量拉取全部交易对规则，按 (venue, symbol) 建索引，
+保存在内存和 .cache/symbol_filters.json 中。过期的市场按需单独刷新，
+查询未知交易对 (如新上币) 时也只刷新该市场，其余情况本地取整，无网络请求。
+
+每条规则为 dict: {stepSize, tickSize, minQty, maxQty, minNotional}，数值均为字符串。
+"""
+
+import json
+import os
+import threading
+import time
+from decimal import Decimal, ROUND_DOWN
+
+from http_client import http_get
+from utils import BASE_DIR, get_exchange_base
+
+# 规则有效期 (秒)，交易规则很少变化
+FILTERS_TTL = 24 * 3600
+
+# 未知交易对触发刷新的最小间隔 (秒)，避免对不存在的交易对反复请求
+MISS_REFRESH_INTERVAL = 300
+
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+FILTERS_CACHE_FILE = os.path.join(CACHE_DIR, "symbol_filters.json")
+
+_venues = {}  # venue -> {"fetched_at": ts, "symbols": {symbol: filter}}
+_loaded_from_disk = False
+_lock = threading.Lock()
+
+
+# ===================== 各市场规则解析 =====================
+
+def _precision_to_step(precision) -> str:
+    """小数位数转换为步长字符串，如 4 -> '0.0001'"""
+    return str(Decimal(1).scaleb(-int(precision)))
+
+
+def _make_filter(step="0", tick="0", min_qty="0", max_qty="0", min_notional="0") -> dict:
+    return {
+        "stepSize": str(step or "0"),
+        "tickSize": str(tick or "0"),
+        "minQty": str(min_qty or "0"),
+        "maxQty": str(max_qty or "0"),
+        "minNotional": str(min_notional or "0"),
+    }
+
+
+def _parse_binance_style(symbols: list, market_lot: bool = False) -> dict:
+    """解析 Binance 格式的 exchangeInfo (Binance 现货/合约、Aster 通用)"""
+    result = {}
+    for s in symbols:
+        filters = {f.get("filterType"): f for f in s.get("filters", [])}
+        lot = filters.get("LOT_SIZE", {})
+        # 合约市价单数量上限取 MARKET_LOT_SIZE
+        max_qty = lot.get("maxQty")
+        if market_lot and filters.get("MARKET_LOT_SIZE", {}).get("maxQty"):
+            max_qty = filters["MARKET_LOT_SIZE"]["maxQty"]
+        notional = filters.get("NOTIONAL") or filters.get("MIN_NOTIONAL") or {}
+        result[s.get("symbol")] = _make_filter(
+            step=lot.get("stepSize"),
+            tick=filters.get("PRICE_FILTER", {}).get("tickSize"),
+            min_qty=lot.get("minQty"),
+            max_qty=max_qty,
+            min_notional=notional.get("minNotional") or notional.get("notional"),
+        )
+    return result
+
+
+def _fetch_binance_style(url: str, market_lot: bool = False) -> dict:
+    resp = http_get(url, timeout=15)
+    resp.raise_for_status()
+    return _parse_binance_style(resp.json().get("symbols", []), market_lot)
+
+
+def _fetch_bybit(category: str) -> dict:
+    """Bybit instruments-info (分页)"""
+    result = {}
+    cursor = ""
+    for _ in range(20):
+        params = {"category": category, "limit": 1000}
+        if cursor:
+            params["cursor"] = cursor
+        resp = http_get("https://api.bybit.com/v5/market/instruments-info", params=params, timeout=15)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("retCode") != 0:
+            raise ValueError(data.get("retMsg", "instruments-info 请求失败"))
+        for s in data.get("result", {}).get("list", []):
+            lot = s.get("lotSizeFilter", {})
+            result[s.get("symbol")] = _make_filter(
+                # 现货用 basePrecision，合约用 qtyStep
+                step=lot.get("qtyStep") or lot.get("basePrecision"),
+                tick=s.get("priceFilter", {}).get("tickSize"),
+                min_qty=lot.get("minOrderQty"),
+                max_qty=lot.get("maxMktOrderQty") or lot.get("maxOrderQty"),
+                min_notional=lot.get("minNotionalValue") or lot.get("minOrderAmt"),
+            )
+        cursor = data.get("result", {}).get("nextPageCursor", "")
+        if not cursor:
+            break
+    return result
+
+
+def _fetch_gate_spot() -> dict:
+    resp = http_get("https://api.gateio.ws/api/v4/spot/currency_pairs", timeout=15)
+    resp.raise_for_status()
+    result = {}
+    for s in resp.json():
+        result[s.get("id")] = _make_filter(
+            step=_precision_to_step(s.get("amount_precision", 8)),
+            tick=_precision_to_step(s.get("precision", 8)),
+            min_qty=s.get("min_base_amount"),
+            max_qty=s.get("max_base_amount"),
+            min_notional=s.get("min_quote_amount"),
+        )
+    return result
+
+
+def _fetch_bitget_spot() -> dict:
+    resp = http_get("https://api.bitget.com/api/v2/spot/public/symbols", timeout=15)
+    resp.raise_for_status()
+    result = {}
+    for s in resp.json().get("data", []):
+        result[s.get("symbol")] = _make_filter(
+            step=_precision_to_step(s.get("quantityPrecision", 8)),
+            tick=_precision_to_step(s.get("pricePrecision", 8)),
+            min_qty=s.get("minTradeAmount"),
+            max_qty=s.get("maxTradeAmount"),
+            min_notional=s.get("minTradeUSDT"),
+        )
+    return result
+
+
+# venue -> 拉取函数
+VENUE_FETCHERS = {
+    "binance_spot": lambda: _fetch_binance_style("https://api.binance.com/api/v3/exchangeInfo"),
+    "binance_futures": lambda: _fetch_binance_style("https://fapi.binance.com/fapi/v1/exchangeInfo", market_lot=True),
+    "bybit_spot": lambda: _fetch_bybit("spot"),
+    "bybit_linear": lambda: _fetch_bybit("linear"),
+    "aster_spot": lambda: _fetch_binance_style("https://sapi.asterdex.com/api/v1/exchangeInfo"),
+    "aster_futures": lambda: _fetch_binance_style("https://fapi.asterdex.com/fapi/v1/exchangeInfo", market_lot=True),
+    "gate_spot": _fetch_gate_spot,
+    "bitget_spot": _fetch_bitget_spot,
+}
+
+
+def get_venue(exchange: str, market: str = "spot") -> str:
+    """交易所 + 市场类型 (spot/futures) 转换为 venue 名称，不支持时返回 None"""
+    base = get_exchange_base(exchange)
+    if market == "futures":
+        venue = "bybit_linear" if base == "bybit" else f"{base}_futures"
+    else:
+        venue = f"{base}_spot"
+    return venue if venue in VENUE_FETCHERS else None
+
+
+# ===================== 缓存 =====================
+
+def _load_disk_cache():
+    global _venues, _loaded_from_disk
+    _loaded_from_disk = True
+    try:
+        with open(FILTERS_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            _venues = data
+    except (OSError, ValueError):
+        pass
+
+
+def _save_disk_cache():
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = FILTERS_CACHE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_venues, f)
+        os.replace(tmp, FILTERS_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def refresh_venue(venue: str, quiet: bool = False) -> bool:
+    """重新拉取一个市场的全部交易对规则，失败时保留旧数据 (quiet 时不输出失败提示)"""
+    fetcher = VENUE_FETCHERS.get(venue)
+    if not fetcher:
+        return False
+    try:
+        symbols = fetcher()
+    except Exception as e:
+        if not quiet:
+            print(f"⚠️  获取 {venue} 交易规则失败: {e}")
+        with _lock:
+            # 记录尝试时间，避免短时间内反复请求
+            _venues.setdefault(venue, {"fetched_at": 0, "symbols": {}})["tried_at"] = time.time()
+        return False
+
+    with _lock:
+        _venues[venue] = {"fetched_at": time.time(), "tried_at": time.time(), "symbols": symbols}
+        _save_disk_cache()
+    return True
+
+
+def warm_venue(venue: str, quiet: bool = False) -> bool:
+    """预热一个市场的交易规则: 没有缓存或已过期时才拉取 (后台预取时传 quiet=True)"""
+    if venue not in VENUE_FETCHERS:
+        return False
+    with _lock:
+        if not _loaded_from_disk:
+            _load_disk_cache()
+        entry = _venues.get(venue)
+    if entry and time.time() - entry.get("fetched_at", 0) <= FILTERS_TTL:
+        return True
+    return refresh_venue(venue, quiet=quiet)
+
+
+def get_symbol_filter(venue: str, symbol: str) -> dict:
+    """获取交易对规则 {stepSize, tickSize, minQty, maxQty, minNotional}，未知时返回 None"""
+    if venue not in VENUE_FETCHERS:
+        return None
+
+    with _lock:
+        if not _loaded_from_disk:
+            _load_disk_cache()
+        entry = _venues.get(venue)
+
+    now = time.time()
+    if not entry or now - entry.get("fetched_at", 0) > FILTERS_TTL:
+        if not entry or now - entry.get("tried_at", 0) > MISS_REFRESH_INTERVAL:
+            refresh_venue(venue)
+    elif symbol not in entry["symbols"] and now - entry.get("tried_at", 0) > MISS_REFRESH_INTERVAL:
+        # 可能是新上线的交易对
+        refresh_venue(venue)
+
+    entry = _venues.get(venue) or {}
+    return entry.get("symbols", {}).get(symbol)
+
+
+# ===================== 取整 =====================
+
+def round_quantity(venue: str, symbol: str, qty: float) -> float:
+    """数量向下取整到 stepSize 的倍数，并限制在 maxQty 以内 (规则未知时原样返回)"""
+    info = get_symbol_filter(venue, symbol)
+    if not info:
+        return qty
+
+    qty_decimal = Decimal(str(qty))
+    max_qty = Decimal(info["maxQty"])
+    if max_qty > 0 and qty_decimal > max_qty:
+        qty_decimal = max_qty
+
+    step = Decimal(info["stepSize"])
+    if step > 0:
+        qty_decimal = (qty_decimal // step) * step
+    return float(qty_decimal)
+
+
+def round_price(venue: str, symbol: str, price: float) -> float:
+    """价格向下取整到 tickSize 的倍数 (规则未知时原样返回)"""
+    info = get_symbol_filter(venue, symbol)
+    if not info:
+        return price
+
+    tick = Decimal(info["tickSize"])
+    if tick <= 0:
+        return price
+    return float((Decimal(str(price)) / tick).to_integral_value(rounding=ROUND_DOWN) * tick)
+
+
+def check_min_notional(venue: str, symbol: str, qty: float, price: float) -> bool:
+    """检查订单金额是否满足最小下单金额 (规则未知时视为满足)"""
+    info = get_symbol_filter(venue, symbol)
+    if not info:
+        return True
+    return Decimal(str(qty)) * Decimal(str(price)) >= Decimal(info["minNotional"])
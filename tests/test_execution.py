@@ -0,0 +1,70 @@
+"""execution: 在 MockExchange 本地撮合引擎上运行 TWAP 调度"""
+
+import json
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from execution import MockExchange, make_plan, run_plan
+
+BOOK_FIXTURE = os.path.join(FIXTURES_DIR, "usd1usdt_book.json")
+
+
+def _load_exchange(**kwargs) -> MockExchange:
+    with open(BOOK_FIXTURE, encoding="utf-8") as f:
+        data = json.load(f)
+    return MockExchange(data["bids"], data["asks"], step=data["step"], min_qty=data["min_qty"], **kwargs)
+
+
+def _run(exchange, plan):
+    return run_plan(exchange, plan, clock=exchange.clock, sleep=exchange.advance)
+
+
+def test_twap_fills_full_quantity_within_slippage_cap():
+    exchange = _load_exchange()
+    plan = make_plan("buy", 3000, duration=60, slices=6, max_slippage_bps=5, participation=0.3)
+    summary = _run(exchange, plan)
+
+    assert summary["status"] == "done"
+    assert summary["filled"] == pytest.approx(3000)
+    assert summary["children"] > 1
+    # 滑点上限: 参考中间价 (0.9996 + 0.9997) / 2 上浮 5 bps，1.0002 档不会被吃到
+    cap = summary["ref_price"] * (1 + 5 / 10000)
+    assert summary["avg_price"] <= cap
+    assert all(o["price"] <= cap for o in exchange.orders.values())
+
+
+def test_participation_limits_each_child_to_visible_depth():
+    exchange = _load_exchange(refill=False)
+    plan = make_plan("sell", 3000, duration=10, slices=1, max_slippage_bps=2, participation=0.5)
+    summary = _run(exchange, plan)
+
+    # 2 bps 内只有 0.9996 / 0.9995 两档 (共 2300)，子单不超过剩余深度的一半，
+    # 不补单时更低的档位不会被吃到，无法全部成交
+    assert exchange.orders["1"]["qty"] <= 2300 * 0.5
+    assert summary["filled"] <= 2300
+    assert set(exchange.bids) >= {0.9993, 0.999}
+    assert summary["status"] == "timeout"
+
+
+def test_refuses_to_run_without_book():
+    exchange = _load_exchange()
+    exchange.bids.clear()
+    exchange.asks.clear()
+    summary = _run(exchange, make_plan("buy", 100, duration=10, slices=2))
+
+    assert summary["status"] == "no_book"
+    assert summary["children"] == 0
+    assert not exchange.orders
+
+
+def test_stops_when_child_fill_is_unresolved():
+    exchange = _load_exchange(refill=False)
+    poll = exchange.poll
+    exchange.poll = lambda: dict(poll(), unresolved={"1"} if exchange.orders else set())
+    summary = _run(exchange, make_plan("buy", 3000, duration=60, slices=6))
+
+    assert summary["status"] == "unresolved"
+    assert summary["unresolved"] == ["1"]
+    assert summary["children"] == 1
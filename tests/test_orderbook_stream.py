@@ -0,0 +1,58 @@
+"""orderbook_stream: 用 ReplayServer 回放录制的 Binance 深度推送"""
+
+import os
+import time
+
+import pytest
+
+pytest.importorskip("websocket")
+pytest.importorskip("websockets")
+
+from conftest import FIXTURES_DIR
+from orderbook_stream import L2Book, OrderBookStream, ReplayServer
+
+GAP_FIXTURE = os.path.join(FIXTURES_DIR, "binance_usdcusdt_gap.jsonl")
+
+
+@pytest.fixture
+def replay():
+    server = ReplayServer.from_file(GAP_FIXTURE).start()
+    yield server
+    server.stop()
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_replay_applies_updates_then_resyncs_on_gap(replay):
+    stream = OrderBookStream("binance_spot", "USDCUSDT", ws_base=replay.ws_base, rest_base=replay.rest_base).start()
+    try:
+        # 快照 (lastUpdateId 100) + 两条连续增量
+        assert _wait_for(lambda: (stream.snapshot() or {}).get("update_id") == 103)
+        snap = stream.snapshot()
+        assert snap["bids"][0] == (0.9998, 55000.0)
+        assert snap["asks"][0] == (0.99995, 30000.0)
+        assert stream.resync_count == 0
+
+        # 第三条增量 U=110 与上次 u=103 之间有缺口: 重新同步一次
+        assert _wait_for(lambda: stream.resync_count == 1)
+        assert "序号缺口" in stream.last_error
+    finally:
+        stream.stop()
+
+
+def test_l2book_estimate_fill_walks_levels():
+    book = L2Book()
+    book.reset([["0.9998", "100"]], [["0.9999", "100"], ["1.0000", "50"]], 1)
+    avg, filled = book.estimate_fill("buy", 120)
+    assert filled == 120
+    assert avg == pytest.approx((100 * 0.9999 + 20 * 1.0) / 120)
+
+    avg, filled = book.estimate_fill("buy", 500)
+    assert filled == 150
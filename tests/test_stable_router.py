@@ -0,0 +1,63 @@
+"""stable_router: 用固定盘口数据测试 plan_route"""
+
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from stable_router import load_books, plan_route
+
+BOOKS_FIXTURE = os.path.join(FIXTURES_DIR, "usdc_books.json")
+
+
+@pytest.fixture
+def books():
+    return load_books(BOOKS_FIXTURE)
+
+
+def _account(exchange, venue, balance, source_balance=0.0):
+    return {"exchange": exchange, "display": exchange, "venue": venue, "symbol": "USDCUSDT",
+            "balance": balance, "source_balance": source_balance, "step": 1, "min_qty": 1}
+
+
+def test_load_books_parses_levels(books):
+    assert set(books) == {("binance_spot", "USDCUSDT"), ("bybit_spot", "USDCUSDT")}
+    assert books[("binance_spot", "USDCUSDT")]["asks"][0] == (0.9999, 1000.0)
+
+
+def test_buy_splits_across_levels_and_computes_transfer(books):
+    accounts = [
+        _account("a_binance", "binance_spot", balance=5000),
+        _account("b_bybit", "bybit_spot", balance=500, source_balance=5000),
+    ]
+    route = plan_route("buy", 3000, books, accounts)
+    legs = {leg["exchange"]: leg for leg in route["legs"]}
+
+    assert route["filled"] == 3000
+    assert route["shortfall"] == 0
+    # Binance: 0.9999 档 1000 + 1.0001 档 500 (比 Bybit 1.0002 档便宜)，限价取最差档位
+    assert legs["a_binance"]["qty"] == 1500
+    assert legs["a_binance"]["limit_price"] == 1.0001
+    assert legs["a_binance"]["notional"] == pytest.approx(1000 * 0.9999 + 500 * 1.0001)
+    assert legs["a_binance"]["transfer"] == 0
+    # Bybit: 1.0000 档 1500，交易钱包只有 500 USDT，其余从资金钱包划转 (含 0.1% 缓冲)
+    assert legs["b_bybit"]["qty"] == 1500
+    assert legs["b_bybit"]["limit_price"] == 1.0
+    assert legs["b_bybit"]["transfer"] == pytest.approx(1500 * 1.001 - 500)
+    assert route["avg_price"] == pytest.approx(route["notional"] / 3000)
+
+
+def test_sell_reports_shortfall_when_balances_run_out(books):
+    accounts = [
+        _account("a_binance", "binance_spot", balance=10000),
+        _account("b_bybit", "bybit_spot", balance=200, source_balance=1000),
+    ]
+    route = plan_route("sell", 10000, books, accounts)
+    legs = {leg["exchange"]: leg for leg in route["legs"]}
+
+    # 两个盘口的买盘合计 2800 + 4200，Bybit 账户只有 1200 可卖
+    assert legs["a_binance"]["qty"] == 2800
+    assert legs["a_binance"]["limit_price"] == 0.9996
+    assert legs["b_bybit"]["qty"] == 1200
+    assert legs["b_bybit"]["transfer"] == 1000
+    assert route["shortfall"] == pytest.approx(6000)
@@ -2,67 +2,75 @@
 """交易功能 - 稳定币交易、撤单、市价卖出、永续平仓"""
 
 import json
-import requests
-from decimal import Decimal, ROUND_DOWN
+import math
+import re
+import time
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
 from utils import (
-    run_on_ec2, select_option, input_amount, select_exchange,
-    get_exchange_display_name, get_exchange_base, SSHError
+    run_on_ec2, run_on_ec2_many, select_option, select_multiple, input_amount, select_exchange,
+    get_exchange_display_name, get_exchange_base, get_exchanges, get_user_accounts, get_ec2_exchange_key,
+    run_parallel, run_binance_api_script, SSHError
 )
-from balance import get_coin_price
+from prices import get_prices
+from ec2_schema import fetch_records, balances as ec2_balances
+from symbol_filters import get_symbol_filter, get_venue, round_quantity, check_min_notional
+from orderbook_stream import get_live_book, get_book_snapshot
+import snapshot_cache
+from execution import make_plan, run_plan, format_progress, DEFAULT_MAX_SLIPPAGE_BPS, DEFAULT_PARTICIPATION
 
 # 稳定币列表
 STABLECOINS = ['USDT', 'USDC', 'USD1', 'U', 'BUSD', 'TUSD', 'FDUSD', 'DAI', 'USDD']
 # 最小显示价值
 MIN_DISPLAY_VALUE = 10
 
-# 缓存交易对信息
-_symbol_info_cache = {}
-
 def get_binance_lot_size(symbol: str) -> dict:
-    """获取 Binance 交易对的 LOT_SIZE 信息"""
-    if symbol in _symbol_info_cache:
-        return _symbol_info_cache[symbol]
-
-    try:
-        url = f"https://api.binance.com/api/v3/exchangeInfo?symbol={symbol}"
-        resp = requests.get(url, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            for s in data.get("symbols", []):
-                if s.get("symbol") == symbol:
-                    for f in s.get("filters", []):
-                        if f.get("filterType") == "LOT_SIZE":
-                            info = {
-                                "stepSize": f.get("stepSize", "1"),
-                                "minQty": f.get("minQty", "0"),
-                                "maxQty": f.get("maxQty", "99999999")
-                            }
-                            _symbol_info_cache[symbol] = info
-                            return info
-    except Exception:
-        pass
-    return None
+    """获取 Binance 现货交易对的 LOT_SIZE 信息 (来自本地交易规则缓存)"""
+    info = get_symbol_filter("binance_spot", symbol)
+    if not info:
+        return None
+    return {"stepSize": info["stepSize"], "minQty": info["minQty"], "maxQty": info["maxQty"]}
 
 
-def adjust_quantity_for_lot_size(qty: float, symbol: str, exchange_base: str) -> float:
-    """根据 LOT_SIZE 调整数量"""
-    if exchange_base != "binance":
+def adjust_quantity_for_lot_size(qty: float, symbol: str, exchange_base: str, market: str = "spot") -> float:
+    """根据交易规则调整数量 (向下取整到 stepSize，不超过 maxQty)"""
+    venue = get_venue(exchange_base, market)
+    if not venue:
         return qty
+    return round_quantity(venue, symbol, qty)
 
-    lot_info = get_binance_lot_size(symbol)
-    if not lot_info:
-        return qty
 
-    step_size = Decimal(lot_info["stepSize"])
-    qty_decimal = Decimal(str(qty))
+# ===================== 稳定币交易 =====================
 
-    # 向下取整到 stepSize 的倍数
-    adjusted = (qty_decimal // step_size) * step_size
+def _live_book(exchange: str, symbol: str):
+    """该账户所在交易所的现货实时订单簿，不可用时返回 None"""
+    venue = get_venue(exchange, "spot")
+    return get_live_book(venue, symbol) if venue else None
 
-    return float(adjusted)
 
+def _run_with_orderbook(exchange: str, symbol: str, cmds: list, orderbook_cmd: str = None) -> list:
+    """查询盘口和其他 EC2 命令，返回 [盘口结果, *各命令结果]
+
+    实时订单簿可用时盘口直接取本地数据，只把其余命令发到 EC2；
+    否则盘口与其余命令一起在 EC2 执行 (orderbook_cmd 默认 orderbook <exchange> <symbol>)。
+    """
+    stream = _live_book(exchange, symbol)
+    if stream is not None:
+        return [{"output": stream.format(), "error": None}] + (run_on_ec2_many(cmds) if cmds else [])
+    return run_on_ec2_many([orderbook_cmd or f"orderbook {exchange} {symbol}"] + cmds)
+
+
+def _fill_hint(exchange: str, symbol: str, side: str, qty) -> str:
+    """市价单确认提示: 按本地盘口估算成交均价 (无实时盘口时为空)"""
+    stream = _live_book(exchange, symbol)
+    estimate = stream.estimate_fill(side, float(qty)) if stream else None
+    if not estimate or estimate[1] <= 0:
+        return ""
+    avg_price, filled = estimate
+    hint = f" (盘口估算均价 {avg_price:.5f}"
+    if filled < float(qty):
+        hint += f"，当前盘口仅可成交 {filled:,.2f}"
+    return hint + ")"
 
-# ===================== 稳定币交易 =====================
 
 def do_stablecoin_trade(exchange: str = None):
     """稳定币交易"""
@@ -72,48 +80,39 @@ def do_stablecoin_trade(exchange: str = None):
         exchange_base = get_exchange_base(exchange)
         if exchange_base == "binance":
             # Binance 支持多个稳定币交易对
+            keys = list(STABLE_PAIRS)
             pair_idx = select_option("选择交易对:", [
-                "USDC/USDT",
-                "BFUSD/USDT",
-                "USD1/USDT",
-                "U/USDT",
-                "返回"
-            ])
-            if pair_idx == 0:
-                trade_usdc_usdt_binance(exchange)
-            elif pair_idx == 1:
-                trade_bfusd_usdt(exchange)
-            elif pair_idx == 2:
-                trade_usd1_usdt(exchange)
-            elif pair_idx == 3:
-                trade_u_usdt(exchange)
+                f"{STABLE_PAIRS[k]['base']}/{STABLE_PAIRS[k]['quote']}" for k in keys
+            ] + ["批量换汇 (多账户)", "智能路由 (多交易所/多账户最优成交)", "返回"])
+            if pair_idx < len(keys):
+                trade_stable_pair(keys[pair_idx], exchange)
+            elif pair_idx == len(keys):
+                bulk_stable_convert()
+            elif pair_idx == len(keys) + 1:
+                from stable_router import smart_route_menu
+                smart_route_menu()
             return
         elif exchange_base == "bybit":
             # Bybit 只支持 USDC/USDT
             trade_usdc_usdt(exchange)
             return
 
-    pair_idx = select_option("选择交易对:", [
-        "USDC/USDT (Bybit)",
-        "BFUSD/USDT (Binance)",
-        "USD1/USDT (Binance)",
-        "U/USDT (Binance)",
-        "返回"
-    ])
-
-    if pair_idx == 4:
-        return
+    binance_keys = [k for k in STABLE_PAIRS if k != "USDC"]
+    pair_idx = select_option("选择交易对:", ["USDC/USDT (Bybit)"] + [
+        f"{STABLE_PAIRS[k]['base']}/{STABLE_PAIRS[k]['quote']} (Binance)" for k in binance_keys
+    ] + ["批量换汇 (Binance 多账户)", "智能路由 (多交易所/多账户最优成交)", "返回"])
 
     if pair_idx == 0:
         exchange = select_exchange(bybit_only=True)
         if exchange:
             trade_usdc_usdt(exchange)
-    elif pair_idx == 1:
-        trade_bfusd_usdt()
-    elif pair_idx == 2:
-        trade_usd1_usdt()
-    elif pair_idx == 3:
-        trade_u_usdt()
+    elif pair_idx <= len(binance_keys):
+        trade_stable_pair(binance_keys[pair_idx - 1])
+    elif pair_idx == len(binance_keys) + 1:
+        bulk_stable_convert()
+    elif pair_idx == len(binance_keys) + 2:
+        from stable_router import smart_route_menu
+        smart_route_menu()
 
 
 def trade_usdc_usdt(exchange: str):
@@ -122,32 +121,41 @@ def trade_usdc_usdt(exchange: str):
     print(f"\n=== {display_name} USDC/USDT 交易 ===")
 
     while True:
-        print("\n正在获取 USDC/USDT 深度...")
+        print("\n正在获取 USDC/USDT 深度和账户余额...")
         try:
-            output = run_on_ec2(f"orderbook {exchange}")
-            print(output)
+            book_result, funding_result, unified_result = _run_with_orderbook(exchange, "USDCUSDT", [
+                f"account_balance {exchange} FUND USDT",
+                f"account_balance {exchange} UNIFIED USDT",
+            ], orderbook_cmd=f"orderbook {exchange}")
         except SSHError as e:
             print(f"获取深度失败: {e}")
+            book_result = funding_result = unified_result = {"output": "", "error": str(e)}
 
-        print("正在查询账户余额...")
-        try:
-            funding_output = run_on_ec2(f"account_balance {exchange} FUND USDT")
-            funding_balance = float(funding_output.strip())
-        except SSHError as e:
-            print(f"⚠️ 查询资金账户失败: {e}")
-            funding_balance = 0.0
-        except ValueError:
-            print(f"⚠️ 资金账户返回异常: {funding_output}")
+        if book_result["error"]:
+            print(f"获取深度失败: {book_result['error']}")
+        else:
+            print(book_result["output"])
+
+        funding_output = funding_result["output"]
+        if funding_result["error"]:
+            print(f"⚠️ 查询资金账户失败: {funding_result['error']}")
             funding_balance = 0.0
-        try:
-            unified_output = run_on_ec2(f"account_balance {exchange} UNIFIED USDT")
-            unified_balance = float(unified_output.strip())
-        except SSHError as e:
-            print(f"⚠️ 查询统一账户失败: {e}")
-            unified_balance = 0.0
-        except ValueError:
-            print(f"⚠️ 统一账户返回异常: {unified_output}")
+        else:
+            try:
+                funding_balance = float(funding_output.strip())
+            except ValueError:
+                print(f"⚠️ 资金账户返回异常: {funding_output}")
+                funding_balance = 0.0
+        unified_output = unified_result["output"]
+        if unified_result["error"]:
+            print(f"⚠️ 查询统一账户失败: {unified_result['error']}")
             unified_balance = 0.0
+        else:
+            try:
+                unified_balance = float(unified_output.strip())
+            except ValueError:
+                print(f"⚠️ 统一账户返回异常: {unified_output}")
+                unified_balance = 0.0
         print(f"💰 资金账户 USDT: {funding_balance:.4f}")
         print(f"💰 统一账户 USDT: {unified_balance:.4f}")
         print(f"💰 合计 USDT: {funding_balance + unified_balance:.4f}")
@@ -186,7 +194,7 @@ def trade_usdc_usdt(exchange: str):
                 continue
 
         if action == 0:
-            if select_option(f"确认市价买入 {amount} USDC?", ["确认", "取消"]) == 0:
+            if select_option(f"确认市价买入 {amount} USDC?{_fill_hint(exchange, 'USDCUSDT', 'buy', amount)}", ["确认", "取消"]) == 0:
                 print("\n正在下单...")
                 try:
                     output = run_on_ec2(f"buy_usdc {exchange} market {amount}")
@@ -242,652 +250,681 @@ def _cancel_bybit_usdc_orders(exchange: str):
         print(f"操作失败: {e}")
 
 
-def trade_usdc_usdt_binance(exchange: str = None):
-    """Binance USDC/USDT 交易"""
-    if not exchange:
-        exchange = select_exchange(binance_only=True)
-        if not exchange:
-            return
+# ===================== Binance 稳定币交易对 =====================
 
-    display_name = get_exchange_display_name(exchange)
-    print(f"\n=== {display_name} USDC/USDT 交易 ===")
+# 交易对参数表: EC2 下单命令为 buy_<cmd> / sell_<cmd> <exchange> market|limit <qty> [price]
+#   step: 数量步长 (None 表示不取整)，min_qty: 最小下单数量
+#   price_examples: 限价输入提示 (买入, 卖出)
+STABLE_PAIRS = {
+    "USDC": {"symbol": "USDCUSDT", "base": "USDC", "quote": "USDT", "cmd": "usdc",
+             "step": None, "min_qty": 0, "price_examples": ("0.9998", "1.0002")},
+    "BFUSD": {"symbol": "BFUSDUSDT", "base": "BFUSD", "quote": "USDT", "cmd": "bfusd",
+              "step": None, "min_qty": 0, "price_examples": ("1.0002", "1.0008")},
+    "USD1": {"symbol": "USD1USDT", "base": "USD1", "quote": "USDT", "cmd": "usd1",
+             "step": None, "min_qty": 0, "price_examples": ("1.0002", "1.0008")},
+    "U": {"symbol": "UUSDT", "base": "U", "quote": "USDT", "cmd": "u",
+          "step": 1, "min_qty": 5, "min_note": "minNotional=5 USDT", "price_examples": ("0.9995", "1.0005")},
+}
 
-    while True:
-        print("\n正在获取 USDC/USDT 深度...")
-        try:
-            output = run_on_ec2(f"orderbook {exchange} USDCUSDT")
-            print(output)
-        except SSHError as e:
-            print(f"获取深度失败: {e}")
+# 批量按全部余额买入时预留的比例 (价格波动和手续费)
+BULK_BUY_BUFFER = 0.002
 
-        print(f"正在查询 {display_name} 现货账户余额...")
-        usdt_balance = "0"
-        usdc_balance = "0"
-        try:
-            output = run_on_ec2(f"account_balance {exchange} SPOT USDT")
-            usdt_balance = output.strip()
-            output2 = run_on_ec2(f"account_balance {exchange} SPOT USDC")
-            usdc_balance = output2.strip()
-            print(f"USDT 余额: {usdt_balance}")
-            print(f"USDC 余额: {usdc_balance}")
-        except SSHError as e:
-            print(f"查询余额失败: {e}")
+SIDE_NAMES = {"buy": "买入", "sell": "卖出"}
 
-        action = select_option("选择操作:", ["市价买入 USDC", "限价买入 USDC", "市价卖出 USDC", "限价卖出 USDC", "刷新深度", "返回"])
 
-        if action == 5:  # 返回
-            break
-        elif action == 4:  # 刷新深度
-            continue
+def _pair_quantity(pair: dict, amount: float):
+    """按交易对数量规则向下取整，返回 (qty, error)"""
+    step = pair.get("step")
+    qty = float(amount)
+    if step:
+        qty = math.floor(qty / step + 1e-9) * step
+        if step >= 1:
+            qty = int(qty)
+    if qty <= 0 or qty < pair["min_qty"]:
+        note = f" ({pair['min_note']})" if pair.get("min_note") else ""
+        return None, f"最小数量 {pair['min_qty']} {pair['base']}{note}"
+    return qty, None
 
-        # 买入操作
-        if action == 0:  # 市价买入
-            amount = input_amount("请输入买入 USDC 数量:")
-            if amount is None:
-                continue
-            if select_option(f"确认市价买入 {amount} USDC?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_usdc {exchange} market {amount}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
 
-        elif action == 1:  # 限价买入
-            amount = input_amount("请输入买入 USDC 数量:")
-            if amount is None:
-                continue
-            price_str = input("请输入限价 (如 0.9998, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
-            try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
-                continue
+def _parse_balance(result: dict) -> float:
+    try:
+        return float(result["output"].strip()) if not result["error"] else 0.0
+    except ValueError:
+        return 0.0
 
-            if select_option(f"确认以 {price} 限价买入 {amount} USDC?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_usdc {exchange} limit {amount} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
 
-        # 卖出操作
-        elif action == 2:  # 市价卖出
-            amount = input_amount("请输入卖出 USDC 数量:")
-            if amount is None:
-                continue
-            if select_option(f"确认市价卖出 {amount} USDC?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_usdc {exchange} market {amount}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
+def _fetch_pair_state(exchange: str, pair: dict) -> dict:
+    """一次批量获取盘口和两个币种余额
 
-        elif action == 3:  # 限价卖出
-            amount = input_amount("请输入卖出 USDC 数量:")
-            if amount is None:
-                continue
-            price_str = input("请输入限价 (如 1.0002, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
-            try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
-                continue
+    Returns:
+        {"book": 文本, "book_error", "quote": 余额, "base": 余额, "balance_error"}
+    """
+    book_result, quote_result, base_result = _run_with_orderbook(exchange, pair["symbol"], [
+        f"account_balance {exchange} SPOT {pair['quote']}",
+        f"account_balance {exchange} SPOT {pair['base']}",
+    ])
+    return {
+        "book": book_result["output"],
+        "book_error": book_result["error"],
+        "quote": quote_result["output"].strip(),
+        "base": base_result["output"].strip(),
+        "balance_error": quote_result["error"] or base_result["error"],
+    }
+
+
+def _input_limit_price(example: str):
+    """输入限价，取消时返回 None"""
+    price_str = input(f"请输入限价 (如 {example}, 输入 0 返回): ").strip()
+    if not price_str or price_str == "0":
+        return None
+    try:
+        price = float(price_str)
+    except ValueError:
+        print("请输入有效的数字")
+        return None
+    if price <= 0:
+        print("价格必须大于0")
+        return None
+    return price
 
-            if select_option(f"确认以 {price} 限价卖出 {amount} USDC?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_usdc {exchange} limit {amount} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
 
-        input("\n按回车继续...")
+def _pair_order_cmd(pair: dict, exchange: str, side: str, qty, price: float = None) -> str:
+    if price is None:
+        return f"{side}_{pair['cmd']} {exchange} market {qty}"
+    return f"{side}_{pair['cmd']} {exchange} limit {qty} {price}"
 
 
-def trade_bfusd_usdt(exchange: str = None):
-    """Binance BFUSD/USDT 交易"""
+def _order_failed(output: str) -> bool:
+    return "error" in output.lower() or "失败" in output
+
+
+def trade_stable_pair(pair_key: str, exchange: str = None):
+    """Binance 稳定币交易对交易 (交易对参数见 STABLE_PAIRS)"""
+    pair = STABLE_PAIRS[pair_key]
+    base, quote = pair["base"], pair["quote"]
     if not exchange:
         exchange = select_exchange(binance_only=True)
         if not exchange:
             return
 
     display_name = get_exchange_display_name(exchange)
-    print(f"\n=== {display_name} BFUSD/USDT 交易 ===")
+    print(f"\n=== {display_name} {base}/{quote} 交易 ===")
+    qty_hint = " (整数)" if pair.get("step") == 1 else ""
 
     while True:
-        print("\n正在获取 BFUSD/USDT 深度...")
+        print(f"\n正在获取 {base}/{quote} 深度和 {display_name} 现货账户余额...")
         try:
-            output = run_on_ec2(f"orderbook {exchange} BFUSDUSDT")
-            print(output)
+            state = _fetch_pair_state(exchange, pair)
+            if state["book_error"]:
+                print(f"获取深度失败: {state['book_error']}")
+            else:
+                print(state["book"])
+            if state["balance_error"]:
+                print(f"查询余额失败: {state['balance_error']}")
+            else:
+                print(f"{quote} 余额: {state['quote']}")
+                print(f"{base} 余额: {state['base']}")
         except SSHError as e:
             print(f"获取深度失败: {e}")
 
-        print(f"正在查询 {display_name} 现货账户余额...")
-        usdt_balance = "0"
-        bfusd_balance = "0"
-        try:
-            output = run_on_ec2(f"account_balance {exchange} SPOT USDT")
-            usdt_balance = output.strip()
-            output2 = run_on_ec2(f"account_balance {exchange} SPOT BFUSD")
-            bfusd_balance = output2.strip()
-            print(f"USDT 余额: {usdt_balance}")
-            print(f"BFUSD 余额: {bfusd_balance}")
-        except SSHError as e:
-            print(f"查询余额失败: {e}")
+        action = select_option("选择操作:", [f"市价买入 {base}", f"限价买入 {base}", f"市价卖出 {base}",
+                                              f"限价卖出 {base}", f"分批买入 {base} (TWAP)", f"分批卖出 {base} (TWAP)",
+                                              "刷新深度", "返回"])
+        if action == 7:  # 返回
+            break
+        elif action == 6:  # 刷新深度
+            continue
 
-        action = select_option("选择操作:", ["市价买入 BFUSD", "限价买入 BFUSD", "市价卖出 BFUSD", "限价卖出 BFUSD", "刷新深度", "返回"])
+        side = "buy" if action in (0, 1, 4) else "sell"
+        side_name = SIDE_NAMES[side]
+        amount = input_amount(f"请输入{side_name} {base} 数量{qty_hint}:")
+        if amount is None:
+            continue
+        qty, error = _pair_quantity(pair, amount)
+        if error:
+            print(f"❌ {error}")
+            continue
 
-        if action == 5:  # 返回
-            break
-        elif action == 4:  # 刷新深度
+        if action in (4, 5):  # 分批执行
+            _run_twap(_StablePairBroker(exchange, pair, side), side, qty, base)
+            input("\n按回车继续...")
             continue
 
-        # 买入操作
-        if action == 0:  # 市价买入
-            amount = input_amount("请输入买入 BFUSD 数量:")
-            if amount is None:
+        price = None
+        if action in (1, 3):  # 限价
+            price = _input_limit_price(pair["price_examples"][0 if side == "buy" else 1])
+            if price is None:
                 continue
-            if select_option(f"确认市价买入 {amount} BFUSD?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_bfusd {exchange} market {amount}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
+            prompt = f"确认以 {price} 限价{side_name} {qty} {base}?"
+        else:
+            prompt = f"确认市价{side_name} {qty} {base}?{_fill_hint(exchange, pair['symbol'], side, qty)}"
 
-        elif action == 1:  # 限价买入
-            amount = input_amount("请输入买入 BFUSD 数量:")
-            if amount is None:
-                continue
-            price_str = input("请输入限价 (如 1.0002, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
+        if select_option(prompt, ["确认", "取消"]) == 0:
+            print("\n正在下单...")
             try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
-                continue
+                output = run_on_ec2(_pair_order_cmd(pair, exchange, side, qty, price))
+                print(output)
+                if _order_failed(output):
+                    print("\n下单可能失败，请检查交易所确认")
+            except SSHError as e:
+                print(f"下单失败: {e}")
 
-            if select_option(f"确认以 {price} 限价买入 {amount} BFUSD?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_bfusd {exchange} limit {amount} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
+        input("\n按回车继续...")
 
-        # 卖出操作
-        elif action == 2:  # 市价卖出
-            amount = input_amount("请输入卖出 BFUSD 数量:")
-            if amount is None:
-                continue
-            if select_option(f"确认市价卖出 {amount} BFUSD?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_bfusd {exchange} market {amount}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
 
-        elif action == 3:  # 限价卖出
-            amount = input_amount("请输入卖出 BFUSD 数量:")
-            if amount is None:
-                continue
-            price_str = input("请输入限价 (如 1.0008, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
-            try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
-                continue
+def trade_usdc_usdt_binance(exchange: str = None):
+    """Binance USDC/USDT 交易"""
+    trade_stable_pair("USDC", exchange)
 
-            if select_option(f"确认以 {price} 限价卖出 {amount} BFUSD?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_bfusd {exchange} limit {amount} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
 
-        input("\n按回车继续...")
+def trade_bfusd_usdt(exchange: str = None):
+    """Binance BFUSD/USDT 交易"""
+    trade_stable_pair("BFUSD", exchange)
 
 
 def trade_usd1_usdt(exchange: str = None):
     """Binance USD1/USDT 交易"""
-    if not exchange:
-        exchange = select_exchange(binance_only=True)
-        if not exchange:
-            return
+    trade_stable_pair("USD1", exchange)
 
-    display_name = get_exchange_display_name(exchange)
-    print(f"\n=== {display_name} USD1/USDT 交易 ===")
 
-    while True:
-        print("\n正在获取 USD1/USDT 深度...")
-        try:
-            output = run_on_ec2(f"orderbook {exchange} USD1USDT")
-            print(output)
-        except SSHError as e:
-            print(f"获取深度失败: {e}")
+def trade_u_usdt(exchange: str = None):
+    """Binance U/USDT 交易"""
+    trade_stable_pair("U", exchange)
 
-        print(f"正在查询 {display_name} 现货账户余额...")
-        usdt_balance = "0"
-        usd1_balance = "0"
-        try:
-            output = run_on_ec2(f"account_balance {exchange} SPOT USDT")
-            usdt_balance = output.strip()
-            output2 = run_on_ec2(f"account_balance {exchange} SPOT USD1")
-            usd1_balance = output2.strip()
-            print(f"USDT 余额: {usdt_balance}")
-            print(f"USD1 余额: {usd1_balance}")
-        except SSHError as e:
-            print(f"查询余额失败: {e}")
 
-        action = select_option("选择操作:", ["市价买入 USD1", "限价买入 USD1", "市价卖出 USD1", "限价卖出 USD1", "刷新深度", "返回"])
+# ===================== 多账户批量换汇 =====================
 
-        if action == 5:  # 返回
-            break
-        elif action == 4:  # 刷新深度
-            continue
+def _plan_bulk_orders(pair: dict, side: str, accounts: list, balances: list, amount, ref_price: float) -> list:
+    """计算每个账户的下单数量
 
-        # 买入操作
-        if action == 0:  # 市价买入
-            amount = input_amount("请输入买入 USD1 数量:")
-            if amount is None:
-                continue
-            if select_option(f"确认市价买入 {amount} USD1?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_usd1 {exchange} market {amount}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
-
-        elif action == 1:  # 限价买入
-            amount = input_amount("请输入买入 USD1 数量:")
-            if amount is None:
-                continue
-            price_str = input("请输入限价 (如 1.0002, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
-            try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
-                continue
+    Args:
+        accounts: [(ec2_key, display), ...]
+        balances: 与 accounts 对应的 (quote 余额, base 余额)
+        amount: 每个账户的固定数量，None 表示使用全部可用余额
+        ref_price: 按 quote 余额折算买入数量时使用的参考价
 
-            if select_option(f"确认以 {price} 限价买入 {amount} USD1?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_usd1 {exchange} limit {amount} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
-
-        # 卖出操作
-        elif action == 2:  # 市价卖出
-            amount = input_amount("请输入卖出 USD1 数量:")
-            if amount is None:
-                continue
-            if select_option(f"确认市价卖出 {amount} USD1?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_usd1 {exchange} market {amount}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
-
-        elif action == 3:  # 限价卖出
-            amount = input_amount("请输入卖出 USD1 数量:")
-            if amount is None:
-                continue
-            price_str = input("请输入限价 (如 1.0008, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
-            try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
+    Returns:
+        [{"exchange", "display", "qty", "error"}, ...]
+    """
+    plan = []
+    for (exchange, display), (quote_bal, base_bal) in zip(accounts, balances):
+        if amount is None:
+            if side == "buy":
+                raw = quote_bal / ref_price * (1 - BULK_BUY_BUFFER) if ref_price > 0 else 0
+            else:
+                raw = base_bal
+        else:
+            raw = amount
+            # 固定数量: 余额不足的账户跳过
+            need = raw * ref_price if side == "buy" else raw
+            have = quote_bal if side == "buy" else base_bal
+            if need > have:
+                plan.append({"exchange": exchange, "display": display, "qty": None,
+                             "error": f"余额不足 ({have:,.4f})"})
                 continue
+        qty, error = _pair_quantity(pair, raw)
+        plan.append({"exchange": exchange, "display": display, "qty": qty, "error": error})
+    return plan
 
-            if select_option(f"确认以 {price} 限价卖出 {amount} USD1?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_usd1 {exchange} limit {amount} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
-
-        input("\n按回车继续...")
 
+def bulk_stable_convert(pair_key: str = None):
+    """多个 Binance 账户同时买入/卖出同一稳定币 (余额查询和下单各一次批量往返)"""
+    print("\n=== 稳定币批量换汇 (Binance 多账户) ===")
 
-def trade_u_usdt(exchange: str = None):
-    """Binance U/USDT 交易"""
-    if not exchange:
-        exchange = select_exchange(binance_only=True)
-        if not exchange:
+    if pair_key is None:
+        keys = list(STABLE_PAIRS)
+        idx = select_option("选择交易对:", [f"{STABLE_PAIRS[k]['base']}/{STABLE_PAIRS[k]['quote']}" for k in keys],
+                            allow_back=True)
+        if idx == -1:
             return
+        pair_key = keys[idx]
+    pair = STABLE_PAIRS[pair_key]
+    base, quote = pair["base"], pair["quote"]
 
-    display_name = get_exchange_display_name(exchange)
-    print(f"\n=== {display_name} U/USDT 交易 ===")
-
-    while True:
-        print("\n正在获取 U/USDT 深度...")
-        try:
-            output = run_on_ec2(f"orderbook {exchange} UUSDT")
-            print(output)
-        except SSHError as e:
-            print(f"获取深度失败: {e}")
-
-        print(f"正在查询 {display_name} 现货账户余额...")
-        usdt_balance = "0"
-        u_balance = "0"
-        try:
-            output = run_on_ec2(f"account_balance {exchange} SPOT USDT")
-            usdt_balance = output.strip()
-            output2 = run_on_ec2(f"account_balance {exchange} SPOT U")
-            u_balance = output2.strip()
-            print(f"USDT 余额: {usdt_balance}")
-            print(f"U 余额: {u_balance}")
-        except SSHError as e:
-            print(f"查询余额失败: {e}")
-
-        action = select_option("选择操作:", ["市价买入 U", "限价买入 U", "市价卖出 U", "限价卖出 U", "刷新深度", "返回"])
-
-        if action == 5:  # 返回
-            break
-        elif action == 4:  # 刷新深度
-            continue
-
-        # 买入操作
-        if action == 0:  # 市价买入
-            amount = input_amount("请输入买入 U 数量 (整数):")
-            if amount is None:
-                continue
-            qty = int(amount)
-            if qty < 5:
-                print("最小买入 5 U (minNotional=5 USDT)")
-                continue
-            if select_option(f"确认市价买入 {qty} U?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_u {exchange} market {qty}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
-
-        elif action == 1:  # 限价买入
-            amount = input_amount("请输入买入 U 数量 (整数):")
-            if amount is None:
-                continue
-            qty = int(amount)
-            if qty < 5:
-                print("最小买入 5 U (minNotional=5 USDT)")
-                continue
-            price_str = input("请输入限价 (如 0.9995, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
-            try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
-                continue
-
-            if select_option(f"确认以 {price} 限价买入 {qty} U?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"buy_u {exchange} limit {qty} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
+    side_idx = select_option("选择方向:", [f"买入 {base} ({quote} -> {base})", f"卖出 {base} ({base} -> {quote})"],
+                             allow_back=True)
+    if side_idx == -1:
+        return
+    side = "buy" if side_idx == 0 else "sell"
+    side_name = SIDE_NAMES[side]
 
-        # 卖出操作
-        elif action == 2:  # 市价卖出
-            amount = input_amount("请输入卖出 U 数量 (整数):")
-            if amount is None:
-                continue
-            qty = int(amount)
-            if qty < 5:
-                print("最小卖出 5 U (minNotional=5 USDT)")
-                continue
-            if select_option(f"确认市价卖出 {qty} U?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_u {exchange} market {qty}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
+    candidates = [(key, display) for key, display in get_exchanges() if get_exchange_base(key) == "binance"]
+    accounts = select_multiple("选择账户:", candidates)
+    if not accounts:
+        return
 
-        elif action == 3:  # 限价卖出
-            amount = input_amount("请输入卖出 U 数量 (整数):")
-            if amount is None:
-                continue
-            qty = int(amount)
-            if qty < 5:
-                print("最小卖出 5 U (minNotional=5 USDT)")
-                continue
-            price_str = input("请输入限价 (如 1.0005, 输入 0 返回): ").strip()
-            if not price_str or price_str == "0":
-                continue
-            try:
-                price = float(price_str)
-                if price <= 0:
-                    print("价格必须大于0")
-                    continue
-            except ValueError:
-                print("请输入有效的数字")
-                continue
+    mode = select_option("选择数量:", ["每个账户固定数量", "全部可用余额"], allow_back=True)
+    if mode == -1:
+        return
+    amount = None
+    if mode == 0:
+        amount = input_amount(f"请输入每个账户{side_name} {base} 数量:")
+        if amount is None:
+            return
 
-            if select_option(f"确认以 {price} 限价卖出 {qty} U?", ["确认", "取消"]) == 0:
-                print("\n正在下单...")
-                try:
-                    output = run_on_ec2(f"sell_u {exchange} limit {qty} {price}")
-                    print(output)
-                    if "error" in output.lower() or "失败" in output:
-                        print("\n下单可能失败，请检查交易所确认")
-                except SSHError as e:
-                    print(f"下单失败: {e}")
+    order_idx = select_option("选择订单类型:", ["市价", "限价"], allow_back=True)
+    if order_idx == -1:
+        return
+    price = None
+    if order_idx == 1:
+        price = _input_limit_price(pair["price_examples"][0 if side == "buy" else 1])
+        if price is None:
+            return
 
-        input("\n按回车继续...")
+    # 参考价: 限价单用限价，市价单用本地盘口最优价，都没有时按 1:1 估算
+    ref_price = price
+    if ref_price is None:
+        stream = _live_book(accounts[0][0], pair["symbol"])
+        snap = stream.snapshot(1) if stream else None
+        levels = (snap or {}).get("asks" if side == "buy" else "bids")
+        ref_price = levels[0][0] if levels else 1.0
+
+    print(f"\n正在查询 {len(accounts)} 个账户的 {quote}/{base} 余额...")
+    cmds = []
+    for exchange, _ in accounts:
+        cmds.append(f"account_balance {exchange} SPOT {quote}")
+        cmds.append(f"account_balance {exchange} SPOT {base}")
+    try:
+        results = run_on_ec2_many(cmds)
+    except SSHError as e:
+        print(f"❌ 查询余额失败: {e}")
+        return
+    balances = [(_parse_balance(results[i]), _parse_balance(results[i + 1])) for i in range(0, len(results), 2)]
 
+    plan = _plan_bulk_orders(pair, side, accounts, balances, amount, ref_price)
+    orders = [p for p in plan if p["qty"]]
 
-# ===================== 撤单功能 =====================
+    print(f"\n{'账户':<24} {quote:>14} {base:>14} {side_name + '数量':>14}")
+    print("-" * 70)
+    for p, (quote_bal, base_bal) in zip(plan, balances):
+        qty_text = f"{p['qty']:,}" if p["qty"] else f"跳过: {p['error']}"
+        print(f"{p['display']:<24} {quote_bal:>14,.4f} {base_bal:>14,.4f} {qty_text:>14}")
+    if not orders:
+        print("\n没有可下单的账户")
+        return
 
-def get_spot_open_orders(exchange: str) -> list:
-    """获取现货挂单"""
-    exchange_base = get_exchange_base(exchange)
+    total = sum(p["qty"] for p in orders)
+    price_text = f"限价 {price}" if price else "市价"
+    if select_option(f"确认 {len(orders)} 个账户{price_text}{side_name}共 {total:,} {base}?", ["确认", "取消"]) != 0:
+        print("已取消")
+        return
 
+    print("\n正在下单...")
     try:
-        if exchange_base == "binance":
-            output = run_on_ec2(f"spot_orders {exchange}")
-            orders = json.loads(output.strip())
-            if isinstance(orders, dict) and "error" in orders:
-                print(f"获取现货挂单失败: {orders['error']}")
-                return []
-            return [{
-                'symbol': o.get('symbol', ''),
-                'side': o.get('side', ''),
-                'price': o.get('price', ''),
-                'qty': o.get('origQty', ''),
-                'orderId': o.get('orderId', '')
-            } for o in orders]
-        elif exchange_base == "gate":
-            output = run_on_ec2(f"gate_spot_orders {exchange}")
-            orders = json.loads(output.strip())
-            if isinstance(orders, dict) and "error" in orders:
-                print(f"获取现货挂单失败: {orders['error']}")
-                return []
-            return [{
-                'symbol': o.get('currency_pair', ''),
-                'side': o.get('side', '').upper(),
-                'price': o.get('price', ''),
-                'qty': o.get('amount', ''),
-                'orderId': o.get('id', '')
-            } for o in orders]
-        elif exchange_base == "bitget":
-            output = run_on_ec2(f"bitget_spot_orders {exchange}")
-            orders = json.loads(output.strip())
-            if isinstance(orders, dict) and "error" in orders:
-                print(f"获取现货挂单失败: {orders['error']}")
-                return []
-            return [{
-                'symbol': o.get('symbol', ''),
-                'side': o.get('side', '').upper(),
-                'price': o.get('price', ''),
-                'qty': o.get('size', ''),
-                'orderId': o.get('orderId', '')
-            } for o in orders]
-        elif exchange_base == "aster":
-            output = run_on_ec2(f"aster_spot_orders {exchange}")
-            orders = json.loads(output.strip())
-            if isinstance(orders, dict) and "error" in orders:
-                print(f"获取现货挂单失败: {orders['error']}")
-                return []
-            return [{
-                'symbol': o.get('symbol', ''),
-                'side': o.get('side', '').upper(),
-                'price': o.get('price', ''),
-                'qty': o.get('origQty', ''),
-                'orderId': o.get('orderId', '')
-            } for o in orders]
+        order_results = run_on_ec2_many([_pair_order_cmd(pair, p["exchange"], side, p["qty"], price) for p in orders])
+    except SSHError as e:
+        print(f"❌ 下单失败: {e}")
+        print("部分订单可能已提交，请检查交易所确认")
+        return
+
+    success = 0
+    for p, r in zip(orders, order_results):
+        output = r["output"].strip()
+        if r["error"] or _order_failed(output):
+            print(f"❌ {p['display']}: {r['error'] or output}")
         else:
-            print(f"暂不支持 {exchange_base} 交易所的现货撤单")
-            return []
-    except json.JSONDecodeError as e:
-        print(f"解析响应失败: {e}")
-        return []
-    except Exception as e:
-        print(f"获取现货挂单失败: {e}")
-        return []
+            success += 1
+            print(f"✅ {p['display']}: {output.splitlines()[-1] if output else '已提交'}")
+    print(f"\n完成: {success}/{len(orders)} 个账户下单成功")
+
+
+# ===================== 分批执行 (TWAP) =====================
+
+ORDER_ID_RE = re.compile(r"""['"]?orderId['"]?\s*[:=]\s*['"]?(\d+)""")
+EXECUTED_QTY_RE = re.compile(r"""['"]?executedQty['"]?\s*[:=]\s*['"]?([\d.]+)""")
+QUOTE_QTY_RE = re.compile(r"""['"]?cummulativeQuoteQty['"]?\s*[:=]\s*['"]?([\d.]+)""")
+
+
+def _parse_fill(output: str):
+    """从下单/撤单输出中解析 (executedQty, cummulativeQuoteQty)，没有时对应项为 None"""
+    executed, quote = EXECUTED_QTY_RE.search(output), QUOTE_QTY_RE.search(output)
+    return (float(executed.group(1)) if executed else None,
+            float(quote.group(1)) if quote else None)
+
+
+# 查询单个现货订单的状态 (EC2 没有对应的 run.sh 命令，经 worker 执行签名请求)
+_BINANCE_ORDER_STATUS_SCRIPT = r"""
+import sys, time, hmac, hashlib, json, urllib.request, urllib.parse, urllib.error
+api_key, api_secret, symbol, order_id = sys.argv[1:5]
+qs = urllib.parse.urlencode({"symbol": symbol, "orderId": order_id, "recvWindow": 5000,
+                             "timestamp": int(time.time() * 1000)})
+sign = hmac.new(api_secret.encode(), qs.encode(), hashlib.sha256).hexdigest()
+req = urllib.request.Request("https://api.binance.com/api/v3/order?" + qs + "&signature=" + sign,
+                             headers={"X-MBX-APIKEY": api_key})
+try:
+    with urllib.request.urlopen(req, timeout=20) as r:
+        data = json.loads(r.read().decode("utf-8"))
+except urllib.error.HTTPError as e:
+    data = {"error": e.read().decode("utf-8", "replace")[:200]}
+except Exception as e:
+    data = {"error": str(e)}
+print(json.dumps({k: data.get(k) for k in ("status", "executedQty", "cummulativeQuoteQty", "error")}))
+"""
+
+# 订单已结束的状态
+FINAL_ORDER_STATUSES = ("FILLED", "CANCELED", "EXPIRED", "EXPIRED_IN_MATCH", "REJECTED")
+
+
+def _round_price_for_side(symbol: str, price: float, side: str) -> float:
+    """限价按 tickSize 取整: 买入向下、卖出向上，保证不超出滑点上限"""
+    info = get_symbol_filter("binance_spot", symbol)
+    tick = Decimal(info["tickSize"]) if info else Decimal(0)
+    if tick <= 0:
+        return price
+    rounding = ROUND_DOWN if side == "buy" else ROUND_UP
+    return float((Decimal(str(price)) / tick).to_integral_value(rounding=rounding) * tick)
+
+
+class _StablePairBroker:
+    """Binance 稳定币交易对的分批执行 broker: 限价子单经 EC2 下单，成交按子单逐个统计
+
+    挂单中的子单取挂单列表里的 executedQty / cummulativeQuoteQty；撤单时取撤单回报中的
+    成交数量；不再出现在挂单列表且不是本地撤掉的子单 (成交、被交易所或手动撤销) 查询订单
+    状态取实际成交，查询失败的记为状态未知 (poll 返回 "unresolved")，不按全部成交计。
+    不用余额变化统计: 挂单冻结的资金会被误算成成交。
+    """
+
+    def __init__(self, exchange: str, pair: dict, side: str):
+        self.exchange = exchange
+        self.pair = pair
+        self.side = side
+        self._known_orders = None  # 开始前已存在的挂单，不计入本次执行
+        self._children = {}  # order_id -> {"qty", "price", "executed", "quote", "done"}
+        self._untracked = [0.0, 0.0]  # 无法获取订单 ID 的子单 (下单时已全部成交): [数量, 金额]
+
+    def _open_orders(self, output: str) -> dict:
+        orders = json.loads(output.strip())
+        if isinstance(orders, dict):
+            raise SSHError(f"查询挂单失败: {orders.get('error', orders)}")
+        return {str(o.get("orderId")): o for o in orders if o.get("symbol") == self.pair["symbol"]}
+
+    def book(self):
+        venue = get_venue(self.exchange, "spot")
+        return get_book_snapshot(venue, self.pair["symbol"]) if venue else None
+
+    def round_qty(self, qty: float):
+        qty, _ = _pair_quantity(self.pair, qty)
+        return qty or 0
+
+    def place(self, side: str, qty, price: float = None):
+        if price is not None:
+            price = _round_price_for_side(self.pair["symbol"], price, side)
+        output = run_on_ec2(_pair_order_cmd(self.pair, self.exchange, side, qty, price))
+        if _order_failed(output):
+            raise SSHError(f"下单失败: {output.strip()}")
+        executed, quote = _parse_fill(output)
+        match = ORDER_ID_RE.search(output)
+        order_id = match.group(1) if match else None
+        if order_id is None:
+            # 输出中没有订单 ID: 从挂单列表中找出新增的订单
+            open_orders = self._open_orders(run_on_ec2(f"spot_orders {self.exchange}"))
+            new_orders = set(open_orders) - (self._known_orders or set()) - set(self._children)
+            order_id = max(new_orders, key=int) if new_orders else None
+        if order_id is None:
+            # 不在挂单列表中: 下单时已全部成交
+            executed = float(qty) if executed is None else executed
+            self._untracked[0] += executed
+            self._untracked[1] += quote if quote is not None else executed * (price or 0)
+            return None
+        self._children[order_id] = {"qty": float(qty), "price": price or 0.0, "executed": executed or 0.0,
+                                    "quote": quote or 0.0, "done": False, "unknown": False}
+        return order_id
+
+    def _order_status(self, order_id: str) -> dict:
+        """查询订单状态 {status, executedQty, cummulativeQuoteQty}，失败抛出 SSHError"""
+        output = run_binance_api_script(self.exchange, _BINANCE_ORDER_STATUS_SCRIPT,
+                                        extra_args=[self.pair["symbol"], order_id])
+        try:
+            data = json.loads(output)
+        except json.JSONDecodeError:
+            raise SSHError(f"查询订单失败: {output[:200]}")
+        if data.get("error") or not data.get("status"):
+            raise SSHError(f"查询订单失败: {data.get('error') or output[:200]}")
+        return data
+
+    def _resolve(self, order_id: str, child: dict):
+        """不在挂单列表中的子单: 按订单状态取实际成交，查询失败记为状态未知"""
+        try:
+            data = self._order_status(order_id)
+        except SSHError:
+            child["done"] = child["unknown"] = True
+            return
+        child["executed"] = float(data.get("executedQty") or child["executed"])
+        child["quote"] = float(data.get("cummulativeQuoteQty") or child["quote"])
+        child["done"] = data["status"] in FINAL_ORDER_STATUSES
 
+    def poll(self) -> dict:
+        open_orders = self._open_orders(run_on_ec2(f"spot_orders {self.exchange}"))
+        if self._known_orders is None:
+            self._known_orders = set(open_orders)
+
+        for order_id, child in self._children.items():
+            if child["done"]:
+                continue
+            order = open_orders.get(order_id)
+            if order is not None:
+                child["executed"] = float(order.get("executedQty") or child["executed"])
+                child["quote"] = float(order.get("cummulativeQuoteQty") or child["quote"])
+            else:
+                self._resolve(order_id, child)
+
+        return {
+            "open": {oid for oid, child in self._children.items() if not child["done"]},
+            "filled": self._untracked[0] + sum(c["executed"] for c in self._children.values()),
+            "notional": self._untracked[1] + sum(c["quote"] for c in self._children.values()),
+            "unresolved": {oid for oid, child in self._children.items() if child["unknown"]},
+        }
+
+    def cancel(self, order_id: str):
+        output = run_on_ec2(f"cancel_spot {self.exchange} {self.pair['symbol']} {order_id}")
+        child = self._children.get(order_id)
+        if child is None or _order_failed(output):
+            # 撤单失败 (可能已成交): 下次轮询按挂单列表判断
+            return
+        executed, quote = _parse_fill(output)
+        if executed is not None:
+            child["executed"] = executed
+            child["quote"] = quote if quote is not None else child["quote"]
+        child["done"] = True
+
+
+class _SpotSellBroker:
+    """现货分批市价卖出 broker: 每个子单为市价单，成交数量取交易所返回值"""
+
+    def __init__(self, exchange: str, symbol: str):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.exchange_base = get_exchange_base(exchange)
+        self.filled = 0.0
+        self.notional = 0.0
+
+    def book(self):
+        venue = get_venue(self.exchange, "spot")
+        return get_book_snapshot(venue, self.symbol) if venue else None
+
+    def round_qty(self, qty: float):
+        return adjust_quantity_for_lot_size(qty, self.symbol, self.exchange_base)
+
+    def place(self, side: str, qty, price: float = None):
+        result = _market_sell_spot_raw(self.exchange, self.symbol, qty)
+        if not result["ok"]:
+            raise SSHError(str(result["error"]))
+        executed = float(result["executed_qty"] or qty)
+        self.filled += executed
+        # 未返回成交金额时按子单参考价估算
+        self.notional += float(result["quote_qty"]) if result["quote_qty"] else executed * (price or 0)
+        return None
+
+    def poll(self) -> dict:
+        return {"open": set(), "filled": self.filled, "notional": self.notional}
+
+    def cancel(self, order_id: str):
+        pass
 
-def get_futures_open_orders(exchange: str, use_portfolio: bool = True) -> list:
-    """获取永续挂单"""
-    exchange_base = get_exchange_base(exchange)
 
+def _input_number(prompt: str, default: float) -> float:
+    """输入数字，直接回车使用默认值，无效输入返回 None"""
+    value = input(f"{prompt} (默认 {default:g}): ").strip()
+    if not value:
+        return default
     try:
-        if exchange_base == "binance":
-            if use_portfolio:
-                output = run_on_ec2(f"portfolio_um_orders {exchange}")
+        number = float(value)
+    except ValueError:
+        print("请输入有效的数字")
+        return None
+    if number <= 0:
+        print("必须大于0")
+        return None
+    return number
+
+
+def _run_twap(broker, side: str, total_qty, base: str):
+    """输入分批参数、确认后执行，进度实时输出到终端"""
+    minutes = _input_number("执行时长 (分钟)", 10)
+    slices = minutes and _input_number("分片数", 10)
+    bps = slices and _input_number("最大滑点 (基点, 相对开始时中间价)", DEFAULT_MAX_SLIPPAGE_BPS)
+    participation = bps and _input_number("盘口参与率 (%)", DEFAULT_PARTICIPATION * 100)
+    if not participation:
+        return
+
+    if broker.book() is None:
+        print(f"❌ 无法获取 {base} 盘口 (实时订单簿和 REST 均不可用)，无法限制滑点，不能分批执行")
+        return
+
+    plan = make_plan(side, total_qty, duration=minutes * 60, slices=int(slices),
+                     max_slippage_bps=bps, participation=participation / 100)
+    side_name = SIDE_NAMES[side]
+    print(f"\n分批{side_name} {total_qty} {base}: {int(slices)} 片 / {minutes:g} 分钟，"
+          f"滑点上限 {bps:g} bps，参与率 {participation:g}%")
+    if select_option("确认开始执行? (执行中按 Ctrl+C 停止并撤单)", ["确认", "取消"]) != 0:
+        print("已取消")
+        return
+
+    def on_progress(event):
+        text = format_progress(event, base)
+        if text:
+            print(text)
+
+    summary = run_plan(broker, plan, on_progress=on_progress)
+    status_text = {"done": "✅ 执行完成", "timeout": "⚠️ 超时结束", "stopped": "⏹️ 已停止",
+                   "error": "❌ 执行出错", "no_book": "❌ 未执行",
+                   "unresolved": "⚠️ 成交状态未知"}.get(summary["status"], summary["status"])
+    print(f"\n{status_text}: 成交 {summary['filled']:,.4f}/{total_qty:,} {base}，"
+          f"子单 {summary['children']} 个，撤单 {summary['cancels']} 次，用时 {summary['elapsed']:.0f} 秒")
+    if summary["filled"] and summary["avg_price"]:
+        print(f"成交均价: {summary['avg_price']:.5f}" +
+              (f" (参考中间价 {summary['ref_price']:.5f})" if summary["ref_price"] else ""))
+    if summary["error"]:
+        print(f"错误: {summary['error']}")
+    if summary["unresolved"]:
+        print(f"⚠️ 以下子单已不在挂单列表但查询状态失败，成交未计入，请在交易所确认: "
+              f"{', '.join(map(str, summary['unresolved']))}")
+
+
+# ===================== 撤单功能 =====================
+
+# 各交易所可撤单的市场: spot 现货 / futures 永续 (Binance 为统一账户 UM)
+ORDER_MARKETS = {
+    "binance": ("spot", "futures"),
+    "aster": ("spot", "futures"),
+    "bybit": ("futures",),
+    "gate": ("spot",),
+    "bitget": ("spot",),
+}
+
+# 查询挂单命令: (exchange_base, market) -> 命令前缀
+OPEN_ORDERS_COMMANDS = {
+    ("binance", "spot"): "spot_orders",
+    ("gate", "spot"): "gate_spot_orders",
+    ("bitget", "spot"): "bitget_spot_orders",
+    ("aster", "spot"): "aster_spot_orders",
+    ("aster", "futures"): "aster_orders",
+    ("bybit", "futures"): "bybit_open_orders",
+}
+
+# 挂单字段映射: exchange_base -> (symbol, qty, orderId)
+ORDER_FIELDS = {
+    "gate": ("currency_pair", "amount", "id"),
+    "bitget": ("symbol", "size", "orderId"),
+}
+
+
+def _open_orders_cmd(exchange: str, market: str, use_portfolio: bool = True) -> str:
+    """查询挂单的 EC2 命令，不支持时返回 None"""
+    exchange_base = get_exchange_base(exchange)
+    if exchange_base == "binance" and market == "futures":
+        return f"{'portfolio_um_orders' if use_portfolio else 'futures_orders'} {exchange}"
+    command = OPEN_ORDERS_COMMANDS.get((exchange_base, market))
+    return f"{command} {exchange}" if command else None
+
+
+def _parse_open_orders(exchange_base: str, market: str, output: str, use_portfolio: bool = True) -> list:
+    """解析挂单查询输出为统一格式，EC2 返回错误时抛出 SSHError"""
+    orders = json.loads(output.strip())
+    if isinstance(orders, dict) and "error" in orders:
+        raise SSHError(orders["error"])
+    symbol_key, qty_key, id_key = ORDER_FIELDS.get(exchange_base, ("symbol", "origQty", "orderId"))
+    parsed = []
+    for o in orders:
+        side = o.get('side', '')
+        order = {
+            'symbol': o.get(symbol_key, ''),
+            'side': side if exchange_base == "binance" or market == "futures" else side.upper(),
+            'price': o.get('price', ''),
+            'qty': o.get(qty_key, ''),
+            'orderId': o.get(id_key, ''),
+        }
+        if market == "futures":
+            if exchange_base == "binance":
+                order['source'] = 'portfolio' if use_portfolio else 'futures'
             else:
-                output = run_on_ec2(f"futures_orders {exchange}")
-
-            orders = json.loads(output.strip())
-            if isinstance(orders, dict) and "error" in orders:
-                print(f"获取永续挂单失败: {orders['error']}")
-                return []
-
-            return [{
-                'symbol': o.get('symbol', ''),
-                'side': o.get('side', ''),
-                'price': o.get('price', ''),
-                'qty': o.get('origQty', ''),
-                'orderId': o.get('orderId', ''),
-                'source': 'portfolio' if use_portfolio else 'futures'
-            } for o in orders]
+                order['source'] = exchange_base
+        parsed.append(order)
+    return parsed
 
-        elif exchange_base == "aster":
-            output = run_on_ec2(f"aster_orders {exchange}")
-            orders = json.loads(output.strip())
-            if isinstance(orders, dict) and "error" in orders:
-                print(f"获取永续挂单失败: {orders['error']}")
-                return []
-
-            return [{
-                'symbol': o.get('symbol', ''),
-                'side': o.get('side', ''),
-                'price': o.get('price', ''),
-                'qty': o.get('origQty', ''),
-                'orderId': o.get('orderId', ''),
-                'source': 'aster'
-            } for o in orders]
 
-        elif exchange_base == "bybit":
-            output = run_on_ec2(f"bybit_open_orders {exchange}")
-            orders = json.loads(output.strip())
-            if isinstance(orders, dict) and "error" in orders:
-                print(f"获取永续挂单失败: {orders['error']}")
-                return []
-
-            return [{
-                'symbol': o.get('symbol', ''),
-                'side': o.get('side', ''),
-                'price': o.get('price', ''),
-                'qty': o.get('origQty', ''),
-                'orderId': o.get('orderId', ''),
-                'source': 'bybit'
-            } for o in orders]
+def fetch_open_orders(exchange: str, market: str, use_portfolio: bool = True, fresh: bool = False) -> list:
+    """查询挂单，失败抛出 SSHError / ValueError
 
-        else:
-            print(f"暂不支持 {exchange_base} 交易所的永续撤单")
-            return []
+    仅用于展示时可用有效期内的缓存；撤单等据此操作的场景须传 fresh=True 实时查询
+    """
+    exchange_base = get_exchange_base(exchange)
+    cmd = _open_orders_cmd(exchange, market, use_portfolio)
+    if cmd is None:
+        return []
+    return snapshot_cache.get(
+        exchange, f"orders:{cmd.split()[0]}",
+        lambda: _parse_open_orders(exchange_base, market, run_on_ec2(cmd), use_portfolio),
+        fresh=fresh, stale_ok=False,
+    ).value
+
+
+def _fetch_open_orders(exchange: str, market: str, use_portfolio: bool = True, fresh: bool = False) -> list:
+    exchange_base = get_exchange_base(exchange)
+    market_name = "现货" if market == "spot" else "永续"
+    if _open_orders_cmd(exchange, market, use_portfolio) is None:
+        print(f"暂不支持 {exchange_base} 交易所的{market_name}撤单")
+        return []
+    try:
+        return fetch_open_orders(exchange, market, use_portfolio, fresh=fresh)
     except json.JSONDecodeError as e:
         print(f"解析响应失败: {e}")
         return []
     except Exception as e:
-        print(f"获取永续挂单失败: {e}")
+        print(f"获取{market_name}挂单失败: {e}")
         return []
 
 
+def get_spot_open_orders(exchange: str, fresh: bool = False) -> list:
+    """获取现货挂单 (fresh=True 时不使用缓存)"""
+    return _fetch_open_orders(exchange, "spot", fresh=fresh)
+
+
+def get_futures_open_orders(exchange: str, use_portfolio: bool = True, fresh: bool = False) -> list:
+    """获取永续挂单 (fresh=True 时不使用缓存)"""
+    return _fetch_open_orders(exchange, "futures", use_portfolio, fresh=fresh)
+
+
 def display_orders(orders: list, order_type: str) -> None:
     """显示订单列表"""
     if not orders:
@@ -910,55 +947,80 @@ def display_orders(orders: list, order_type: str) -> None:
         print(f"  {i}. {side_indicator} {symbol} | {side} | 价格: {price} | 数量: {qty} | ID: {order_id}")
 
 
-def cancel_single_order(exchange: str, order_type: str, symbol: str, order_id: str, use_portfolio: bool = True) -> bool:
-    """撤销单个订单"""
+def _cancel_order_cmd(exchange: str, order_type: str, symbol: str, order_id: str, use_portfolio: bool = True) -> str:
+    """撤销单个订单的 EC2 命令，不支持时返回 None"""
     exchange_base = get_exchange_base(exchange)
+    if exchange_base == "binance":
+        if order_type == "spot":
+            command = "cancel_spot"
+        else:
+            command = "cancel_portfolio_um" if use_portfolio else "cancel_futures"
+    elif exchange_base == "aster":
+        command = "aster_cancel_spot" if order_type == "spot" else "aster_cancel"
+    else:
+        command = {"gate": "gate_cancel_spot", "bitget": "bitget_cancel_spot",
+                   "bybit": "bybit_cancel_order"}.get(exchange_base)
+    return f"{command} {exchange} {symbol} {order_id}" if command else None
+
 
+def _cancel_succeeded(exchange_base: str, output: str) -> bool:
+    """撤单命令输出是否表示成功"""
     try:
-        if exchange_base == "binance":
-            if order_type == "spot":
-                output = run_on_ec2(f"cancel_spot {exchange} {symbol} {order_id}")
-            elif use_portfolio:
-                output = run_on_ec2(f"cancel_portfolio_um {exchange} {symbol} {order_id}")
-            else:
-                output = run_on_ec2(f"cancel_futures {exchange} {symbol} {order_id}")
+        result = json.loads(output.strip())
+    except json.JSONDecodeError:
+        return False
+    if not isinstance(result, dict):
+        return False
+    if exchange_base == "gate":
+        # Gate API 返回成功撤单时包含 id 字段
+        return 'id' in result or 'status' in result
+    if exchange_base == "bitget":
+        # Bitget API 返回成功撤单时包含 orderId 字段
+        return 'orderId' in result or result.get('code') == '00000'
+    return 'orderId' in result or 'status' in result
 
-            result = json.loads(output.strip())
-            return 'orderId' in result or 'status' in result
 
-        elif exchange_base == "gate":
-            output = run_on_ec2(f"gate_cancel_spot {exchange} {symbol} {order_id}")
-            result = json.loads(output.strip())
-            # Gate API 返回成功撤单时包含 id 字段
-            return 'id' in result or 'status' in result
+def cancel_single_order(exchange: str, order_type: str, symbol: str, order_id: str, use_portfolio: bool = True) -> bool:
+    """撤销单个订单"""
+    exchange_base = get_exchange_base(exchange)
+    cmd = _cancel_order_cmd(exchange, order_type, symbol, order_id, use_portfolio)
+    if cmd is None:
+        print(f"暂不支持 {exchange_base} 交易所的撤单")
+        return False
+    try:
+        return _cancel_succeeded(exchange_base, run_on_ec2(cmd))
+    except Exception as e:
+        print(f"撤单失败: {e}")
+        return False
 
-        elif exchange_base == "bitget":
-            output = run_on_ec2(f"bitget_cancel_spot {exchange} {symbol} {order_id}")
-            result = json.loads(output.strip())
-            # Bitget API 返回成功撤单时包含 orderId 字段
-            return 'orderId' in result or result.get('code') == '00000'
 
-        elif exchange_base == "aster":
-            if order_type == "spot":
-                output = run_on_ec2(f"aster_cancel_spot {exchange} {symbol} {order_id}")
-            else:
-                output = run_on_ec2(f"aster_cancel {exchange} {symbol} {order_id}")
-            result = json.loads(output.strip())
-            return 'orderId' in result or 'status' in result
+def cancel_orders_batch(exchange: str, order_type: str, orders: list, use_portfolio: bool = True) -> list:
+    """一次批量 EC2 调用并发撤销多个订单，返回与 orders 对应的是否成功列表"""
+    exchange_base = get_exchange_base(exchange)
+    cmds = [_cancel_order_cmd(exchange, order_type, o.get('symbol', ''), str(o.get('orderId', '')), use_portfolio)
+            for o in orders]
+    if not orders or cmds[0] is None:
+        return [False] * len(orders)
+    results = run_on_ec2_many(cmds)
+    return [not r["error"] and _cancel_succeeded(exchange_base, r["output"]) for r in results]
 
-        elif exchange_base == "bybit":
-            output = run_on_ec2(f"bybit_cancel_order {exchange} {symbol} {order_id}")
-            result = json.loads(output.strip())
-            return 'orderId' in result or 'status' in result
 
-        else:
-            print(f"暂不支持 {exchange_base} 交易所的撤单")
-            return False
-    except json.JSONDecodeError:
-        return False
-    except Exception as e:
+def _print_batch_cancel(exchange: str, order_type: str, orders: list, use_portfolio: bool = True):
+    """撤销全部订单并逐个输出结果"""
+    try:
+        results = cancel_orders_batch(exchange, order_type, orders, use_portfolio)
+    except SSHError as e:
         print(f"撤单失败: {e}")
-        return False
+        print("部分撤单可能已提交，请检查交易所确认")
+        return
+    for order, ok in zip(orders, results):
+        symbol = order.get('symbol', '')
+        order_id = str(order.get('orderId', ''))
+        print(f"  撤销 {symbol} #{order_id}" if ok else f"  撤销失败 {symbol} #{order_id}")
+    if all(results):
+        print("全部撤单成功")
+    else:
+        print("部分撤单可能失败，请检查交易所确认")
 
 
 def cancel_spot_orders(exchange: str):
@@ -966,7 +1028,8 @@ def cancel_spot_orders(exchange: str):
     print(f"\n=== 现货撤单 ===")
     print("\n正在获取现货挂单...")
 
-    orders = get_spot_open_orders(exchange)
+    # 撤单依据实时挂单，不使用缓存
+    orders = get_spot_open_orders(exchange, fresh=True)
     display_orders(orders, "现货")
 
     if not orders:
@@ -1005,20 +1068,7 @@ def cancel_spot_orders(exchange: str):
     elif action == 1:
         if select_option(f"确认撤销全部 {len(orders)} 个现货挂单?", ["确认", "取消"]) == 0:
             print("\n正在撤销全部订单...")
-            success_count = 0
-            for order in orders:
-                symbol = order.get('symbol', '')
-                order_id = str(order.get('orderId', ''))
-                if cancel_single_order(exchange, "spot", symbol, order_id):
-                    success_count += 1
-                    print(f"  撤销 {symbol} #{order_id}")
-                else:
-                    print(f"  撤销失败 {symbol} #{order_id}")
-
-            if success_count == len(orders):
-                print("全部撤单成功")
-            else:
-                print("部分撤单可能失败，请检查交易所确认")
+            _print_batch_cancel(exchange, "spot", orders)
 
 
 def cancel_futures_orders(exchange: str, use_portfolio: bool = True):
@@ -1033,7 +1083,8 @@ def cancel_futures_orders(exchange: str, use_portfolio: bool = True):
 
     print("\n正在获取永续挂单...")
 
-    orders = get_futures_open_orders(exchange, use_portfolio=use_portfolio)
+    # 撤单依据实时挂单，不使用缓存
+    orders = get_futures_open_orders(exchange, use_portfolio=use_portfolio, fresh=True)
     display_orders(orders, "永续")
 
     if not orders:
@@ -1072,20 +1123,7 @@ def cancel_futures_orders(exchange: str, use_portfolio: bool = True):
     elif action == 1:
         if select_option(f"确认撤销全部 {len(orders)} 个永续挂单?", ["确认", "取消"]) == 0:
             print("\n正在撤销全部订单...")
-            success_count = 0
-            for order in orders:
-                symbol = order.get('symbol', '')
-                order_id = str(order.get('orderId', ''))
-                if cancel_single_order(exchange, "futures", symbol, order_id, use_portfolio=use_portfolio):
-                    success_count += 1
-                    print(f"  撤销 {symbol} #{order_id}")
-                else:
-                    print(f"  撤销失败 {symbol} #{order_id}")
-
-            if success_count == len(orders):
-                print("全部撤单成功")
-            else:
-                print("部分撤单可能失败，请检查交易所确认")
+            _print_batch_cancel(exchange, "futures", orders, use_portfolio=use_portfolio)
 
 
 def cancel_orders_menu(exchange: str):
@@ -1150,149 +1188,144 @@ def cancel_orders_menu(exchange: str):
         input("\n按回车继续...")
 
 
+def cancel_all_user_orders(user_id: str):
+    """一键撤销用户所有账户的现货和永续挂单
+
+    所有账户的挂单在一次批量 EC2 调用中查询；撤单按 账户+市场 分组并发执行，
+    每组一次批量调用，输出每组用时。
+    """
+    print(f"\n=== 一键撤销全部挂单 ===")
+    targets = []  # (ec2_key, 账户名, market)
+    for account_id, name in get_user_accounts(user_id):
+        ec2_key = get_ec2_exchange_key(user_id, account_id)
+        for market in ORDER_MARKETS.get(get_exchange_base(ec2_key), ()):
+            targets.append((ec2_key, name, market))
+    if not targets:
+        print("该用户没有支持撤单的账户")
+        return
+
+    print(f"\n正在查询 {len(targets)} 个账户市场的挂单...")
+    started = time.time()
+    try:
+        results = run_on_ec2_many([_open_orders_cmd(ec2_key, market) for ec2_key, _, market in targets])
+    except SSHError as e:
+        print(f"❌ 查询挂单失败: {e}")
+        return
+
+    groups = []  # (ec2_key, 名称, market, orders)
+    for (ec2_key, name, market), r in zip(targets, results):
+        label = f"{name} {'现货' if market == 'spot' else '永续'}"
+        if r["error"]:
+            print(f"⚠️ {label}: 查询失败 {r['error']}")
+            continue
+        try:
+            orders = _parse_open_orders(get_exchange_base(ec2_key), market, r["output"])
+        except (json.JSONDecodeError, SSHError) as e:
+            print(f"⚠️ {label}: 查询失败 {e}")
+            continue
+        print(f"  {label}: {len(orders)} 个挂单")
+        if orders:
+            groups.append((ec2_key, label, market, orders))
+    print(f"查询用时 {time.time() - started:.2f} 秒")
+
+    total = sum(len(g[3]) for g in groups)
+    if not total:
+        print("\n没有挂单")
+        return
+    if select_option(f"确认撤销 {len(groups)} 个账户市场的全部 {total} 个挂单?", ["确认", "取消"]) != 0:
+        print("已取消")
+        return
+
+    print("\n正在并发撤单...")
+
+    def cancel_group(ec2_key, market, orders):
+        group_started = time.time()
+        return cancel_orders_batch(ec2_key, market, orders), time.time() - group_started
+
+    def on_result(label, result, error):
+        if error:
+            print(f"❌ {label}: 撤单失败 {error} (部分撤单可能已提交)")
+            return
+        oks, elapsed = result
+        mark = "✅" if all(oks) else "⚠️"
+        print(f"{mark} {label}: 撤销 {sum(oks)}/{len(oks)}，用时 {elapsed:.2f} 秒")
+
+    started = time.time()
+    run_parallel([(label, lambda k=ec2_key, m=market, o=orders: cancel_group(k, m, o))
+                  for ec2_key, label, market, orders in groups], on_result=on_result)
+    print(f"\n撤单完成，总用时 {time.time() - started:.2f} 秒，请在交易所确认没有遗留挂单")
+
+
 # ===================== 市价卖出 =====================
 
-def get_spot_balances(exchange: str) -> list:
-    """获取现货余额（通过 EC2）"""
+# 现货资产 JSON 查询命令 (Bitget/Gate 返回已估值的资产)，其他交易所以机器模式查询 balance 命令
+SPOT_ASSETS_COMMANDS = {
+    "bitget": "bitget_spot_assets",
+    "gate": "gate_spot_assets",
+    "aster": "aster_spot_assets",
+    "binance": "spot_balance",
+}
+
+
+def fetch_spot_assets(exchange: str) -> list:
+    """查询现货原始资产列表 [{"asset", "free"}] (Bitget/Gate 另含 "value")，失败抛出 SSHError"""
     exchange_base = get_exchange_base(exchange)
-    balances = []
+    if exchange_base not in SPOT_ASSETS_COMMANDS:
+        return [{'asset': b.asset, 'free': b.free}
+                for b in ec2_balances(fetch_records(f"balance {exchange}")) if b.free > 0]
 
+    output = run_on_ec2(f"{SPOT_ASSETS_COMMANDS[exchange_base]} {exchange}")
     try:
-        # Bitget/Gate 使用专门的命令获取所有可卖出资产
-        if exchange_base == "bitget":
-            output = run_on_ec2(f"bitget_spot_assets {exchange}")
-            try:
-                assets = json.loads(output.strip())
-                if isinstance(assets, list):
-                    return [a for a in assets if a.get('free', 0) > 0]
-                elif isinstance(assets, dict) and 'error' in assets:
-                    print(f"获取资产失败: {assets['error']}")
-                    return []
-            except json.JSONDecodeError:
-                print(f"解析资产数据失败")
-                return []
-
-        if exchange_base == "gate":
-            output = run_on_ec2(f"gate_spot_assets {exchange}")
-            try:
-                assets = json.loads(output.strip())
-                if isinstance(assets, list):
-                    return [a for a in assets if a.get('free', 0) > 0]
-                elif isinstance(assets, dict) and 'error' in assets:
-                    print(f"获取资产失败: {assets['error']}")
-                    return []
-            except json.JSONDecodeError:
-                print(f"解析资产数据失败")
-                return []
-
-        # Aster 使用专门命令
-        if exchange_base == "aster":
-            output = run_on_ec2(f"aster_spot_assets {exchange}")
-            try:
-                assets = json.loads(output.strip())
-                if isinstance(assets, list):
-                    for a in assets:
-                        asset = a.get('asset', '').upper()
-                        free = float(a.get('free', 0))
-                        if asset in STABLECOINS or free <= 0:
-                            continue
-                        price = get_coin_price(asset)
-                        value = free * price
-                        if value >= MIN_DISPLAY_VALUE:
-                            balances.append({
-                                'asset': asset,
-                                'free': free,
-                                'value': value
-                            })
-                    balances.sort(key=lambda x: x['value'], reverse=True)
-                    return balances
-                elif isinstance(assets, dict) and 'error' in assets:
-                    print(f"获取资产失败: {assets['error']}")
-                    return []
-            except json.JSONDecodeError:
-                print(f"解析资产数据失败")
-                return []
-
-        # Binance 使用专门的命令获取现货余额
-        if exchange_base == "binance":
-            output = run_on_ec2(f"spot_balance {exchange}")
-            try:
-                assets = json.loads(output.strip())
-                if isinstance(assets, list):
-                    for a in assets:
-                        asset = a.get('asset', '').upper()
-                        free = float(a.get('free', 0))
-                        if asset in STABLECOINS or free <= 0:
-                            continue
-                        price = get_coin_price(asset)
-                        value = free * price
-                        min_display = 1 if exchange_base == "aster" else MIN_DISPLAY_VALUE
-                        if value >= min_display:
-                            balances.append({
-                                'asset': asset,
-                                'free': free,
-                                'value': value
-                            })
-                    balances.sort(key=lambda x: x['value'], reverse=True)
-                    return balances
-                elif isinstance(assets, dict) and 'error' in assets:
-                    print(f"获取资产失败: {assets['error']}")
-                    return []
-            except json.JSONDecodeError:
-                print(f"解析资产数据失败")
-                return []
-
-        # 其他交易所使用 balance 命令
-        output = run_on_ec2(f"balance {exchange}")
-
-        raw_balances = []
-        if exchange_base == "aster":
-            for line in output.split('\n'):
-                parts = line.split()
-                if len(parts) >= 2 and "可用:" in line:
-                    asset = parts[0].strip().upper()
-                    for j, p in enumerate(parts):
-                        if p == "可用:" and j + 1 < len(parts):
-                            try:
-                                amount = float(parts[j + 1])
-                                if amount > 0:
-                                    raw_balances.append({'asset': asset, 'free': amount})
-                            except ValueError:
-                                pass
-        else:
-            for line in output.split('\n'):
-                line = line.strip()
-                if not line or ':' not in line:
-                    continue
-                parts = line.split(':')
-                if len(parts) >= 2:
-                    asset = parts[0].strip().upper()
-                    try:
-                        amount_str = parts[1].strip().split()[0]
-                        amount = float(amount_str)
-                        if amount > 0:
-                            raw_balances.append({'asset': asset, 'free': amount})
-                    except (ValueError, IndexError):
-                        continue
+        assets = json.loads(output.strip())
+    except json.JSONDecodeError:
+        raise SSHError("解析资产数据失败")
+    if isinstance(assets, dict):
+        raise SSHError(f"获取资产失败: {assets.get('error', assets)}")
+    return assets
 
+
+def get_spot_balances(exchange: str, min_value: float = None, fresh: bool = False) -> list:
+    """获取现货余额（通过 EC2），一次查询余额 + 一次批量价格表估值
+
+    Args:
+        min_value: 最小显示价值 (美元)，默认 MIN_DISPLAY_VALUE (Aster 文本余额为 1)；
+            批量清仓小额资产时传 0
+        fresh: 跳过缓存同步查询 (批量清仓按全部数量卖出前)
+
+    Returns:
+        [{"asset", "free", "value"}]，按价值从高到低排序
+    """
+    exchange_base = get_exchange_base(exchange)
+
+    try:
+        raw_balances = snapshot_cache.get(exchange, "spot_balances", lambda: fetch_spot_assets(exchange),
+                                          fresh=fresh).value
+
+        # Bitget/Gate 专门命令返回的资产已含估值
+        if exchange_base in ("bitget", "gate"):
+            return [a for a in raw_balances if a.get('free', 0) > 0
+                    and (min_value is None or a.get('value', 0) >= min_value)]
+
+        text_output = exchange_base not in SPOT_ASSETS_COMMANDS
+        holdings = []
         for b in raw_balances:
             asset = b.get('asset', '').upper()
             free = float(b.get('free', 0))
+            if asset and asset not in STABLECOINS and free > 0:
+                holdings.append((asset, free))
+        prices = get_prices(asset for asset, _ in holdings)
 
-            if asset in STABLECOINS or free <= 0:
-                continue
-
-            price = get_coin_price(asset)
+        balances = []
+        for asset, free in holdings:
+            price = prices.get(asset, 0)
             value = free * price
-
-            if exchange_base == "aster":
+            min_display = MIN_DISPLAY_VALUE if min_value is None else min_value
+            if exchange_base == "aster" and text_output:
                 # Aster 经常有一些未知币种无法在 Binance 获取价格
                 if price == 0:
                     value = free  # 假设价格为1，只要数量 >= 1 就显示
-                min_display = 1
-            else:
-                min_display = MIN_DISPLAY_VALUE
-
+                if min_value is None:
+                    min_display = 1
             if value >= min_display:
                 balances.append({
                     'asset': asset,
@@ -1324,60 +1357,218 @@ def display_balances(balances: list) -> None:
         print(f"  {i}. {asset}: {free:.6f}")
 
 
-def market_sell_spot(exchange: str, symbol: str, qty: float) -> bool:
-    """现货市价卖出（通过 EC2）"""
-    exchange_base = get_exchange_base(exchange)
+# 各交易所现货市价卖出的 EC2 命令
+MARKET_SELL_COMMANDS = {
+    "binance": "market_sell",
+    "gate": "gate_market_sell",
+    "bitget": "bitget_market_sell",
+    "aster": "aster_spot_market_sell",
+}
 
+
+def _spot_symbol(exchange_base: str, asset: str) -> str:
+    """币种对 USDT 的现货交易对名称"""
+    return f"{asset}_USDT" if exchange_base == "gate" else f"{asset}USDT"
+
+
+def _market_sell_cmd(exchange: str, symbol: str, qty) -> str:
+    """现货市价卖出的 EC2 命令，不支持的交易所返回 None"""
+    command = MARKET_SELL_COMMANDS.get(get_exchange_base(exchange))
+    return f"{command} {exchange} {symbol} {qty}" if command else None
+
+
+def _parse_market_sell(exchange_base: str, output: str) -> dict:
+    """解析市价卖出命令的输出，返回 {"ok", "order_id", "executed_qty", "quote_qty", "error"}"""
+    result = {"ok": False, "order_id": None, "executed_qty": None, "quote_qty": None, "error": None}
     try:
+        data = json.loads(output.strip())
         if exchange_base == "binance":
-            output = run_on_ec2(f"market_sell {exchange} {symbol} {qty}")
-            result = json.loads(output.strip())
-            if 'orderId' in result:
-                print(f"  订单ID: {result['orderId']}")
-                print(f"  成交数量: {result.get('executedQty', 'N/A')}")
-                return True
+            if 'orderId' in data:
+                result.update(ok=True, order_id=data['orderId'], executed_qty=data.get('executedQty'),
+                              quote_qty=data.get('cummulativeQuoteQty'))
             else:
-                print(f"  错误: {result.get('msg', result)}")
-                return False
+                result["error"] = data.get('msg', data)
         elif exchange_base == "gate":
-            output = run_on_ec2(f"gate_market_sell {exchange} {symbol} {qty}")
-            result = json.loads(output.strip())
-            if 'id' in result:
-                print(f"  订单ID: {result['id']}")
-                print(f"  成交数量: {result.get('amount', 'N/A')}")
-                return True
+            if 'id' in data:
+                result.update(ok=True, order_id=data['id'], executed_qty=data.get('amount'),
+                              quote_qty=data.get('filled_total'))
             else:
-                print(f"  错误: {result.get('message', result)}")
-                return False
+                result["error"] = data.get('message', data)
         elif exchange_base == "bitget":
-            output = run_on_ec2(f"bitget_market_sell {exchange} {symbol} {qty}")
-            result = json.loads(output.strip())
-            data = result.get('data') or {}
-            if result.get('code') == '00000' or 'orderId' in data:
-                print(f"  订单ID: {data.get('orderId', 'N/A')}")
-                return True
+            order = data.get('data') or {}
+            if data.get('code') == '00000' or 'orderId' in order:
+                result.update(ok=True, order_id=order.get('orderId', 'N/A'))
             else:
-                print(f"  错误: {result.get('msg', result)}")
-                return False
+                result["error"] = data.get('msg', data)
         elif exchange_base == "aster":
-            output = run_on_ec2(f"aster_spot_market_sell {exchange} {symbol} {qty}")
-            result = json.loads(output.strip())
-            if isinstance(result, dict) and ('orderId' in result or 'id' in result):
-                order_id = result.get('orderId') or result.get('id', 'N/A')
-                print(f"  订单ID: {order_id}")
-                return True
+            if isinstance(data, dict) and ('orderId' in data or 'id' in data):
+                result.update(ok=True, order_id=data.get('orderId') or data.get('id', 'N/A'),
+                              executed_qty=data.get('executedQty'), quote_qty=data.get('cummulativeQuoteQty'))
             else:
-                print(f"  错误: {result.get('msg', result.get('message', result))}")
-                return False
-        else:
-            print(f"暂不支持 {exchange_base} 交易所的市价卖出")
-            return False
+                result["error"] = data.get('msg', data.get('message', data))
     except json.JSONDecodeError as e:
-        print(f"解析响应失败: {e}")
-        return False
+        result["error"] = f"解析响应失败: {e}"
     except Exception as e:
-        print(f"卖出失败: {e}")
-        return False
+        result["error"] = f"卖出失败: {e}"
+    return result
+
+
+def _market_sell_spot_raw(exchange: str, symbol: str, qty: float) -> dict:
+    """现货市价卖出（通过 EC2），返回 {"ok", "order_id", "executed_qty", "quote_qty", "error"}
+
+    executed_qty / quote_qty 为交易所返回的成交数量和成交金额，未返回时为 None
+    """
+    exchange_base = get_exchange_base(exchange)
+    cmd = _market_sell_cmd(exchange, symbol, qty)
+    if cmd is None:
+        return {"ok": False, "order_id": None, "executed_qty": None, "quote_qty": None,
+                "error": f"暂不支持 {exchange_base} 交易所的市价卖出"}
+    try:
+        output = run_on_ec2(cmd)
+    except Exception as e:
+        return {"ok": False, "order_id": None, "executed_qty": None, "quote_qty": None, "error": f"卖出失败: {e}"}
+    return _parse_market_sell(exchange_base, output)
+
+
+def market_sell_spot(exchange: str, symbol: str, qty: float) -> bool:
+    """现货市价卖出（通过 EC2）"""
+    result = _market_sell_spot_raw(exchange, symbol, qty)
+    if result["ok"]:
+        print(f"  订单ID: {result['order_id']}")
+        if get_exchange_base(exchange) in ("binance", "gate"):
+            print(f"  成交数量: {result['executed_qty'] or 'N/A'}")
+        return True
+    print(f"  错误: {result['error']}")
+    return False
+
+
+# ===================== 批量清仓 =====================
+
+def plan_liquidation(exchange: str, balances: list, mode: str, threshold: float) -> list:
+    """按价值阈值计算每个资产的卖出数量 (本地按缓存的交易规则取整，不逐个查询)
+
+    Args:
+        balances: get_spot_balances 的结果
+        mode: "above" 卖出价值 >= threshold 的资产 / "below" 清理价值 < threshold 的小额资产
+
+    Returns:
+        [{"asset", "symbol", "free", "qty", "value", "skip"}]，skip 为不卖出的原因 (None 表示卖出)
+    """
+    exchange_base = get_exchange_base(exchange)
+    venue = get_venue(exchange, "spot")
+    plan = []
+    for b in balances:
+        value = b.get('value', 0)
+        if (value >= threshold) != (mode == "above"):
+            continue
+        asset = b['asset']
+        symbol = _spot_symbol(exchange_base, asset)
+        free = float(b['free'])
+        qty = adjust_quantity_for_lot_size(free, symbol, exchange_base)
+        price = value / free if free else 0
+        skip = None
+        info = get_symbol_filter(venue, symbol) if venue else None
+        if not info and not price:
+            skip = "无 USDT 交易对或价格"
+        elif qty <= 0 or (info and qty < float(info["minQty"])):
+            skip = "低于最小下单数量"
+        elif venue and price and not check_min_notional(venue, symbol, qty, price):
+            skip = "低于最小下单金额"
+        plan.append({"asset": asset, "symbol": symbol, "free": free, "qty": qty, "value": value, "skip": skip})
+    return plan
+
+
+def liquidate_spot(exchange: str, plan: list) -> list:
+    """一次批量 EC2 调用并发提交所有市价卖单
+
+    Returns:
+        [{"asset", "symbol", "qty", "value", "ok", "executed_qty", "quote_qty", "error"}]
+    """
+    exchange_base = get_exchange_base(exchange)
+    orders = [p for p in plan if not p["skip"]]
+    if not orders:
+        return []
+    try:
+        results = run_on_ec2_many([_market_sell_cmd(exchange, p["symbol"], p["qty"]) for p in orders])
+    except SSHError as e:
+        results = [{"output": "", "error": f"{e} (部分订单可能已提交)"}] * len(orders)
+
+    report = []
+    for p, r in zip(orders, results):
+        if r["error"]:
+            parsed = {"ok": False, "executed_qty": None, "quote_qty": None, "error": r["error"]}
+        else:
+            parsed = _parse_market_sell(exchange_base, r["output"])
+        report.append({
+            "asset": p["asset"], "symbol": p["symbol"], "qty": p["qty"], "value": p["value"],
+            "ok": parsed["ok"], "executed_qty": parsed["executed_qty"], "quote_qty": parsed["quote_qty"],
+            "error": parsed["error"],
+        })
+    return report
+
+
+def display_liquidation_report(report: list) -> None:
+    """显示批量清仓成交汇总"""
+    print(f"\n{'币种':<10} {'卖出数量':>18} {'成交金额 (USDT)':>18}  状态")
+    print("-" * 64)
+    total_quote = 0.0
+    estimated = False
+    for r in report:
+        if r["ok"]:
+            qty = float(r["executed_qty"]) if r["executed_qty"] else r["qty"]
+            if r["quote_qty"]:
+                quote = float(r["quote_qty"])
+                quote_text = f"{quote:,.4f}"
+            else:
+                # 交易所未返回成交金额，按估值计算
+                quote = r["value"] * qty / r["qty"] if r["qty"] else 0
+                quote_text = f"≈{quote:,.4f}"
+                estimated = True
+            total_quote += quote
+            print(f"{r['asset']:<10} {qty:>18,.6f} {quote_text:>18}  ✅")
+        else:
+            print(f"{r['asset']:<10} {r['qty']:>18,.6f} {'-':>18}  ❌ {r['error']}")
+    print("-" * 64)
+    success = sum(r["ok"] for r in report)
+    print(f"成功 {success}/{len(report)} 笔，合计约 {total_quote:,.4f} USDT" + (" (≈ 为估算值)" if estimated else ""))
+
+
+def bulk_liquidate_menu(exchange: str):
+    """按价值阈值批量市价卖出现货资产 (一次余额查询 + 一次批量下单)"""
+    print(f"\n=== 批量清仓 ===")
+    mode_idx = select_option("选择清仓方式:", ["卖出价值不低于阈值的全部资产", "清理价值低于阈值的小额资产"],
+                             allow_back=True)
+    if mode_idx == -1:
+        return
+    mode = "above" if mode_idx == 0 else "below"
+    threshold = input_amount("请输入价值阈值 (USDT):")
+    if threshold is None:
+        return
+
+    print("\n正在获取现货余额...")
+    balances = get_spot_balances(exchange, min_value=0, fresh=True)
+    plan = plan_liquidation(exchange, balances, mode, float(threshold))
+    if not plan:
+        print("没有符合条件的资产")
+        return
+
+    print(f"\n{'币种':<10} {'可用数量':>18} {'卖出数量':>18} {'估值 (USDT)':>14}")
+    print("-" * 64)
+    for p in plan:
+        qty_text = f"跳过: {p['skip']}" if p["skip"] else f"{p['qty']:,.6f}"
+        print(f"{p['asset']:<10} {p['free']:>18,.6f} {qty_text:>18} {p['value']:>14,.2f}")
+    orders = [p for p in plan if not p["skip"]]
+    if not orders:
+        print("\n没有可卖出的资产")
+        return
+
+    total = sum(p["value"] for p in orders)
+    if select_option(f"确认市价卖出 {len(orders)} 个资产 (估值约 {total:,.2f} USDT)?", ["确认", "取消"]) != 0:
+        print("已取消")
+        return
+
+    print("\n正在并发下单...")
+    display_liquidation_report(liquidate_spot(exchange, plan))
 
 
 def buy_bgb(exchange: str):
@@ -1465,11 +1656,16 @@ def market_sell_menu(exchange: str):
         mode = select_option("选择操作方式:", [
             "从余额列表选择",
             "手动输入币种",
+            "批量清仓 (按价值阈值)",
             "返回"
         ])
 
-        if mode == 2:
+        if mode == 3:
             return
+        if mode == 2:
+            bulk_liquidate_menu(exchange)
+            input("\n按回车继续...")
+            continue
 
         if mode == 0:
             print("\n正在获取现货余额...")
@@ -1495,10 +1691,7 @@ def market_sell_menu(exchange: str):
             asset = selected['asset']
             available = selected['free']
 
-            if exchange_base == "gate":
-                symbol = f"{asset}_USDT"
-            else:
-                symbol = f"{asset}USDT"
+            symbol = _spot_symbol(exchange_base, asset)
 
             print(f"\n卖出: {asset}")
             print(f"可用数量: {available}")
@@ -1528,10 +1721,7 @@ def market_sell_menu(exchange: str):
             if not asset or asset == "0":
                 continue
 
-            if exchange_base == "gate":
-                symbol = f"{asset}_USDT"
-            else:
-                symbol = f"{asset}USDT"
+            symbol = _spot_symbol(exchange_base, asset)
 
             qty = input_amount("请输入卖出数量:")
             if qty is None:
@@ -1547,6 +1737,14 @@ def market_sell_menu(exchange: str):
             print("调整后数量为 0，无法卖出")
             continue
 
+        mode = select_option("选择卖出方式:", ["一次性市价卖出", "分批卖出 (TWAP，限制滑点)", "返回"])
+        if mode == 2:
+            continue
+        if mode == 1:
+            _run_twap(_SpotSellBroker(exchange, symbol), "sell", qty, asset)
+            input("\n按回车继续...")
+            continue
+
         print("\n" + "=" * 50)
         print("请确认市价卖出:")
         print(f"  交易对: {symbol}")
@@ -1570,123 +1768,68 @@ def market_sell_menu(exchange: str):
 
 # ===================== 永续平仓 =====================
 
-def get_um_positions(exchange: str) -> list:
-    """获取 U本位永续合约持仓（通过 EC2）"""
-    exchange_base = get_exchange_base(exchange)
-
-    try:
-        if exchange_base == "binance":
-            output = run_on_ec2(f"portfolio_um_positions {exchange}")
-            positions = json.loads(output.strip())
-
-            if isinstance(positions, dict) and "msg" in positions:
-                print(f"API 错误: {positions.get('msg')}")
-                return []
-
-            result = []
-            for p in positions:
-                symbol = p.get("symbol", "")
-                position_amt = float(p.get("positionAmt", 0))
-                entry_price = float(p.get("entryPrice", 0))
-                mark_price = float(p.get("markPrice", 0))
-                unrealized_pnl = float(p.get("unRealizedProfit", 0))
-
-                if position_amt == 0:
-                    continue
-
-                notional = abs(position_amt * mark_price)
+# 永续持仓查询命令: 交易所 -> (命令, 错误字段)
+UM_POSITIONS_COMMANDS = {
+    "binance": ("portfolio_um_positions", "msg"),
+    "bybit": ("bybit_positions", "error"),
+    "aster": ("aster_positions_json", "error"),
+}
 
-                result.append({
-                    "symbol": symbol,
-                    "positionAmt": position_amt,
-                    "entryPrice": entry_price,
-                    "markPrice": mark_price,
-                    "unrealizedPnl": unrealized_pnl,
-                    "notional": notional,
-                    "side": "LONG" if position_amt > 0 else "SHORT"
-                })
-
-            result.sort(key=lambda x: x["notional"], reverse=True)
-            return result
-        elif exchange_base == "bybit":
-            output = run_on_ec2(f"bybit_positions {exchange}")
-            positions = json.loads(output.strip())
-
-            if isinstance(positions, dict) and "error" in positions:
-                print(f"API 错误: {positions.get('error')}")
-                return []
-
-            result = []
-            for p in positions:
-                symbol = p.get("symbol", "")
-                position_amt = float(p.get("positionAmt", 0))
-                entry_price = float(p.get("entryPrice", 0))
-                mark_price = float(p.get("markPrice", 0))
-                unrealized_pnl = float(p.get("unRealizedProfit", 0))
-
-                if position_amt == 0:
-                    continue
-
-                notional = abs(position_amt * mark_price)
-
-                result.append({
-                    "symbol": symbol,
-                    "positionAmt": position_amt,
-                    "entryPrice": entry_price,
-                    "markPrice": mark_price,
-                    "unrealizedPnl": unrealized_pnl,
-                    "notional": notional,
-                    "side": "LONG" if position_amt > 0 else "SHORT"
-                })
-
-            result.sort(key=lambda x: x["notional"], reverse=True)
-            return result
 
-        elif exchange_base == "aster":
-            output = run_on_ec2(f"aster_positions_json {exchange}")
-            positions = json.loads(output.strip())
-
-            if isinstance(positions, dict) and "error" in positions:
-                print(f"API 错误: {positions.get('error')}")
-                return []
-
-            result = []
-            for p in positions:
-                symbol = p.get("symbol", "")
-                position_amt = float(p.get("positionAmt", 0))
-                entry_price = float(p.get("entryPrice", 0))
-                mark_price = float(p.get("markPrice", 0))
-                unrealized_pnl = float(p.get("unRealizedProfit", 0))
-
-                if position_amt == 0:
-                    continue
+def fetch_um_positions(exchange: str) -> list:
+    """查询永续合约原始持仓列表 (交易所返回的字段)，失败抛出 SSHError
 
-                notional = abs(position_amt * mark_price)
-
-                result.append({
-                    "symbol": symbol,
-                    "positionAmt": position_amt,
-                    "entryPrice": entry_price,
-                    "markPrice": mark_price,
-                    "unrealizedPnl": unrealized_pnl,
-                    "notional": notional,
-                    "side": "LONG" if position_amt > 0 else "SHORT"
-                })
+    持仓分析页面和平仓菜单共用，结果缓存在 snapshot_cache 的 "um_positions" 中
+    """
+    exchange_base = get_exchange_base(exchange)
+    if exchange_base not in UM_POSITIONS_COMMANDS:
+        raise SSHError(f"暂不支持 {exchange_base} 交易所的永续持仓查询")
+    command, error_field = UM_POSITIONS_COMMANDS[exchange_base]
+    output = run_on_ec2(f"{command} {exchange}")
+    try:
+        positions = json.loads(output.strip())
+    except json.JSONDecodeError as e:
+        raise SSHError(f"解析响应失败: {e}")
+    if isinstance(positions, dict):
+        raise SSHError(f"API 错误: {positions.get(error_field, positions)}")
+    return positions
 
-            result.sort(key=lambda x: x["notional"], reverse=True)
-            return result
 
-        else:
-            print(f"暂不支持 {exchange_base} 交易所的永续持仓查询")
-            return []
+def get_um_positions(exchange: str, fresh: bool = False) -> list:
+    """获取 U本位永续合约持仓（通过 EC2）
 
-    except json.JSONDecodeError as e:
-        print(f"解析响应失败: {e}")
-        return []
-    except Exception as e:
+    Args:
+        fresh: 跳过缓存同步查询 (平仓前确认数量)
+    """
+    try:
+        positions = snapshot_cache.get(exchange, "um_positions", lambda: fetch_um_positions(exchange),
+                                       fresh=fresh).value
+    except SSHError as e:
         print(f"获取持仓失败: {e}")
         return []
 
+    result = []
+    for p in positions:
+        try:
+            position_amt = float(p.get("positionAmt", 0))
+            if position_amt == 0:
+                continue
+            mark_price = float(p.get("markPrice", 0))
+            result.append({
+                "symbol": p.get("symbol", ""),
+                "positionAmt": position_amt,
+                "entryPrice": float(p.get("entryPrice", 0)),
+                "markPrice": mark_price,
+                "unrealizedPnl": float(p.get("unRealizedProfit", 0)),
+                "notional": abs(position_amt * mark_price),
+                "side": "LONG" if position_amt > 0 else "SHORT"
+            })
+        except (TypeError, ValueError) as e:
+            print(f"解析持仓失败: {e}")
+
+    result.sort(key=lambda x: x["notional"], reverse=True)
+    return result
+
 
 def display_positions(positions: list) -> None:
     """显示持仓列表"""
@@ -1795,7 +1938,7 @@ def futures_close_menu(exchange: str):
 
         if mode == 0:
             print("\n正在获取持仓...")
-            positions = get_um_positions(exchange)
+            positions = get_um_positions(exchange, fresh=True)
             display_positions(positions)
 
             if not positions:
@@ -1860,6 +2003,16 @@ def futures_close_menu(exchange: str):
             if qty is None:
                 continue
 
+        # 根据合约交易规则调整数量
+        adjusted_qty = adjust_quantity_for_lot_size(qty, symbol, get_exchange_base(exchange), "futures")
+        if adjusted_qty != qty:
+            print(f"\n注意: 根据交易规则，数量已调整为 {adjusted_qty}")
+            qty = adjusted_qty
+
+        if qty <= 0:
+            print("调整后数量为 0，无法平仓")
+            continue
+
         close_action = "卖出" if position_side == "LONG" else "买入"
         print("\n" + "=" * 50)
         print("请确认市价平仓:")
@@ -3,6 +3,7 @@
 
 import json
 from utils import run_on_ec2, select_option, select_exchange, get_exchange_base, get_exchange_display_name, input_amount, SSHError
+from ec2_schema import SchemaError, fetch_wallet_snapshot
 
 
 class TransferError(Exception):
@@ -11,23 +12,17 @@ class TransferError(Exception):
 
 
 def _show_bybit_unified_balances(exchange: str):
-    """显示 Bybit 统一账户常用币种余额"""
+    """显示 Bybit 统一账户非零余额"""
     print("\n" + "=" * 50)
     print("📦 统一账户余额 (UNIFIED):")
     print("=" * 50)
-    common_coins = ["USDT", "USDC", "BTC", "ETH"]
-    has_balance = False
-    for coin in common_coins:
-        try:
-            output = run_on_ec2(f"account_balance {exchange} UNIFIED {coin}").strip()
-            if not output:
-                continue
-            bal = float(output)
-            if bal > 0:
-                has_balance = True
-                print(f"  {coin}: {bal:.8f}".rstrip("0").rstrip("."))
-        except (SSHError, ValueError):
-            continue
+    try:
+        unified = fetch_wallet_snapshot(exchange).wallet("UNIFIED")
+    except (SSHError, SchemaError):
+        unified = {}
+    has_balance = bool(unified)
+    for coin, bal in sorted(unified.items()):
+        print(f"  {coin}: {bal:.8f}".rstrip("0").rstrip("."))
 
     if not has_balance:
         print("  统一账户暂无余额")
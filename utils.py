@@ -4,7 +4,13 @@
 import subprocess
 import json
 import os
+import functools
 import shlex
+import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import NamedTuple
 
 # 配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -34,50 +40,64 @@ class ConfigError(Exception):
 
 # ===================== 配置管理 =====================
 
-def load_config():
-    """加载配置文件"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"users": {}, "ssh": {}, "_legacy": {}}
+# 禁用提现和地址簿的用户
+NO_WITHDRAW_USERS = ("frances", "vanie", "litianyi")
 
 
-def save_config(config: dict):
-    """保存配置文件"""
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
+class AccountRecord(NamedTuple):
+    """账户路由表中的一条记录 (由配置构建，只读)"""
+    ec2_key: str              # EC2 使用的交易所 key，如 dennis_binance
+    user_id: str
+    user_name: str
+    account_id: str
+    venue: str                # 交易所基础类型，如 binance / bybit / hyperliquid
+    display: str              # 显示名称，如 "BINANCE - Dennis"
+    capabilities: frozenset   # 该账户可用的功能，见 _account_capabilities
+    credentials: Mapping      # 账户配置 (api_key / wallet_address 等)
 
 
-def get_users():
-    """获取所有用户列表 [(user_id, name), ...]"""
-    config = load_config()
-    users = config.get("users", {})
-    return [(uid, info.get("name", uid)) for uid, info in users.items()]
+class _ConfigSnapshot(NamedTuple):
+    """config.json 的只读快照及预先计算的索引"""
+    stat_key: tuple
+    config: Mapping
+    users: tuple              # ((user_id, name), ...)
+    user_accounts: Mapping    # user_id -> ((account_id, EXCHANGE), ...)
+    ec2_keys: Mapping         # (user_id, account_id) -> ec2_key
+    legacy: Mapping           # ec2_key -> user_id
+    ssh: tuple                # (host, user, hostname, port, key)
+    accounts: Mapping         # ec2_key -> AccountRecord
+    account_ids: Mapping      # (user_id, account_id) -> AccountRecord
 
 
-def get_user_accounts(user_id: str):
-    """获取用户的所有交易所账号 [(account_id, exchange_name), ...]"""
-    config = load_config()
-    user = config.get("users", {}).get(user_id, {})
-    accounts = user.get("accounts", {})
-    return [(acc_id, acc.get("exchange", acc_id).upper()) for acc_id, acc in accounts.items()]
+_config_snapshot = None
+_config_lock = threading.Lock()
 
+_DEFAULT_CONFIG = {"users": {}, "ssh": {}, "_legacy": {}}
 
-def get_ec2_exchange_key(user_id: str, account_id: str) -> str:
-    """获取 EC2 使用的交易所 key (如 dennis_binance, baiqing_binance)
 
-    EC2 上的脚本使用 {user}_{exchange} 格式的 key 区分不同账号
-    """
-    config = load_config()
-    user_accounts = config.get("users", {}).get(user_id, {}).get("accounts", {})
-    account = user_accounts.get(account_id, {})
-    exchange_type = account.get("exchange", account_id)
+def _freeze(obj):
+    """递归转换为只读结构 (dict -> MappingProxyType, list -> tuple)"""
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def _config_stat_key():
+    """配置文件的 (mtime, inode, size)，文件不存在返回 None"""
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
 
+
+def _resolve_ec2_key(user_id: str, exchange_type: str, legacy: Mapping) -> str:
     # 标准格式: {user_id}_{exchange}
     ec2_key = f"{user_id}_{exchange_type}"
 
     # 检查 _legacy 是否有这个 key
-    legacy = config.get("_legacy", {})
     if ec2_key in legacy:
         return ec2_key
 
@@ -91,25 +111,170 @@ def get_ec2_exchange_key(user_id: str, account_id: str) -> str:
     return ec2_key
 
 
-# ===================== SSH 执行 =====================
+def _account_capabilities(venue: str, user_id: str) -> frozenset:
+    """根据交易所类型和用户限制计算账户可用功能"""
+    # Hyperliquid 和 Lighter 使用本地函数，其他交易所通过 EC2
+    if venue == "hyperliquid":
+        return frozenset({"balance", "transfer", "funding_history"})
+    if venue == "lighter":
+        return frozenset({"balance", "margin_ratio", "funding_history"})
+
+    caps = {"balance", "spot_trade"}
+    # Aster 和 Gate 不支持提现
+    if venue not in ("aster", "gate") and user_id not in NO_WITHDRAW_USERS:
+        caps.add("withdraw")
+    if venue != "gate":
+        caps.add("transfer")
+    if venue in ("binance", "bybit", "aster"):
+        caps.add("futures_trade")
+    if venue in ("binance", "okx"):
+        caps.add("earn")
+    if venue == "binance":
+        caps.update({"position_analysis", "bnb_tools", "margin_ratio", "funding_history"})
+        if user_id != "litianyi":
+            caps.add("stablecoin_trade")
+        if user_id == "dennis":
+            caps.add("subaccount_transfer")
+    elif venue == "gate":
+        caps.update({"buy_gt", "gate_subaccounts"})
+    elif venue == "bitget":
+        caps.add("buy_bgb")
+    elif venue == "bybit":
+        caps.update({"stablecoin_trade", "margin_ratio"})
+        if user_id == "eb65":
+            caps.add("funding_history")
+    elif venue == "aster":
+        caps.update({"margin_ratio", "funding_history"})
+    if venue != "aster" and user_id not in NO_WITHDRAW_USERS:
+        caps.add("addresses")
+    return frozenset(caps)
+
+
+def _build_snapshot(stat_key, raw: dict) -> _ConfigSnapshot:
+    config = _freeze(raw)
+    users = config.get("users", {})
+    legacy = config.get("_legacy", {})
 
-def get_ssh_config():
-    """从配置文件读取SSH连接信息"""
-    ssh_host = DEFAULT_EC2_HOST
-    ssh_user = None
-    ssh_hostname = None
-    ssh_port = None
-    ssh_key = None
+    user_accounts = {}
+    ec2_keys = {}
+    accounts_by_key = {}
+    accounts_by_id = {}
+    for user_id, user in users.items():
+        user_name = user.get("name", user_id)
+        accounts = user.get("accounts", {})
+        user_accounts[user_id] = tuple(
+            (acc_id, acc.get("exchange", acc_id).upper()) for acc_id, acc in accounts.items()
+        )
+        for acc_id, acc in accounts.items():
+            exchange_type = acc.get("exchange", acc_id)
+            ec2_key = _resolve_ec2_key(user_id, exchange_type, legacy)
+            ec2_keys[(user_id, acc_id)] = ec2_key
+            venue = _infer_venue(ec2_key)
+            record = AccountRecord(
+                ec2_key=ec2_key,
+                user_id=user_id,
+                user_name=user_name,
+                account_id=acc_id,
+                venue=venue,
+                display=f"{exchange_type.upper()} - {user_name}",
+                capabilities=_account_capabilities(venue, user_id),
+                credentials=acc,
+            )
+            accounts_by_id[(user_id, acc_id)] = record
+            # legacy 可能多对一，保留第一个
+            accounts_by_key.setdefault(ec2_key, record)
 
-    config = load_config()
     ssh_config = config.get("ssh", {})
-    ssh_host = ssh_config.get("host", DEFAULT_EC2_HOST)
-    ssh_user = ssh_config.get("user")
-    ssh_hostname = ssh_config.get("hostname")
-    ssh_port = ssh_config.get("port")
-    ssh_key = ssh_config.get("key")
+    ssh = (
+        ssh_config.get("host", DEFAULT_EC2_HOST),
+        ssh_config.get("user"),
+        ssh_config.get("hostname"),
+        ssh_config.get("port"),
+        ssh_config.get("key"),
+    )
+    return _ConfigSnapshot(
+        stat_key=stat_key,
+        config=config,
+        users=tuple((uid, info.get("name", uid)) for uid, info in users.items()),
+        user_accounts=MappingProxyType(user_accounts),
+        ec2_keys=MappingProxyType(ec2_keys),
+        legacy=legacy,
+        ssh=ssh,
+        accounts=MappingProxyType(accounts_by_key),
+        account_ids=MappingProxyType(accounts_by_id),
+    )
+
+
+def _get_config_snapshot() -> _ConfigSnapshot:
+    """获取配置快照，仅在文件 mtime/inode/size 变化时重新解析"""
+    global _config_snapshot
+    stat_key = _config_stat_key()
+    snapshot = _config_snapshot
+    if snapshot is not None and snapshot.stat_key == stat_key:
+        return snapshot
+
+    with _config_lock:
+        if _config_snapshot is not None and _config_snapshot.stat_key == stat_key:
+            return _config_snapshot
+        if stat_key is None:
+            raw = _DEFAULT_CONFIG
+        else:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        _config_snapshot = _build_snapshot(stat_key, raw)
+        return _config_snapshot
+
+
+def load_config():
+    """加载配置文件 (只读快照，文件未变化时不重新解析；需要修改时请先 copy.deepcopy)"""
+    return _get_config_snapshot().config
+
+
+def save_config(config: dict):
+    """保存配置文件"""
+    global _config_snapshot
+    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump(_thaw(config), f, indent=4, ensure_ascii=False)
+    _config_snapshot = None
+
 
-    return ssh_host, ssh_user, ssh_hostname, ssh_port, ssh_key
+def _thaw(obj):
+    """_freeze 的逆操作，便于序列化"""
+    if isinstance(obj, Mapping):
+        return {k: _thaw(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_thaw(v) for v in obj]
+    return obj
+
+
+def get_users():
+    """获取所有用户列表 [(user_id, name), ...]"""
+    return list(_get_config_snapshot().users)
+
+
+def get_user_accounts(user_id: str):
+    """获取用户的所有交易所账号 [(account_id, exchange_name), ...]"""
+    return list(_get_config_snapshot().user_accounts.get(user_id, ()))
+
+
+def get_ec2_exchange_key(user_id: str, account_id: str) -> str:
+    """获取 EC2 使用的交易所 key (如 dennis_binance, baiqing_binance)
+
+    EC2 上的脚本使用 {user}_{exchange} 格式的 key 区分不同账号
+    """
+    snapshot = _get_config_snapshot()
+    ec2_key = snapshot.ec2_keys.get((user_id, account_id))
+    if ec2_key is None:
+        # 未配置的账号: 按交易所类型推断
+        ec2_key = _resolve_ec2_key(user_id, account_id, snapshot.legacy)
+    return ec2_key
+
+
+# ===================== SSH 执行 =====================
+
+def get_ssh_config():
+    """从配置文件读取SSH连接信息"""
+    return _get_config_snapshot().ssh
 
 
 def is_windows():
@@ -125,8 +290,11 @@ def get_control_socket_path():
     return "/tmp/ec2_ctl"
 
 
-def ensure_ssh_connection():
-    """确保 SSH ControlMaster 连接已建立（仅 Unix）"""
+def ensure_ssh_connection(quiet: bool = False):
+    """确保 SSH ControlMaster 连接已建立（仅 Unix）
+
+    quiet 为 True 时不输出进度 (后台线程预热连接时使用，避免打乱菜单输出)
+    """
     import os
 
     # Windows 不支持 ControlMaster，跳过
@@ -154,7 +322,8 @@ def ensure_ssh_connection():
         return True
 
     # 建立新的 ControlMaster 连接
-    print("正在建立 EC2 连接...")
+    if not quiet:
+        print("正在建立 EC2 连接...")
     ssh_cmd = ["ssh", "-fNM",  # -f 后台, -N 不执行命令, -M 主连接
                "-o", f"ControlPath={socket_path}",
                "-o", "ControlPersist=600",  # 保持 10 分钟
@@ -171,24 +340,24 @@ def ensure_ssh_connection():
 
     result = subprocess.run(ssh_cmd, capture_output=True, text=True, timeout=30)
     if result.returncode != 0:
-        print(f"建立连接失败: {result.stderr}")
+        if not quiet:
+            print(f"建立连接失败: {result.stderr}")
         return False
 
-    print("EC2 连接已建立 ✓")
+    if not quiet:
+        print("EC2 连接已建立 ✓")
     return True
 
 
-def run_on_ec2(cmd: str) -> str:
-    """在 EC2 上执行命令并返回结果"""
+def build_ssh_command(use_control: bool = True) -> list:
+    """构建到 EC2 的 ssh 命令前缀 (不含远端命令)"""
     ssh_host, ssh_user, ssh_hostname, ssh_port, ssh_key = get_ssh_config()
 
     # Windows 不支持 ControlMaster，直接连接
-    if is_windows():
+    if is_windows() or not use_control:
         ssh_cmd_parts = ["ssh"]
     else:
-        socket_path = get_control_socket_path()
-        ensure_ssh_connection()
-        ssh_cmd_parts = ["ssh", "-o", f"ControlPath={socket_path}"]
+        ssh_cmd_parts = ["ssh", "-o", f"ControlPath={get_control_socket_path()}"]
 
     # 如果配置了详细的SSH信息，使用完整SSH命令
     if ssh_hostname:
@@ -208,23 +377,237 @@ def run_on_ec2(cmd: str) -> str:
         # 使用SSH config中的别名
         ssh_cmd_parts.append(ssh_host)
 
+    return ssh_cmd_parts
+
+
+# worker 启动失败后本次会话不再尝试，直接走逐条 ssh
+_worker_disabled = False
+
+
+def _use_worker() -> bool:
+    """是否使用 EC2 常驻 worker (config.json 中 ssh.worker 设为 false 可关闭)"""
+    if _worker_disabled:
+        return False
+    return load_config().get("ssh", {}).get("worker", True) is not False
+
+
+def warm_ec2_connection():
+    """提前建立 EC2 连接 (常驻 worker 或 ControlMaster)，不输出任何内容，执行命令时再报错"""
+    global _worker_disabled
+    if _use_worker():
+        from ec2_worker import get_worker, WorkerUnavailable
+        try:
+            get_worker().ensure_started(quiet=True)
+            return
+        except WorkerUnavailable:
+            _worker_disabled = True
+    if not is_windows():
+        ensure_ssh_connection(quiet=True)
+
+
+def run_on_ec2(cmd: str, env: dict = None) -> str:
+    """在 EC2 上执行命令并返回结果
+
+    优先通过常驻 worker 执行 (一次网络往返)，worker 不可用时回退到逐条 ssh。
+    env 为远端命令的额外环境变量 (如 ec2_schema.MACHINE_ENV 请求机器模式输出)。
+    """
+    global _worker_disabled
+    try:
+        if _use_worker():
+            from ec2_worker import get_worker, WorkerUnavailable
+            try:
+                result = get_worker().run(cmd, timeout=120, env=env)
+                return result["stdout"] + result["stderr"]
+            except WorkerUnavailable as e:
+                print(f"⚠️  EC2 worker 不可用，改用逐条 SSH 执行: {e}")
+                _worker_disabled = True
+        result = _run_on_ec2_direct(cmd, env)
+        return result.stdout + result.stderr
+    finally:
+        _invalidate_snapshots([cmd])
+
+
+async def run_on_ec2_async(cmd: str, timeout: int = 120, env: dict = None) -> str:
+    """run_on_ec2 的 asyncio 版本
+
+    所有并发调用通过常驻 worker 复用同一条 SSH 通道 (按请求 id 多路复用)，
+    不为每条命令启动 ssh 进程；worker 不可用时在线程中回退到逐条 ssh。
+    """
+    global _worker_disabled
+    try:
+        if _use_worker():
+            from ec2_worker import get_worker, WorkerUnavailable
+            try:
+                result = await get_worker().run_async(cmd, timeout=timeout, env=env)
+                return result["stdout"] + result["stderr"]
+            except WorkerUnavailable as e:
+                print(f"⚠️  EC2 worker 不可用，改用逐条 SSH 执行: {e}")
+                _worker_disabled = True
+        import asyncio
+        result = await asyncio.to_thread(_run_on_ec2_direct, cmd, env, timeout)
+        return result.stdout + result.stderr
+    finally:
+        _invalidate_snapshots([cmd])
+
+
+def run_on_ec2_many(cmds: list, timeout: int = 120, env=None) -> list:
+    """批量在 EC2 上执行多条命令 (一次往返，远端并发)
+
+    env 为远端命令的额外环境变量: dict 对所有命令生效，list 与 cmds 一一对应
+
+    Returns:
+        与 cmds 顺序一致的结果列表，每项为
+        {"cmd", "stdout", "stderr", "output", "returncode", "elapsed", "error"}；
+        单条命令超时只记录在该项的 error 中，连接失败则抛出 SSHError
+    """
+    if not cmds:
+        return []
+
+    try:
+        return _run_on_ec2_many(cmds, timeout, env)
+    finally:
+        _invalidate_snapshots(cmds)
+
+
+def _run_on_ec2_many(cmds: list, timeout: int, env) -> list:
+    global _worker_disabled
+    envs = list(env) if isinstance(env, (list, tuple)) else [env] * len(cmds)
+    raw = None
+    if _use_worker():
+        from ec2_worker import get_worker, WorkerUnavailable
+        try:
+            raw = get_worker().run_batch(cmds, timeout=timeout, envs=envs)
+        except WorkerUnavailable as e:
+            print(f"⚠️  EC2 worker 不可用，改用逐条 SSH 执行: {e}")
+            _worker_disabled = True
+
+    if raw is None:
+        raw = []
+        for cmd, cmd_env in zip(cmds, envs):
+            started = time.time()
+            try:
+                result = _run_on_ec2_direct(cmd, cmd_env, timeout)
+                raw.append({"stdout": result.stdout, "stderr": result.stderr, "returncode": result.returncode,
+                            "elapsed": time.time() - started})
+            except SSHError as e:
+                raw.append({"stdout": "", "stderr": str(e), "returncode": -1,
+                            "elapsed": time.time() - started, "error": str(e)})
+
+    results = []
+    for cmd, r in zip(cmds, raw):
+        error = r.get("error")
+        if r.get("timeout"):
+            error = f"SSH 命令执行超时 ({timeout}秒)"
+        results.append({
+            "cmd": cmd,
+            "stdout": r.get("stdout", ""),
+            "stderr": r.get("stderr", ""),
+            "output": r.get("stdout", "") + r.get("stderr", ""),
+            "returncode": r.get("returncode", -1),
+            "elapsed": r.get("elapsed", 0.0),
+            "error": error,
+        })
+    return results
+
+
+def _invalidate_snapshots(cmds: list):
+    """写操作 (划转/提现/下单等) 执行后作废对应账户的快照缓存"""
+    from snapshot_cache import invalidate_for_command
+    for cmd in cmds:
+        invalidate_for_command(cmd)
+
+
+def _run_on_ec2_direct(cmd: str, env: dict = None, timeout: int = 120) -> subprocess.CompletedProcess:
+    """为单条命令启动一个 ssh 进程执行 (worker 不可用时的回退路径)
+
+    返回 CompletedProcess (stdout / stderr / returncode 分开，与 worker 的结果含义一致)，
+    超时或连接失败时抛出 SSHError
+    """
+    if not is_windows():
+        ensure_ssh_connection()
+    ssh_cmd_parts = build_ssh_command()
+
     # 执行远程命令
     cmd_parts = cmd.split()
     remote_cmd_parts = ["./run.sh"] + cmd_parts
+    if env:
+        remote_cmd_parts = ["env"] + [f"{k}={shlex.quote(str(v))}" for k, v in env.items()] + remote_cmd_parts
     remote_cmd = "bash -c " + shlex.quote(" ".join(remote_cmd_parts))
     ssh_cmd_parts.append(remote_cmd)
 
     try:
-        result = subprocess.run(ssh_cmd_parts, capture_output=True, text=True, timeout=120)
+        result = subprocess.run(ssh_cmd_parts, capture_output=True, text=True, timeout=timeout)
         if result.returncode != 0 and "Permission denied" in result.stderr:
             raise SSHError(f"SSH 连接被拒绝，请检查密钥配置")
-        return result.stdout + result.stderr
+        return result
     except subprocess.TimeoutExpired:
-        raise SSHError("SSH 命令执行超时 (120秒)")
+        raise SSHError(f"SSH 命令执行超时 ({timeout}秒)")
     except FileNotFoundError:
         raise SSHError("找不到 ssh 命令，请确保已安装 OpenSSH")
 
 
+# ===================== 并发查询 =====================
+
+# 并发查询默认参数: 最大并发数 / 单个交易所超时 (秒)
+PARALLEL_MAX_WORKERS = 6
+PARALLEL_TASK_TIMEOUT = 60
+
+
+def run_parallel(tasks: list, max_workers: int = PARALLEL_MAX_WORKERS,
+                 timeout: float = PARALLEL_TASK_TIMEOUT, on_result=None) -> list:
+    """有界线程池并发执行多个查询任务，结果按完成顺序流式回调
+
+    Args:
+        tasks: [(key, fn), ...]，fn 无参数
+        max_workers: 最大并发数
+        timeout: 单个任务从开始执行起的超时秒数，超时的任务记为失败，不再等待
+        on_result: 每个任务完成时回调 on_result(key, result, error)
+
+    Returns:
+        [(key, result, error), ...]，按完成顺序；error 为 None 表示成功
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    if not tasks:
+        return []
+
+    started = {}
+
+    def _wrap(key, fn):
+        started[key] = time.time()
+        return fn()
+
+    results = []
+
+    def _emit(key, result, error):
+        results.append((key, result, error))
+        if on_result:
+            on_result(key, result, error)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = {executor.submit(_wrap, key, fn): key for key, fn in tasks}
+        while pending:
+            done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    _emit(key, future.result(), None)
+                except Exception as e:
+                    _emit(key, None, str(e) or type(e).__name__)
+
+            now = time.time()
+            for future, key in list(pending.items()):
+                if key in started and now - started[key] > timeout:
+                    pending.pop(future)
+                    _emit(key, None, f"超时 ({timeout:.0f}秒)")
+    finally:
+        # 超时任务的线程无法中断，不等待其结束
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
 # ===================== 用户交互 =====================
 
 def select_option(prompt: str, options: list, allow_back: bool = False) -> int:
@@ -252,6 +635,42 @@ def select_option(prompt: str, options: list, allow_back: bool = False) -> int:
             print("请输入有效的数字")
 
 
+def select_multiple(prompt: str, options: list) -> list:
+    """多选，options 为 [(value, name), ...]，返回选中的项 (保持原顺序)，空列表表示返回
+
+    输入格式: a 全选，1,3,5 或 1-4 (可混合，空格/逗号分隔)，0 返回
+    """
+    print(f"\n{prompt}")
+    for i, (_, name) in enumerate(options, 1):
+        print(f"  {i}. {name}")
+    print(f"  a. 全部")
+    print(f"  0. <- 返回")
+
+    while True:
+        choice = input("\n请输入编号 (如 1,3,5 或 1-4): ").strip().lower()
+        if not choice or choice == "0":
+            return []
+        if choice == "a":
+            return list(options)
+        selected = set()
+        try:
+            for part in choice.replace("，", ",").replace(" ", ",").split(","):
+                if not part:
+                    continue
+                if "-" in part:
+                    start, end = (int(x) for x in part.split("-", 1))
+                    selected.update(range(start, end + 1))
+                else:
+                    selected.add(int(part))
+        except ValueError:
+            print("请输入有效的编号")
+            continue
+        if not selected or min(selected) < 1 or max(selected) > len(options):
+            print(f"编号须在 1-{len(options)} 之间")
+            continue
+        return [opt for i, opt in enumerate(options, 1) if i in selected]
+
+
 def input_amount(prompt: str = "请输入数量: "):
     """输入数量的通用函数，输入 0 或空返回 None 表示取消"""
     while True:
@@ -288,7 +707,9 @@ def select_account(user_id: str, allow_back: bool = True, show_combined: bool =
     返回值:
         account_id: 正常选择的账号ID
         None: 返回上一级
+        "__multi_balance__": 选择了多交易所余额选项
         "__combined__": 选择了综合收益选项
+        "__cancel_all__": 选择了一键撤销全部挂单选项
     """
     accounts = get_user_accounts(user_id)
     if not accounts:
@@ -305,6 +726,7 @@ def select_account(user_id: str, allow_back: bool = True, show_combined: bool =
     if show_combined:
         account_names.append("== 多交易所余额 ==")
         account_names.append("== 综合收益 ==")
+        account_names.append("== 一键撤销全部挂单 ==")
 
     idx = select_option("请选择交易所:", account_names, allow_back=allow_back)
     if idx == -1:
@@ -315,6 +737,8 @@ def select_account(user_id: str, allow_back: bool = True, show_combined: bool =
         return "__multi_balance__"
     if show_combined and idx == len(accounts) + 1:
         return "__combined__"
+    if show_combined and idx == len(accounts) + 2:
+        return "__cancel_all__"
 
     return accounts[idx][0]
 
@@ -336,46 +760,50 @@ def select_user_and_account(allow_back: bool = True):
 # ===================== 工具函数 =====================
 
 def get_exchange_base(exchange: str) -> str:
-    """获取交易所基础类型 (dennis_binance -> binance)"""
-    if exchange.startswith("binance") or "_binance" in exchange:
-        return "binance"
-    if exchange.startswith("gate") or "_gate" in exchange:
-        return "gate"
-    if exchange.startswith("bitget") or "_bitget" in exchange:
-        return "bitget"
-    if exchange.startswith("hyperliquid") or "_hyperliquid" in exchange:
-        return "hyperliquid"
-    if exchange.startswith("lighter") or "_lighter" in exchange:
-        return "lighter"
-    if exchange.startswith("aster") or "_aster" in exchange:
-        return "aster"
-    if exchange.startswith("bybit") or "_bybit" in exchange:
-        return "bybit"
-    if exchange.startswith("okx") or "_okx" in exchange:
-        return "okx"
+    """获取交易所基础类型 (dennis_binance -> binance)，优先查账户路由表"""
+    record = _get_config_snapshot().accounts.get(exchange)
+    if record is not None:
+        return record.venue
+    return _infer_venue(exchange)
+
+
+@functools.lru_cache(maxsize=256)
+def _infer_venue(exchange: str) -> str:
+    """从 key 字符串推断交易所基础类型 (未在路由表中的 key，如旧格式)"""
+    for venue in ("binance", "gate", "bitget", "hyperliquid", "lighter", "aster", "bybit", "okx"):
+        if exchange.startswith(venue) or f"_{venue}" in exchange:
+            return venue
     return exchange
 
 
+def get_account(ec2_key: str):
+    """按 EC2 key 查询账户记录 AccountRecord，不存在返回 None"""
+    return _get_config_snapshot().accounts.get(ec2_key)
+
+
+def get_account_record(user_id: str, account_id: str):
+    """按用户和账号 ID 查询账户记录 AccountRecord，不存在返回 None"""
+    return _get_config_snapshot().account_ids.get((user_id, account_id))
+
+
 def get_binance_api_keys(exchange: str):
     """从配置中获取 Binance API 密钥，返回 (api_key, api_secret) 或 (None, None)"""
-    config = load_config()
-    legacy = config.get("_legacy", {})
-    user_id = legacy.get(exchange)
+    snapshot = _get_config_snapshot()
+    user_id = snapshot.legacy.get(exchange)
     if not user_id:
         user_id = exchange.split("_", 1)[0] if "_" in exchange else exchange
-    user_cfg = config.get("users", {}).get(user_id, {})
+    user_cfg = snapshot.config.get("users", {}).get(user_id, {})
     binance_cfg = user_cfg.get("accounts", {}).get("binance", {})
     return binance_cfg.get("api_key"), binance_cfg.get("api_secret")
 
 
 def get_bybit_api_keys(exchange: str):
     """从配置中获取 Bybit API 密钥，返回 (api_key, api_secret) 或 (None, None)"""
-    config = load_config()
-    legacy = config.get("_legacy", {})
-    user_id = legacy.get(exchange)
+    snapshot = _get_config_snapshot()
+    user_id = snapshot.legacy.get(exchange)
     if not user_id:
         user_id = exchange.split("_", 1)[0] if "_" in exchange else exchange
-    user_cfg = config.get("users", {}).get(user_id, {})
+    user_cfg = snapshot.config.get("users", {}).get(user_id, {})
     bybit_cfg = user_cfg.get("accounts", {}).get("bybit", {})
     return bybit_cfg.get("api_key"), bybit_cfg.get("api_secret")
 
@@ -385,10 +813,36 @@ def run_bybit_api_script(exchange: str, script: str, extra_args: list = None, ti
 
     脚本中可通过 sys.argv[1], sys.argv[2] 获取 api_key, api_secret。
     extra_args 中的参数从 sys.argv[3] 开始。
+    优先在常驻 worker 中执行: 脚本按内容哈希只上传一次，参数随 JSON 帧传递。
     """
     api_key, api_secret = get_bybit_api_keys(exchange)
     if not api_key or not api_secret:
         raise SSHError("Bybit API 凭证未配置")
+    return _run_api_script(api_key, api_secret, script, extra_args, timeout)
+
+
+def run_binance_api_script(exchange: str, script: str, extra_args: list = None, timeout: int = 60) -> str:
+    """通过 SSH 在 EC2 上执行 Binance API 脚本，返回 stdout (参数约定同 run_bybit_api_script)"""
+    api_key, api_secret = get_binance_api_keys(exchange)
+    if not api_key or not api_secret:
+        raise SSHError("Binance API 凭证未配置")
+    return _run_api_script(api_key, api_secret, script, extra_args, timeout)
+
+
+def _run_api_script(api_key: str, api_secret: str, script: str, extra_args: list = None, timeout: int = 60) -> str:
+    global _worker_disabled
+    argv = [api_key, api_secret] + [str(a) for a in (extra_args or [])]
+    if _use_worker():
+        # worker 按哈希缓存脚本，重复调用只发送哈希和参数
+        from ec2_worker import get_worker, WorkerUnavailable
+        try:
+            result = get_worker().run_script(script, argv, timeout=timeout)
+            if result["returncode"] != 0:
+                raise SSHError((result["stderr"] or "脚本执行失败").strip()[:200])
+            return result["stdout"].strip()
+        except WorkerUnavailable as e:
+            print(f"⚠️  EC2 worker 不可用，改用逐条 SSH 执行: {e}")
+            _worker_disabled = True
 
     ssh_host, ssh_user, ssh_hostname, ssh_port, ssh_key = get_ssh_config()
     if ssh_hostname:
@@ -407,10 +861,7 @@ def run_bybit_api_script(exchange: str, script: str, extra_args: list = None, ti
         ssh_cmd.extend(["-p", str(ssh_port)])
     ssh_cmd.append(target)
 
-    cmd_args = ["python3", "-", api_key, api_secret]
-    if extra_args:
-        cmd_args.extend([str(a) for a in extra_args])
-    ssh_cmd.extend(cmd_args)
+    ssh_cmd.extend(["python3", "-"] + argv)
 
     result = subprocess.run(ssh_cmd, input=script, capture_output=True, text=True, timeout=timeout)
     if result.returncode != 0:
@@ -460,30 +911,20 @@ def detect_address_type(address: str) -> str:
 
 # ===================== 兼容旧接口 (保留给其他模块使用) =====================
 
-def _build_exchanges_list():
-    """从配置文件动态构建交易所列表"""
-    config = load_config()
-    exchanges = []
-    for user_id, user_data in config.get("users", {}).items():
-        user_name = user_data.get("name", user_id)
-        for account_id, acc in user_data.get("accounts", {}).items():
-            exchange_type = acc.get("exchange", account_id)
-            ec2_key = f"{user_id}_{exchange_type}"
-            display = f"{exchange_type.upper()} - {user_name}"
-            exchanges.append((ec2_key, display))
-    return exchanges
-
-EXCHANGES = _build_exchanges_list()
+def get_exchanges() -> list:
+    """所有已配置账号的交易所列表 [(ec2_key, display), ...] (随配置文件变化自动更新)"""
+    return [(key, record.display) for key, record in _get_config_snapshot().accounts.items()]
 
 
 def select_exchange(allow_back: bool = True, binance_only: bool = False, bybit_only: bool = False):
     """选择交易所 (旧接口，兼容用)"""
+    accounts = _get_config_snapshot().accounts.values()
     if binance_only:
-        options = [(k, n) for k, n in EXCHANGES if "_binance" in k]
+        options = [(r.ec2_key, r.display) for r in accounts if r.venue == "binance"]
     elif bybit_only:
-        options = [(k, n) for k, n in EXCHANGES if "_bybit" in k]
+        options = [(r.ec2_key, r.display) for r in accounts if r.venue == "bybit"]
     else:
-        options = EXCHANGES
+        options = [(r.ec2_key, r.display) for r in accounts]
 
     if len(options) == 1:
         return options[0][0]
@@ -6,6 +6,17 @@ from decimal import Decimal, ROUND_DOWN, InvalidOperation
 from utils import run_on_ec2, select_option, select_exchange, get_exchange_base, get_exchange_display_name, input_amount, get_networks_for_type, get_networks_for_coin, detect_address_type, SSHError
 from addresses import load_addresses, load_user_addresses
 from balance import get_coin_balance
+from ec2_schema import SchemaError, WalletSnapshot, fetch_wallet_snapshot
+import snapshot_cache
+
+# 提现前显示余额的账户: 交易所 -> [(账户类型, 显示名称)]
+WITHDRAW_BALANCE_ACCOUNTS = {
+    "bybit": [("FUND", "资金账户"), ("UNIFIED", "统一账户")],
+    "binance": [("SPOT", "现货账户"), ("PM", "统一账户")],
+    "gate": [("SPOT", "现货账户")],
+    "bitget": [("SPOT", "现货账户")],
+    "okx": [("TRADING", "交易账户"), ("FUNDING", "资金账户")],
+}
 
 
 class WithdrawError(Exception):
@@ -154,32 +165,20 @@ def do_withdraw(exchange: str = None, user_id: str = None):
         except:
             return bal
 
-    if exchange_base == "bybit":
-        # Bybit: 查询 FUND 和 UNIFIED 账户
-        fund_bal = get_coin_balance(exchange, coin, "FUND")
-        unified_bal = get_coin_balance(exchange, coin, "UNIFIED")
-        print(f"💰 {coin} 资金账户: {fmt_bal(fund_bal)}")
-        print(f"💰 {coin} 统一账户: {fmt_bal(unified_bal)}")
-    elif exchange_base == "binance":
-        # Binance: 查询 SPOT 和 PM (Portfolio Margin) 账户
-        spot_bal = get_coin_balance(exchange, coin, "SPOT")
-        pm_bal = get_coin_balance(exchange, coin, "PM")
-        print(f"💰 {coin} 现货账户: {fmt_bal(spot_bal)}")
-        print(f"💰 {coin} 统一账户: {fmt_bal(pm_bal)}")
-    elif exchange_base == "gate":
-        # Gate.io: 查询 SPOT 现货账户
-        spot_bal = get_coin_balance(exchange, coin, "SPOT")
-        print(f"💰 {coin} 现货账户: {fmt_bal(spot_bal)}")
-    elif exchange_base == "bitget":
-        # Bitget: 查询现货账户
-        spot_bal = get_coin_balance(exchange, coin, "SPOT")
-        print(f"💰 {coin} 现货账户: {fmt_bal(spot_bal)}")
-    elif exchange_base == "okx":
-        # OKX: 查询交易账户和资金账户
-        trading_bal = get_coin_balance(exchange, coin, "TRADING")
-        funding_bal = get_coin_balance(exchange, coin, "FUNDING")
-        print(f"💰 {coin} 交易账户: {fmt_bal(trading_bal)}")
-        print(f"💰 {coin} 资金账户: {fmt_bal(funding_bal)}")
+    # 各账户余额取自同一份快照，一次往返 (选中账户时已预取的快照直接使用)
+    try:
+        snapshot = snapshot_cache.get(exchange, "wallet_snapshot",
+                                      lambda: fetch_wallet_snapshot(exchange, coins=[coin])).value
+        if not snapshot.covers(coin):
+            snapshot = fetch_wallet_snapshot(exchange, coins=[coin])
+    except (SSHError, SchemaError) as e:
+        print(f"❌ 查询余额失败: {e}")
+        snapshot = WalletSnapshot(exchange, [])
+    for error in snapshot.errors:
+        print(f"⚠️  查询余额失败: {error}")
+
+    for account_type, label in WITHDRAW_BALANCE_ACCOUNTS.get(exchange_base, ()):
+        print(f"💰 {coin} {label}: {fmt_bal(snapshot.get(coin, account_type))}")
 
     # 处理地址和网络
     # 特殊地址强制使用固定网络
@@ -301,13 +300,17 @@ def do_withdraw(exchange: str = None, user_id: str = None):
         return
 
     try:
+        # 输入期间余额可能变化，划转前重新取一份快照
+        if exchange_base in ("bybit", "binance", "okx"):
+            snapshot = fetch_wallet_snapshot(exchange, coins=[coin])
+
         if exchange_base == "bybit":
-            # Bybit: 查询资金账户余额
-            fund_balance = float(get_coin_balance(exchange, coin, "FUND") or 0)
+            # Bybit: 资金账户余额
+            fund_balance = snapshot.get(coin, "FUND")
 
             # 如果资金账户余额不足，从统一账户划转
             if fund_balance < required_amount:
-                unified_balance = float(get_coin_balance(exchange, coin, "UNIFIED") or 0)
+                unified_balance = snapshot.get(coin, "UNIFIED")
 
                 if unified_balance > 0:
                     transfer_amount = required_amount - fund_balance
@@ -327,12 +330,12 @@ def do_withdraw(exchange: str = None, user_id: str = None):
                         time.sleep(1)
 
         elif exchange_base == "binance":
-            # Binance: 查询现货账户余额
-            spot_balance = float(get_coin_balance(exchange, coin, "SPOT") or 0)
+            # Binance: 现货账户余额
+            spot_balance = snapshot.get(coin, "SPOT")
 
             # 如果现货账户余额不足，从统一账户(Portfolio Margin)划转
             if spot_balance < required_amount:
-                pm_balance = float(get_coin_balance(exchange, coin, "PM") or 0)
+                pm_balance = snapshot.get(coin, "PM")
 
                 if pm_balance > 0:
                     transfer_amount = required_amount - spot_balance
@@ -349,12 +352,12 @@ def do_withdraw(exchange: str = None, user_id: str = None):
                     time.sleep(1)
 
         elif exchange_base == "okx":
-            # OKX: 查询资金账户余额，提现从资金账户出发
-            funding_balance = float(get_coin_balance(exchange, coin, "FUNDING") or 0)
+            # OKX: 资金账户余额，提现从资金账户出发
+            funding_balance = snapshot.get(coin, "FUNDING")
 
             # 如果资金账户余额不足，从交易账户划转
             if funding_balance < required_amount:
-                trading_balance = float(get_coin_balance(exchange, coin, "TRADING") or 0)
+                trading_balance = snapshot.get(coin, "TRADING")
 
                 if trading_balance > 0:
                     transfer_amount = required_amount - funding_balance
@@ -373,7 +376,7 @@ def do_withdraw(exchange: str = None, user_id: str = None):
                             print("⚠️  自动划转失败，将继续按当前资金账户余额尝试提现")
                         time.sleep(1)
 
-    except SSHError as e:
+    except (SSHError, SchemaError) as e:
         print(f"❌ 自动划转失败: {e}")
         print("   请手动划转后重试")
         return